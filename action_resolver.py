@@ -0,0 +1,515 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import dice
+import metrics
+
+ABILITIES = ("strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma")
+
+ABILITY_NAMES = {
+    **{ability: ability for ability in ABILITIES},
+    **{ability[:3]: ability for ability in ABILITIES},
+}
+
+SKILLS = {
+    "acrobatics": "dexterity",
+    "animal handling": "wisdom",
+    "arcana": "intelligence",
+    "athletics": "strength",
+    "deception": "charisma",
+    "history": "intelligence",
+    "insight": "wisdom",
+    "intimidation": "charisma",
+    "investigation": "intelligence",
+    "medicine": "wisdom",
+    "nature": "intelligence",
+    "perception": "wisdom",
+    "performance": "charisma",
+    "persuasion": "charisma",
+    "religion": "intelligence",
+    "sleight of hand": "dexterity",
+    "stealth": "dexterity",
+    "survival": "wisdom",
+}
+
+SAVING_THROWS = {
+    "barbarian": ("strength", "constitution"),
+    "bard": ("dexterity", "charisma"),
+    "cleric": ("wisdom", "charisma"),
+    "druid": ("intelligence", "wisdom"),
+    "fighter": ("strength", "constitution"),
+    "monk": ("strength", "dexterity"),
+    "paladin": ("wisdom", "charisma"),
+    "ranger": ("strength", "dexterity"),
+    "rogue": ("dexterity", "intelligence"),
+    "sorcerer": ("constitution", "charisma"),
+    "warlock": ("wisdom", "charisma"),
+    "wizard": ("intelligence", "wisdom"),
+}
+
+SPELLCASTING_ABILITY = {
+    "bard": "charisma",
+    "cleric": "wisdom",
+    "druid": "wisdom",
+    "paladin": "charisma",
+    "ranger": "wisdom",
+    "sorcerer": "charisma",
+    "warlock": "charisma",
+    "wizard": "intelligence",
+}
+
+SUGGESTIONS = {
+    "roll": ["Describe what the roll is for", "Roll again", "Ask the DM what happens next"],
+    "check": ["Act on what you found out", "Try a different approach", "Ask the DM what you notice"],
+    "save": ["Shake off the effect and press on", "Look for the source of the danger", "Check on your companions"],
+    "initiative": ["Attack the nearest enemy", "Cast a spell", "Take cover and assess the battlefield"],
+    "attack": ["Attack again", "Take a defensive stance", "Reposition for an advantage"],
+    "spell": ["Follow up with an attack", "Cast another spell", "Check how the enemies react"],
+}
+
+# Spell targets that always mean the caster
+SELF_TARGETS = frozenset(("me", "myself", "self"))
+
+# Only short messages that are just a mechanical action are resolved locally;
+# anything with more to it needs the model's narration
+MAX_WORDS = 14
+
+_LEADING = re.compile(r"^(?:ok(?:ay)?,? |so,? |now,? )?(?:i(?:'ll| will| want to| try to)? |let me |can i )?")
+_ARTICLES = re.compile(r"^(?:the|a|an|my|that|this) ")
+_ADVANTAGE = r"(?: (?:with|at) (?P<adv>advantage|disadvantage))?"
+
+_PATTERNS: List[Tuple[str, "re.Pattern"]] = [
+    ("roll", re.compile(r"^roll (?:an? )?(?P<notation>\d*d\d+(?: ?[+-] ?\d+)?)" + _ADVANTAGE + "$")),
+    ("initiative", re.compile(r"^roll (?:for )?initiative" + _ADVANTAGE + "$")),
+    # Explicit phrasing only: "roll (for) perception", "make a history check",
+    # "stealth check"; a bare "history" or "I make history" is left to the model
+    ("check", re.compile(
+        r"^(?:(?P<verb>roll|make|do|attempt|try)(?: (?:a|an|my))?(?: for)? )?(?P<what>[a-z ]+?)"
+        r"(?: (?P<kind>check|roll|save|saving throw))?" + _ADVANTAGE + "$")),
+    ("attack", re.compile(
+        r"^(?:attack|hit|strike|stab|slash|shoot|smite)(?: at)? (?P<target>[a-z' -]+?)"
+        r"(?: with (?P<weapon>[a-z' -]+?))?" + _ADVANTAGE + "$")),
+    ("attack", re.compile(
+        r"^(?:swing|fire|throw|use) (?P<weapon>[a-z' -]+?) (?:at|on) (?P<target>[a-z' -]+?)" + _ADVANTAGE + "$")),
+    ("spell", re.compile(
+        r"^cast (?P<spell>[a-z' /-]+?)(?: (?:at|on) (?P<target>[a-z' -]+?))?" + _ADVANTAGE + "$")),
+]
+
+
+def _strip_article(name: Optional[str]) -> Optional[str]:
+    return _ARTICLES.sub("", name.strip()) if name else name
+
+
+def classify(message: str) -> Optional[Dict[str, Any]]:
+    """Recognize a purely mechanical player action.
+
+    Returns {"intent": "roll" | "initiative" | "check" | "attack" | "spell", ...}
+    with the parsed details, or None when the message needs the model.
+    """
+    text = re.sub(r"\s+", " ", message.lower()).strip().rstrip(".!")
+    if not text or len(text.split()) > MAX_WORDS:
+        return None
+    text = _LEADING.sub("", text)
+
+    for intent, pattern in _PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        fields = {key: value for key, value in match.groupdict().items() if value}
+        if intent == "check":
+            what = _strip_article(fields["what"])
+            kind = fields.get("kind", "")
+            if not kind and fields.get("verb") != "roll":
+                continue
+            if "save" in kind and what in ABILITY_NAMES:
+                return {"intent": "save", "ability": ABILITY_NAMES[what], "advantage": fields.get("adv")}
+            if what in SKILLS:
+                return {"intent": "check", "skill": what, "ability": SKILLS[what], "advantage": fields.get("adv")}
+            if what in ABILITY_NAMES and kind in ("check", "roll"):
+                return {"intent": "check", "skill": None, "ability": ABILITY_NAMES[what], "advantage": fields.get("adv")}
+            continue
+        if intent == "attack" and fields.get("weapon") in ("advantage", "disadvantage"):
+            fields["adv"] = fields.pop("weapon")
+        return {
+            "intent": intent,
+            **{key: _strip_article(value) for key, value in fields.items() if key not in ("adv", "verb")},
+            "advantage": fields.get("adv"),
+        }
+    return None
+
+
+def ability_modifier(character: Optional[Dict[str, Any]], ability: str) -> int:
+    try:
+        score = int((character or {}).get(ability, 10))
+    except (TypeError, ValueError):
+        score = 10
+    return (score - 10) // 2
+
+
+def proficiency_bonus(character: Optional[Dict[str, Any]]) -> int:
+    character = character or {}
+    try:
+        if character.get("proficiencyBonus") is not None:
+            return int(character["proficiencyBonus"])
+        return 2 + (max(int(character.get("level", 1)), 1) - 1) // 4
+    except (TypeError, ValueError):
+        return 2
+
+
+def _d20(modifier: int, advantage: Optional[str] = None) -> str:
+    base = {"advantage": "2d20kh1", "disadvantage": "2d20kl1"}.get(advantage or "", "1d20")
+    return f"{base}{modifier:+d}" if modifier else base
+
+
+def _roll(label: str, notation: str) -> Dict[str, Any]:
+    result = dice.roll(notation)
+    return {
+        "label": label,
+        "notation": notation,
+        "total": result["total"],
+        "dice": [value for term in result["terms"] for value in term["rolls"]],
+        "natural": result["terms"][0]["kept"][0] if result["terms"] and result["terms"][0]["kept"] else None,
+    }
+
+
+def _format_roll(roll: Dict[str, Any]) -> str:
+    return f"**{roll['total']}** ({roll['notation']}: {', '.join(str(value) for value in roll['dice'])})"
+
+
+def _words(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _first_sentence(desc: Any) -> str:
+    text = " ".join(desc) if isinstance(desc, list) else str(desc or "")
+    match = re.match(r"(.+?[.!?])(?:\s|$)", text)
+    return match.group(1) if match else text
+
+
+def _ordinal(n: int) -> str:
+    return f"{n}{'th' if 10 <= n % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(n % 10, 'th')}"
+
+
+def _armor_class(monster: Dict[str, Any]) -> Optional[int]:
+    armor = monster.get("armor_class")
+    if isinstance(armor, list):
+        armor = armor[0].get("value") if armor else None
+    return armor if isinstance(armor, int) else None
+
+
+def _crit_dice(notation: str) -> str:
+    """Double the dice of a damage expression for a critical hit."""
+    return re.sub(r"(\d*)d(\d+)", lambda m: f"{2 * int(m.group(1) or 1)}d{m.group(2)}", notation)
+
+
+class ActionResolver:
+    """Resolves mechanical player actions with the dice engine and SRD data.
+
+    Checks, saves, initiative, weapon attacks and spells named in short
+    messages ("I roll for perception", "attack the goblin with my longsword",
+    "cast shield") are settled locally from the character sheet, so the turn
+    costs no Gemini call. Attacks and targeted spells are only resolved
+    against a known SRD monster or a combatant in the session's initiative
+    order, so "I hit on the barmaid" or "I shoot the breeze" still get
+    narrated. Anything it can't fully resolve (an unknown weapon, spell or
+    target, extra narrative in the message) is left to the model.
+    """
+
+    def __init__(self, dnd_api):
+        self.dnd_api = dnd_api
+        # Category -> (list response, lowercase name -> index), rebuilt when the list changes
+        self._names: Dict[str, Tuple[Any, Dict[str, str]]] = {}
+        self.stats: Dict[str, Any] = {"local": 0, "llm": 0, "by_intent": {}}
+
+    async def resolve(
+        self,
+        message: str,
+        character: Optional[Dict[str, Any]] = None,
+        game_session: Optional[Dict[str, Any]] = None,
+        record: bool = True
+    ) -> Optional[Dict[str, Any]]:
+        """A complete DM reply for a mechanical action, or None if the model is needed.
+
+        With record=False the turn is not counted in the local/llm statistics
+        (for actions that are narrated by the model anyway, as in party turns).
+        """
+        intent = classify(message)
+        result = None
+        if intent is not None:
+            try:
+                with metrics.STAGE_SECONDS.time(stage="fast_path"):
+                    result = await self._resolve_intent(intent, character, game_session)
+            except Exception as e:
+                print(f"[WARNING] Could not resolve {intent['intent']} locally: {str(e)}")
+        if record:
+            self._record("local" if result else "llm", intent["intent"] if intent else "none")
+        return result
+
+    def _record(self, path: str, intent: str) -> None:
+        self.stats[path] += 1
+        by_intent = self.stats["by_intent"].setdefault(intent, {"local": 0, "llm": 0})
+        by_intent[path] += 1
+        metrics.CHAT_TURNS.inc(path=path, intent=intent)
+        metrics.CHAT_LOCAL_FRACTION.set(self.stats["local"] / (self.stats["local"] + self.stats["llm"]))
+
+    def get_stats(self) -> Dict[str, Any]:
+        turns = self.stats["local"] + self.stats["llm"]
+        return {
+            **self.stats,
+            "turns": turns,
+            "local_fraction": round(self.stats["local"] / turns, 4) if turns else None,
+        }
+
+    async def _resolve_intent(
+        self,
+        intent: Dict[str, Any],
+        character: Optional[Dict[str, Any]],
+        game_session: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        kind = intent["intent"]
+        if kind == "roll":
+            notation = intent["notation"].replace(" ", "")
+            if intent["advantage"]:
+                notation += f" {intent['advantage']}"
+            roll = _roll("Roll", notation)
+            return self._reply(kind, f"🎲 You roll {_format_roll(roll)}.", [roll])
+
+        if kind in ("check", "save", "initiative"):
+            return self._resolve_check(intent, character)
+        if kind == "attack":
+            return await self._resolve_attack(intent, character, game_session)
+        if kind == "spell":
+            return await self._resolve_spell(intent, character, game_session)
+        return None
+
+    def _reply(self, kind: str, message: str, rolls: List[Dict[str, Any]], **details) -> Dict[str, Any]:
+        return {
+            "message": message,
+            "suggestions": SUGGESTIONS[kind],
+            "resolution": {"intent": kind, "rolls": rolls, **details},
+            "usage": {"fast_path": kind, "llm_calls": 0},
+        }
+
+    def _resolve_check(self, intent: Dict[str, Any], character: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        kind = intent["intent"]
+        if kind == "initiative":
+            ability, proficient, label = "dexterity", False, "Initiative"
+        elif kind == "save":
+            ability = intent["ability"]
+            class_name = str((character or {}).get("class", "")).lower()
+            proficient = ability in SAVING_THROWS.get(class_name, ())
+            label = f"{ability.title()} saving throw"
+        else:
+            ability = intent["ability"]
+            skill = intent.get("skill")
+            known = [str(name).lower() for name in (character or {}).get("skills") or []]
+            proficient = bool(skill) and skill in known
+            label = f"{skill.title()} check" if skill else f"{ability.title()} check"
+
+        modifier = ability_modifier(character, ability) + (proficiency_bonus(character) if proficient else 0)
+        roll = _roll(label, _d20(modifier, intent.get("advantage")))
+        message = f"🎲 {label}: {_format_roll(roll)}."
+        if roll["natural"] == 20:
+            message += " A natural 20!"
+        elif roll["natural"] == 1:
+            message += " A natural 1..."
+        return self._reply(kind, message, [roll], ability=ability, proficient=proficient)
+
+    async def _resolve_attack(self, intent: Dict[str, Any], character: Optional[Dict[str, Any]], game_session: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        found, target = await self._target(intent.get("target"), game_session)
+        if not found:
+            return None  # Not something to roll against: "hit the door", "strike up a conversation"
+
+        weapon = None
+        if intent.get("weapon"):
+            weapon = await self._lookup("equipment", intent["weapon"])
+        elif character:
+            weapon = await self._carried_weapon(character)
+        if not weapon or not (weapon.get("damage") or {}).get("damage_dice"):
+            return None  # Unknown or improvised weapon: let the model rule on it
+
+        properties = {prop.get("index") for prop in weapon.get("properties") or []}
+        strength = ability_modifier(character, "strength")
+        dexterity = ability_modifier(character, "dexterity")
+        if weapon.get("weapon_range") == "Ranged":
+            modifier = dexterity
+        elif "finesse" in properties:
+            modifier = max(strength, dexterity)
+        else:
+            modifier = strength
+
+        armor_class = _armor_class(target) if target else None
+        attack = _roll(f"{weapon['name']} attack", _d20(modifier + proficiency_bonus(character), intent.get("advantage")))
+        critical = attack["natural"] == 20
+        hit = None if armor_class is None else (critical or (attack["natural"] != 1 and attack["total"] >= armor_class))
+
+        target_name = target["name"] if target else intent.get("target")
+        message = f"⚔️ {weapon['name']} attack" + (f" against the {target_name}" if target_name else "") + f": {_format_roll(attack)}"
+        if armor_class is not None:
+            message += f" vs AC {armor_class}, " + ("a **critical hit**!" if critical else "a **hit**!" if hit else "a **miss**.")
+        else:
+            message += " to hit." + (" A natural 20, a critical hit!" if critical else "")
+        rolls = [attack]
+
+        if hit is not False:
+            damage_dice = weapon["damage"]["damage_dice"]
+            if critical:
+                damage_dice = _crit_dice(damage_dice)
+            damage_type = (weapon["damage"].get("damage_type") or {}).get("name", "").lower()
+            damage = _roll("Damage", f"{damage_dice}{modifier:+d}" if modifier else damage_dice)
+            damage["total"] = max(damage["total"], 0)
+            rolls.append(damage)
+            message += f" Damage: {_format_roll(damage)}" + (f" {damage_type}" if damage_type else "") + (" if it hits." if hit is None else ".")
+
+        return self._reply("attack", message, rolls, weapon=weapon.get("index"), target=target.get("index") if target else None, armor_class=armor_class, hit=hit, critical=critical)
+
+    async def _resolve_spell(self, intent: Dict[str, Any], character: Optional[Dict[str, Any]], game_session: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        target = None
+        if intent.get("target"):
+            found, target = await self._target(intent["target"], game_session, allies=True)
+            if not found:
+                return None  # "cast charm person on the barmaid" is a scene for the model
+
+        spell = await self._lookup("spells", intent["spell"])
+        if not spell:
+            return None
+        class_name = str((character or {}).get("class", "")).lower()
+        spell_classes = {str(c.get("index", "")).lower() for c in spell.get("classes") or []}
+        if character and class_name and spell_classes and class_name not in spell_classes:
+            return None  # Not on the character's spell list; the model narrates what happens
+
+        level = spell.get("level", 0)
+        ability = SPELLCASTING_ABILITY.get(class_name)
+        modifier = ability_modifier(character, ability) if ability else 0
+        facts = [f"{(spell.get('school') or {}).get('name', '').lower()} cantrip" if level == 0 else f"{_ordinal(level)}-level {(spell.get('school') or {}).get('name', '').lower()}"]
+        if spell.get("casting_time"):
+            facts.append(spell["casting_time"])
+        message = f"✨ You cast **{spell['name']}** ({', '.join(fact.strip() for fact in facts)}). {_first_sentence(spell.get('desc'))}"
+        rolls: List[Dict[str, Any]] = []
+        details: Dict[str, Any] = {"spell": spell.get("index"), "level": level}
+
+        armor_class = _armor_class(target) if target else None
+        if spell.get("attack_type"):
+            attack = _roll("Spell attack", _d20(modifier + proficiency_bonus(character), intent.get("advantage")))
+            rolls.append(attack)
+            message += f" Spell attack: {_format_roll(attack)}"
+            if armor_class is not None:
+                details["hit"] = attack["natural"] == 20 or (attack["natural"] != 1 and attack["total"] >= armor_class)
+                message += f" vs AC {armor_class}, " + ("a **hit**!" if details["hit"] else "a **miss**.")
+            else:
+                message += " to hit."
+        dc = spell.get("dc")
+        if dc:
+            details["save_dc"] = 8 + proficiency_bonus(character) + modifier
+            save_ability = (dc.get("dc_type") or {}).get("name", "")
+            message += f" Targets make a DC {details['save_dc']} {save_ability} saving throw"
+            message += ", taking half damage on a success." if dc.get("dc_success") == "half" else "."
+
+        for label, amount in (("Damage", self._damage_notation(spell, character, modifier)), ("Healing", self._healing_notation(spell, modifier))):
+            if amount and details.get("hit") is not False:
+                try:
+                    roll = _roll(label, amount)
+                except ValueError:
+                    continue
+                rolls.append(roll)
+                damage_type = ((spell.get("damage") or {}).get("damage_type") or {}).get("name", "").lower() if label == "Damage" else ""
+                message += f" {label}: {_format_roll(roll)}" + (f" {damage_type}" if damage_type else "") + "."
+
+        return self._reply("spell", message, rolls, target=target.get("index") if target else None, **details)
+
+    def _damage_notation(self, spell: Dict[str, Any], character: Optional[Dict[str, Any]], modifier: int) -> Optional[str]:
+        damage = spell.get("damage") or {}
+        by_slot = damage.get("damage_at_slot_level")
+        if by_slot:
+            return self._expand(by_slot.get(str(spell.get("level"))) or next(iter(by_slot.values())), modifier)
+        by_level = damage.get("damage_at_character_level")
+        if by_level:
+            try:
+                level = int((character or {}).get("level", 1))
+            except (TypeError, ValueError):
+                level = 1
+            reached = [int(key) for key in by_level if int(key) <= level] or [min(int(key) for key in by_level)]
+            return self._expand(by_level[str(max(reached))], modifier)
+        return None
+
+    def _healing_notation(self, spell: Dict[str, Any], modifier: int) -> Optional[str]:
+        by_slot = spell.get("heal_at_slot_level")
+        if by_slot:
+            return self._expand(by_slot.get(str(spell.get("level"))) or next(iter(by_slot.values())), modifier)
+        return None
+
+    def _expand(self, amount: str, modifier: int) -> str:
+        """SRD amounts like "1d4 + MOD" with the spellcasting modifier filled in."""
+        amount = amount.replace(" ", "").replace("+MOD", f"{modifier:+d}").replace("MOD", str(modifier))
+        return amount.replace("+0", "") if amount.endswith("+0") else amount
+
+    async def _target(
+        self,
+        name: Optional[str],
+        game_session: Optional[Dict[str, Any]],
+        allies: bool = False
+    ) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Whether a named target is known, and its SRD monster details if it is a monster.
+
+        A target is known when it names an SRD monster or a non-player entry
+        in the session's initiative order; with allies=True (spells) the
+        caster and the session's players count as well.
+        """
+        if not name:
+            return False, None
+        wanted = _words(name)
+        if allies and wanted in SELF_TARGETS:
+            return True, None
+        monster = await self._lookup("monsters", name)
+        if monster is not None:
+            return True, monster
+
+        names = []
+        for entry in (game_session or {}).get("initiative") or []:
+            if isinstance(entry, dict) and entry.get("name") and (allies or not entry.get("isPlayer")):
+                names.append(str(entry["name"]))
+        if allies:
+            names.extend(str(player) for player in (game_session or {}).get("players") or [])
+        for combatant in map(_words, names):
+            if wanted in (combatant, combatant + "s") or (wanted.endswith("s") and wanted[:-1] == combatant):
+                return True, None
+        return False, None
+
+    async def _lookup(self, category: str, name: Optional[str]) -> Optional[Dict[str, Any]]:
+        """SRD details for an entry named in a message, or None if there is no such entry."""
+        if not name:
+            return None
+        names = await self._name_index(category)
+        name = _words(name)
+        index = names.get(name) or (names.get(name[:-1]) if name.endswith("s") else None)
+        if index is None:
+            return None
+        return await self.dnd_api._make_request(f"{category}/{index}")
+
+    async def _name_index(self, category: str) -> Dict[str, str]:
+        listing = await self.dnd_api._make_request(category)
+        cached = self._names.get(category)
+        if cached is None or cached[0] is not listing:
+            names = {}
+            for item in listing.get("results", []):
+                # Matched by name words ("crossbow light") or by index ("crossbow-light")
+                names[_words(item["name"])] = item["index"]
+                names.setdefault(item["index"].replace("-", " "), item["index"])
+            cached = self._names[category] = (listing, names)
+        return cached[1]
+
+    async def _carried_weapon(self, character: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The first SRD weapon named in the character's equipment, if any."""
+        equipment = character.get("equipment") or ""
+        if isinstance(equipment, list):
+            equipment = ", ".join(str(item.get("name", item)) if isinstance(item, dict) else str(item) for item in equipment)
+        text = f" {_words(equipment)} "
+        if not text.strip():
+            return None
+        names = await self._name_index("equipment")
+        for name, index in names.items():
+            if f" {name} " in text:
+                item = await self.dnd_api._make_request(f"equipment/{index}")
+                if (item.get("damage") or {}).get("damage_dice"):
+                    return item
+        return None
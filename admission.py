@@ -0,0 +1,326 @@
+import asyncio
+import contextvars
+import math
+import os
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+import metrics
+from shared_store import SharedStore, get_shared_store
+
+# Fair-share key (chat session ID or client address) of the request being
+# served. Set by the API endpoints; background tasks inherit it.
+current_session: contextvars.ContextVar[str] = contextvars.ContextVar("current_session", default="anonymous")
+
+# How soon to look again when another worker holds the shared quota's lock
+LOCK_RETRY_SECONDS = 0.05
+
+
+class RateLimitedError(Exception):
+    """Raised when a model call cannot be admitted soon enough; maps to HTTP 429."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """A token bucket refilled continuously at `rate_per_minute`.
+
+    The level may go negative when a single request is larger than the whole
+    bucket, so oversized requests are still admitted (once the bucket is full)
+    and simply delay the ones after them.
+    """
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = self.clock()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, now: Optional[float] = None, clamp: bool = True) -> float:
+        """Seconds until `amount` can be taken (0 if it can be taken now).
+
+        With clamp=False, `amount` is the total of several takes in a row, so
+        it is not capped at the bucket's capacity.
+        """
+        now = self.clock() if now is None else now
+        self._refill(now)
+        needed = (min(amount, self.capacity) if clamp else amount) - self.level
+        wait = needed / self.rate if needed > 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def take(self, amount: float) -> None:
+        self._refill(self.clock())
+        self.level -= amount
+
+    def block(self, seconds: float) -> None:
+        """Admit nothing for a while, e.g. after the upstream API returned 429."""
+        self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+
+class SharedTokenBucket(TokenBucket):
+    """A TokenBucket kept in the shared store, so all worker processes draw
+    from one quota. Uses wall-clock time, which every process agrees on.
+
+    Checking and taking are separate steps, so two workers may both take
+    the last tokens; the level then goes negative and later calls wait
+    longer, which keeps the average rate within the quota.
+
+    Taking waits at most `lock_timeout` seconds for another worker's write
+    lock, then raises sqlite3.OperationalError.
+    """
+
+    clock = staticmethod(time.time)
+
+    def __init__(self, store: SharedStore, name: str, rate_per_minute: float, capacity: float, lock_timeout: float):
+        super().__init__(rate_per_minute, capacity)
+        self.store = store
+        self.name = name
+        self.lock_timeout = lock_timeout
+
+    def _load(self, state: Optional[Dict[str, float]]) -> None:
+        if state is not None:
+            self.level, self.updated, self.blocked_until = state["level"], state["updated"], state["blocked_until"]
+
+    def _dump(self) -> Dict[str, float]:
+        return {"level": self.level, "updated": self.updated, "blocked_until": self.blocked_until}
+
+    def time_until(self, amount: float, now: Optional[float] = None, clamp: bool = True) -> float:
+        self._load(self.store.get("rate_limits", self.name))
+        return super().time_until(amount, now, clamp)
+
+    def take(self, amount: float) -> None:
+        def apply(state: Optional[Dict[str, float]]) -> Dict[str, float]:
+            self._load(state)
+            super(SharedTokenBucket, self).take(amount)
+            return self._dump()
+        self.store.update("rate_limits", self.name, apply, busy_timeout=self.lock_timeout)
+
+    def block(self, seconds: float) -> None:
+        def apply(state: Optional[Dict[str, float]]) -> Dict[str, float]:
+            self._load(state)
+            super(SharedTokenBucket, self).block(seconds)
+            return self._dump()
+        self.store.update("rate_limits", self.name, apply)
+
+
+class _Waiter:
+    __slots__ = ("tokens", "future", "queued_at")
+
+    def __init__(self, tokens: int, future: asyncio.Future):
+        self.tokens = tokens
+        self.future = future
+        self.queued_at = time.monotonic()
+
+
+class AdmissionController:
+    """Admits model calls under requests/min and tokens/min quotas.
+
+    Calls that fit both token buckets go straight through. Otherwise they wait
+    in a per-session FIFO, and sessions are served round-robin so one busy
+    table can't starve the others. A call is rejected immediately with
+    RateLimitedError (and a Retry-After hint) when its session's queue or the
+    whole queue is full, or when its estimated wait exceeds `max_wait`.
+
+    With a shared store (DM_SHARED_STATE) the quota buckets are shared by
+    all worker processes; the queues stay per worker. Shared quota is read
+    and taken on the store's threads, waiting at most `lock_timeout` for
+    another worker's lock before queueing the call and trying again shortly.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_queue: Optional[int] = None,
+        max_queue_per_session: Optional[int] = None,
+        max_wait: Optional[float] = None,
+        burst_seconds: Optional[float] = None,
+        store: Optional[SharedStore] = None,
+        lock_timeout: Optional[float] = None
+    ):
+        rpm = requests_per_minute or float(os.getenv("DM_RATE_LIMIT_RPM", "1000"))
+        tpm = tokens_per_minute or float(os.getenv("DM_RATE_LIMIT_TPM", "1000000"))
+        burst = burst_seconds or float(os.getenv("DM_RATE_LIMIT_BURST_SECONDS", "10"))
+        self.max_queue = max_queue or int(os.getenv("DM_QUEUE_MAX", "64"))
+        self.max_queue_per_session = max_queue_per_session or int(os.getenv("DM_QUEUE_MAX_PER_SESSION", "4"))
+        self.max_wait = max_wait or float(os.getenv("DM_QUEUE_MAX_WAIT", "10"))
+        lock_timeout = lock_timeout or float(os.getenv("DM_RATE_LIMIT_LOCK_TIMEOUT", "0.05"))
+
+        # Burst capacity: this many seconds' worth of quota can be spent at once
+        self.store = store if store is not None else get_shared_store()
+        if self.store is not None:
+            self.requests = SharedTokenBucket(self.store, "requests", rpm, max(1.0, rpm * burst / 60), lock_timeout)
+            self.tokens = SharedTokenBucket(self.store, "tokens", tpm, max(1.0, tpm * burst / 60), lock_timeout)
+        else:
+            self.requests = TokenBucket(rpm, max(1.0, rpm * burst / 60))
+            self.tokens = TokenBucket(tpm, max(1.0, tpm * burst / 60))
+
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._queued = 0
+        self._queued_tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Shared buckets load their state into the bucket objects, so one quota operation at a time
+        self._quota_lock = asyncio.Lock()
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "upstream_throttled": 0}
+
+    async def _quota(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a quota check or take, on the store's threads when the buckets are shared."""
+        if self.store is None:
+            return fn(*args)
+        async with self._quota_lock:
+            return await self.store.run(fn, *args)
+
+    def _wait_for(self, requests: int, tokens: int, clamp: bool = True) -> float:
+        return max(self.requests.time_until(requests, clamp=clamp), self.tokens.time_until(tokens, clamp=clamp))
+
+    def _try_take(self, tokens: int) -> float:
+        """Take quota for one call if it is available now; otherwise return the wait."""
+        try:
+            wait = self._wait_for(1, tokens)
+            if wait == 0:
+                self.requests.take(1)
+                self.tokens.take(tokens)
+            return wait
+        except sqlite3.OperationalError:
+            # Another worker holds the shared quota's lock
+            return LOCK_RETRY_SECONDS
+
+    async def _backlog_wait(self, tokens: int = 0) -> float:
+        """Estimated wait for one more call behind everything already queued."""
+        return await self._quota(self._wait_for, self._queued + 1, self._queued_tokens + tokens, False)
+
+    async def acquire(self, tokens: int, session: Optional[str] = None) -> None:
+        """Wait for quota for one call of about `tokens` tokens, or raise RateLimitedError."""
+        session = session or current_session.get()
+
+        if not self._queued and await self._quota(self._try_take, tokens) == 0:
+            self._record("admitted")
+            return
+
+        queue = self._queues.get(session)
+        if self._queued >= self.max_queue or (queue and len(queue) >= self.max_queue_per_session):
+            self._reject(
+                f"Too many queued model calls{' for this session' if queue and len(queue) >= self.max_queue_per_session else ''}",
+                await self._backlog_wait()
+            )
+
+        # Everything already queued is served first, so estimate from its total
+        estimate = await self._backlog_wait(tokens)
+        if estimate > self.max_wait:
+            self._reject(f"Model quota exhausted for about {estimate:.0f}s", estimate)
+
+        waiter = _Waiter(tokens, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(session, deque()).append(waiter)
+        self._queued += 1
+        self._queued_tokens += tokens
+        self._record("queued")
+        self._schedule(0)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._remove(session, waiter)
+            self._reject("Timed out waiting for model quota", await self._backlog_wait())
+        except asyncio.CancelledError:
+            self._remove(session, waiter)
+            raise
+        finally:
+            metrics.ADMISSION_WAIT_SECONDS.observe(time.monotonic() - waiter.queued_at)
+
+    async def try_acquire(self, tokens: int) -> bool:
+        """Take quota for one call only if it is available right now, without queueing.
+        
+        For optional calls such as hedged requests, which are only worth
+        making when they cost no waiting.
+        """
+        if self._queued or await self._quota(self._try_take, tokens) > 0:
+            return False
+        self._record("admitted")
+        return True
+
+    async def throttled(self, retry_after: float) -> None:
+        """Record an upstream 429: admit nothing else until `retry_after` has passed."""
+        self.stats["upstream_throttled"] += 1
+        await self._quota(self.requests.block, retry_after)
+        await self._quota(self.tokens.block, retry_after)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "queue_depth": self._queued, "queued_sessions": len(self._queues)}
+
+    def _record(self, outcome: str) -> None:
+        self.stats[outcome] += 1
+        metrics.ADMISSION_REQUESTS.inc(outcome=outcome)
+        metrics.ADMISSION_QUEUE_DEPTH.set(self._queued)
+
+    def _reject(self, message: str, retry_after: float) -> None:
+        self._record("rejected")
+        raise RateLimitedError(message, retry_after)
+
+    def _remove(self, session: str, waiter: _Waiter) -> None:
+        queue = self._queues.get(session)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self._queued -= 1
+            self._queued_tokens -= waiter.tokens
+            if not queue:
+                del self._queues[session]
+            metrics.ADMISSION_QUEUE_DEPTH.set(self._queued)
+        # Wake the next waiter, in case this one was at the head of the line
+        self._schedule(0)
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None:
+            if delay > 0:
+                return
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._start_dispatch)
+
+    def _start_dispatch(self) -> None:
+        self._timer = None
+        # A running dispatcher picks up new waiters itself
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+            self._dispatcher.add_done_callback(self._dispatch_done)
+
+    def _dispatch_done(self, task: asyncio.Task) -> None:
+        self._dispatcher = None
+        if not task.cancelled() and task.exception() is not None:
+            # Waiters left in the queue time out and are rejected as usual
+            print(f"[ERROR] Admission dispatch failed: {task.exception()}")
+
+    async def _dispatch(self) -> None:
+        """Admit queued calls round-robin across sessions while quota allows."""
+        while self._queues:
+            session, queue = next(iter(self._queues.items()))
+            waiter = queue[0]
+            wait = await self._quota(self._try_take, waiter.tokens)
+            if wait > 0:
+                self._schedule(wait)
+                return
+            # The waiter may have timed out while shared quota was being taken;
+            # the quota is spent either way, so the call is still counted
+            if waiter in queue:
+                queue.remove(waiter)
+                self._queued -= 1
+                self._queued_tokens -= waiter.tokens
+            queue = self._queues.get(session)
+            if queue:
+                self._queues.move_to_end(session)
+            elif queue is not None:
+                del self._queues[session]
+            if not waiter.future.done():
+                waiter.future.set_result(None)
+                metrics.ADMISSION_REQUESTS.inc(outcome="dequeued")
+        metrics.ADMISSION_QUEUE_DEPTH.set(self._queued)
@@ -1,10 +1,55 @@
+import asyncio
+import hashlib
 import json
 import os
-from typing import Dict, List, Optional, Any
-import google.generativeai as genai
+import time
+from typing import AsyncIterator, Dict, List, Optional, Any
+
+import log
+import metrics
+from admission import AdmissionController, RateLimitedError, current_session
+from encounter_builder import default_flavor
+from prompt_builder import PromptBuilder, estimate_tokens
+from response_cache import ResponseCache, normalize_prompt
+from resilience import CircuitBreaker, LatencyTracker, ModelUnavailableError, backoff_delay
+
+
+class GenerationTimeoutError(Exception):
+    """Raised when a Gemini call does not finish within the configured timeout."""
+
+
+def _is_quota_error(error: Exception) -> bool:
+    """Whether a Gemini API error is a 429 (quota exhausted / rate limited)."""
+    return getattr(error, "code", None) == 429
+
+
+def _retry_reason(error: Exception) -> Optional[str]:
+    """Why a failed Gemini call is worth retrying, or None if it is not.
+    
+    Timeouts, 5xx errors and dropped connections are transient. Quota errors
+    are handled by admission control, and anything else (bad request, blocked
+    prompt) would fail the same way again.
+    """
+    if isinstance(error, GenerationTimeoutError):
+        return "timeout"
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and 500 <= code < 600:
+        return "server_error"
+    if isinstance(error, ConnectionError):
+        return "connection"
+    return None
+
 
 class AIDungeonMaster:
+    # Caps for free-text context in chat prompts, in (estimated) tokens
+    BACKGROUND_MAX_TOKENS = 150
+    NOTES_MAX_TOKENS = 200
+
     def __init__(self):
+        # google.generativeai takes most of a second to import, so it is only
+        # loaded once a Dungeon Master is actually constructed
+        import google.generativeai as genai
+        
         # Configure Google Gemini
         # Option 1: Use environment variable (recommended)
         api_key = os.getenv("GOOGLE_API_KEY")
@@ -18,27 +63,22 @@ class AIDungeonMaster:
         
         genai.configure(api_key=api_key)
         
-        # Use the current recommended model as suggested by Google
-        print("[INFO] Initializing Gemini model...")
-        try:
-            # Try gemini-1.5-flash first (recommended by Google)
-            self.model = genai.GenerativeModel('gemini-1.5-flash')
-            print("[INFO] Using model: gemini-1.5-flash")
-        except Exception as e1:
-            print(f"[WARNING] gemini-1.5-flash failed: {e1}")
+        # Models in order of preference. The first one that initializes is the
+        # primary; the rest are runtime fallbacks when it times out or fails
+        model_chain = [name.strip() for name in os.getenv("DM_MODEL_CHAIN", "gemini-1.5-flash,gemini-1.5-pro,gemini-flash").split(",") if name.strip()]
+        log.info("Initializing Gemini model...")
+        self.model_chain = []
+        errors = []
+        for model_name in model_chain:
             try:
-                # Fallback to gemini-1.5-pro
-                self.model = genai.GenerativeModel('gemini-1.5-pro')
-                print("[INFO] Using model: gemini-1.5-pro")
-            except Exception as e2:
-                print(f"[WARNING] gemini-1.5-pro failed: {e2}")
-                try:
-                    # Try without the version number
-                    self.model = genai.GenerativeModel('gemini-flash')
-                    print("[INFO] Using model: gemini-flash")
-                except Exception as e3:
-                    print(f"[WARNING] gemini-flash failed: {e3}")
-                    raise Exception(f"Could not initialize any Gemini model. Errors: {e1}, {e2}, {e3}")
+                genai.GenerativeModel(model_name)
+                self.model_chain.append(model_name)
+            except Exception as e:
+                log.warning("%s failed: %s", model_name, e)
+                errors.append(str(e))
+        if not self.model_chain:
+            raise Exception(f"Could not initialize any Gemini model. Errors: {', '.join(errors)}")
+        log.info("Using model: %s (fallbacks: %s)", self.model_chain[0], ', '.join(self.model_chain[1:]) or 'none')
         
         # System prompt for the AI DM
         self.system_prompt = """You are an expert Dungeon Master for D&D 5th Edition. You are creative, engaging, and follow the rules of D&D 5E. Your role is to:
@@ -61,192 +101,1082 @@ When generating responses, consider:
 
 Format your responses in a natural, engaging way that moves the story forward."""
 
-    def generate_response(
+        # Static instructions for the other prompt types. Each one is set as the
+        # system instruction of its own model object below, so per-call prompts
+        # only carry the parts that change.
+        self.combined_instructions = self.system_prompt + """
+
+Reply with only a JSON object of this form:
+{"narration": "your full response as the Dungeon Master", "suggestions": ["action1", "action2", "action3"]}
+The suggestions are 3 brief action options the player could take next, each 1-2 words maximum."""
+
+        self.party_instructions = self.system_prompt + """
+
+Several players act at the same time this round. Resolve all of their actions together as one coherent scene: actions can help, hinder or interrupt each other. Results marked as already rolled are final; narrate them as given.
+
+Reply with only a JSON object of this form:
+{"narration": "what happens in the scene as a whole", "players": [{"player_id": "the player's id from the action list", "narration": "what happens to that player's character", "suggestions": ["action1", "action2", "action3"]}]}
+Include every player exactly once. The suggestions are 3 brief action options for that player, each 1-2 words maximum."""
+
+        self.suggestion_instructions = """You suggest what a D&D 5E player could do next, given what they said and how the Dungeon Master responded.
+
+Suggest 3 brief action options the player could take next. Each should be 1-2 words maximum.
+Respond with only a JSON array like: ["action1", "action2", "action3"]"""
+
+        self.encounter_instructions = """You generate random D&D 5E encounters for a given party.
+
+Provide a JSON response with the following structure:
+{
+    "description": "A vivid description of the encounter scenario",
+    "monsters": [
+        {"name": "Monster Name", "challenge_rating": "CR value"}
+    ],
+    "difficulty": "easy/medium/hard/deadly",
+    "setting": "Where this encounter takes place",
+    "tactics": "How the monsters might behave in combat"
+}
+
+Make it engaging and appropriate for the party's level. Respond only with valid JSON."""
+
+        self.flavor_instructions = """You write the flavor text for D&D 5E encounters whose monsters have already been chosen. Do not add, remove or change monsters.
+
+Provide a JSON response with the following structure:
+{
+    "description": "A vivid description of the encounter scenario",
+    "setting": "Where this encounter takes place",
+    "tactics": "How the monsters might behave in combat"
+}
+
+Respond only with valid JSON."""
+
+        self.summary_instructions = """You keep the running summary of a D&D 5E campaign for the Dungeon Master.
+
+Rewrite the summary you are given to include the new conversation. Keep names, places, quests, items, promises and unresolved threads; drop flavor text. Use at most 250 words. Respond with only the summary."""
+
+        # One pre-configured model per prompt type, for every model in the chain
+        instructions = {
+            "chat": self.system_prompt,
+            "combined": self.combined_instructions,
+            "party": self.party_instructions,
+            "suggestions": self.suggestion_instructions,
+            "encounter": self.encounter_instructions,
+            "flavor": self.flavor_instructions,
+            "summary": self.summary_instructions,
+        }
+        self.models_by_name = {
+            model_name: {
+                prompt_type: genai.GenerativeModel(model_name, system_instruction=instruction)
+                for prompt_type, instruction in instructions.items()
+            }
+            for model_name in self.model_chain
+        }
+        self.models = self.models_by_name[self.model_chain[0]]
+        self.model = self.models["chat"]
+        
+        # Size of each prompt type's system instruction. It is still billed and
+        # prefilled on every call; keeping it stable and first only makes it
+        # eligible for Gemini's implicit prompt caching, which reports the
+        # tokens it actually served as cached_content_token_count
+        self._prefix_tokens = {prompt_type: estimate_tokens(instruction) for prompt_type, instruction in instructions.items()}
+        self.prefix_stats = {prompt_type: {"calls": 0, "stable_prefix_tokens": 0, "cached_tokens": 0} for prompt_type in instructions}
+
+        # Async generation limits: at most this many Gemini calls in flight per
+        # process, each one cancelled after the timeout (in seconds)
+        self.max_concurrent_generations = int(os.getenv("DM_MAX_CONCURRENT_GENERATIONS", "16"))
+        self.generation_timeout = float(os.getenv("DM_GENERATION_TIMEOUT", "30"))
+        self._generation_semaphore = asyncio.Semaphore(self.max_concurrent_generations)
+        
+        # Requests/min and tokens/min quota in front of every async Gemini call,
+        # with a fair-share queue per session. After a 429 from Gemini itself,
+        # nothing is admitted for DM_UPSTREAM_RETRY_AFTER seconds.
+        self.admission = AdmissionController()
+        self.upstream_retry_after = float(os.getenv("DM_UPSTREAM_RETRY_AFTER", "10"))
+
+        # Failed or timed-out calls are retried with exponential backoff and
+        # jitter, moving down the model chain. A model whose circuit breaker is
+        # open (too many failures in a row) is skipped until its reset timeout.
+        self.max_retries = int(os.getenv("DM_MAX_RETRIES", "2"))
+        self.retry_base_delay = float(os.getenv("DM_RETRY_BASE_DELAY", "0.5"))
+        self.retry_max_delay = float(os.getenv("DM_RETRY_MAX_DELAY", "4"))
+        breaker_failures = int(os.getenv("DM_BREAKER_FAILURES", "5"))
+        breaker_reset = float(os.getenv("DM_BREAKER_RESET_TIMEOUT", "30"))
+        self.breakers = {model_name: CircuitBreaker(breaker_failures, breaker_reset) for model_name in self.model_chain}
+
+        # Hedged requests: when a call is still running at the p95 latency of
+        # its prompt type, a second one goes to the next model (if the rate
+        # limiter has spare quota right now) and the first reply wins
+        self.hedge_enabled = os.getenv("DM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+        self.hedge_percentile = float(os.getenv("DM_HEDGE_PERCENTILE", "95"))
+        self.hedge_min_delay = float(os.getenv("DM_HEDGE_MIN_DELAY", "1"))
+        self.latencies = LatencyTracker()
+
+        # "combined" asks for narration and suggestions in one structured call;
+        # "separate" keeps the original narration call + suggestions call
+        self.suggestion_mode = os.getenv("DM_SUGGESTION_MODE", "combined").lower()
+        if self.suggestion_mode not in ("combined", "separate"):
+            raise ValueError(f"DM_SUGGESTION_MODE must be 'combined' or 'separate', got '{self.suggestion_mode}'")
+
+        # Approximate input-token budget for a chat prompt; lower-priority
+        # context is truncated or dropped to stay under it
+        self.prompt_token_budget = int(os.getenv("DM_PROMPT_TOKEN_BUDGET", "2000"))
+
+        # SRD rules snippets for spells, monsters, conditions and items the
+        # player mentions; the index is attached by the server once built
+        self.rules_index = None
+        self.rules_token_budget = int(os.getenv("DM_RULES_TOKEN_BUDGET", "300"))
+        self.rules_max_entries = int(os.getenv("DM_RULES_MAX_ENTRIES", "3"))
+
+        # Memoized responses for prompt types whose answers are reusable
+        # (suggestions by default; see DM_RESPONSE_CACHE_*)
+        self.response_cache = ResponseCache()
+
+        # Resolves purely mechanical actions (checks, attacks, spells) without
+        # a Gemini call; attached by the server, which owns the SRD client
+        self.action_resolver = None
+
+        self.chat_config = genai.types.GenerationConfig(
+            max_output_tokens=800,
+            temperature=0.8,
+            top_p=0.8,
+            top_k=40
+        )
+        self.encounter_config = genai.types.GenerationConfig(
+            max_output_tokens=600,
+            temperature=0.9,
+        )
+        self.flavor_config = genai.types.GenerationConfig(
+            max_output_tokens=400,
+            temperature=0.9,
+            response_mime_type="application/json"
+        )
+        self.summary_config = genai.types.GenerationConfig(
+            max_output_tokens=400,
+            temperature=0.3,
+        )
+        self.suggestion_config = genai.types.GenerationConfig(
+            max_output_tokens=100,
+            temperature=0.7,
+        )
+        self.combined_config = genai.types.GenerationConfig(
+            max_output_tokens=900,
+            temperature=0.8,
+            top_p=0.8,
+            top_k=40,
+            response_mime_type="application/json"
+        )
+        self.party_config = genai.types.GenerationConfig(
+            max_output_tokens=1600,
+            temperature=0.8,
+            top_p=0.8,
+            top_k=40,
+            response_mime_type="application/json"
+        )
+
+    @metrics.timed("chat")
+    async def generate_response_async(
         self, 
         message: str, 
         character: Optional[Dict[str, Any]] = None,
         game_session: Optional[Dict[str, Any]] = None,
-        chat_history: List[Dict[str, Any]] = None
+        chat_history: List[Dict[str, Any]] = None,
+        summary: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Generate an AI DM response to player input."""
+        """Generate an AI DM response without blocking the event loop.
+        
+        Mechanical actions the action resolver can settle on its own are
+        answered locally, without calling Gemini.
+        """
         
         try:
-            print(f"[DEBUG] Generating response for message: {message[:50]}...")
-            
-            # Build context from character and session
-            context = self._build_context(character, game_session, chat_history or [])
-            
-            # Create the full prompt
-            full_prompt = f"{self.system_prompt}\n\nContext: {context}\n\nPlayer message: {message}\n\nRespond as the Dungeon Master:"
-            
-            # Add recent chat history to the prompt
-            if chat_history:
-                history_text = "\n\nRecent conversation:\n"
-                for msg in chat_history[-5:]:  # Last 5 messages for context
-                    if msg.get('type') == 'player':
-                        history_text += f"Player: {msg.get('content', '')}\n"
-                    elif msg.get('type') == 'dm':
-                        history_text += f"DM: {msg.get('content', '')}\n"
-                full_prompt = full_prompt.replace("Player message:", f"{history_text}\nPlayer message:")
-            
-            print("[DEBUG] Calling Gemini API...")
-            
-            # Generate response using Gemini
-            response = self.model.generate_content(
-                full_prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=800,
-                    temperature=0.8,
-                    top_p=0.8,
-                    top_k=40
-                )
-            )
+            log.debug("Generating async response for message: %s...", message[:50])
+            
+            if self.action_resolver is not None:
+                local = await self.action_resolver.resolve(message, character, game_session)
+                if local is not None:
+                    return local
             
-            print("[DEBUG] Gemini API response received")
+            if self.suggestion_mode == "combined":
+                combined_prompt, prompt_report = self._build_chat_prompt(message, character, game_session, chat_history or [], combined=True, summary=summary)
+                response = await self._generate_content_async(combined_prompt, self.combined_config, "combined")
+                combined = self._parse_combined_response(response)
+                if combined:
+                    dm_response, suggestions = combined
+                    if suggestions is None:
+                        metrics.LLM_RETRIES.inc(prompt_type="suggestions", reason="missing_suggestions")
+                        suggestions = await self._generate_suggestions_async(message, character, dm_response, game_session)
+                    return {
+                        "message": dm_response,
+                        "suggestions": suggestions,
+                        "usage": self._usage_report(prompt_report, response)
+                    }
+                metrics.LLM_RETRIES.inc(prompt_type="chat", reason="unparsed_combined")
+                log.warning("Combined response could not be parsed, falling back to separate calls")
+            
+            full_prompt, prompt_report = self._build_chat_prompt(message, character, game_session, chat_history or [], summary=summary)
+            response = await self._generate_content_async(full_prompt, self.chat_config, "chat")
             
             if not response or not response.text:
                 raise Exception("Empty response from Gemini API")
             
             dm_response = response.text.strip()
-            
-            # Generate action suggestions
-            suggestions = self._generate_suggestions(message, character, dm_response)
-            
-            print(f"[DEBUG] Response generated successfully: {dm_response[:50]}...")
+            suggestions = await self._generate_suggestions_async(message, character, dm_response, game_session)
             
             return {
                 "message": dm_response,
-                "suggestions": suggestions
+                "suggestions": suggestions,
+                "usage": self._usage_report(prompt_report, response)
             }
             
+        except (GenerationTimeoutError, RateLimitedError, ModelUnavailableError):
+            raise
         except Exception as e:
-            print(f"[ERROR] Failed to generate AI response: {str(e)}")
-            print(f"[ERROR] Exception type: {type(e).__name__}")
-            import traceback
-            traceback.print_exc()
+            log.error("Failed to generate AI response: %s", e)
             raise Exception(f"Failed to generate AI response: {str(e)}")
 
-    def generate_encounter(self, party_level: int, party_size: int) -> Dict[str, Any]:
-        """Generate a random encounter for the party."""
+    async def stream_response_async(
+        self, 
+        message: str, 
+        character: Optional[Dict[str, Any]] = None,
+        game_session: Optional[Dict[str, Any]] = None,
+        chat_history: List[Dict[str, Any]] = None,
+        summary: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an AI DM response to player input.
         
-        try:
-            print(f"[DEBUG] Generating encounter for level {party_level}, party size {party_size}")
-            
-            prompt = f"""Generate a random D&D 5E encounter for a party of {party_size} characters at level {party_level}. 
-
-Provide a JSON response with the following structure:
-{{
-    "description": "A vivid description of the encounter scenario",
-    "monsters": [
-        {{"name": "Monster Name", "challenge_rating": "CR value"}}
-    ],
-    "difficulty": "easy/medium/hard/deadly",
-    "setting": "Where this encounter takes place",
-    "tactics": "How the monsters might behave in combat"
-}}
+        Yields {"type": "chunk", "text": ...} events as Gemini produces the
+        narration, then one {"type": "done", "message": ..., "suggestions": [...]}
+        event once the suggestions for the finished narration are ready.
+        """
+        
+        log.debug("Streaming response for message: %s...", message[:50])
+        
+        if self.action_resolver is not None:
+            local = await self.action_resolver.resolve(message, character, game_session)
+            if local is not None:
+                yield {"type": "chunk", "text": local["message"]}
+                yield {"type": "done", **local}
+                return
+        
+        full_prompt, prompt_report = self._build_chat_prompt(message, character, game_session, chat_history or [], summary=summary)
+        parts = []
+        
+        tokens = self._call_tokens(full_prompt, "chat", self.chat_config)
+        for attempt in range(self.max_retries + 1):
+            model_name = await self._admit(attempt, tokens)
+            stream = self._stream_model(model_name, full_prompt)
+            try:
+                async for text in stream:
+                    parts.append(text)
+                    yield {"type": "chunk", "text": text}
+                break
+            except Exception as e:
+                # Once narration has reached the client a retry would repeat it,
+                # so only failures before the first chunk are retried
+                if parts or not self._should_retry(e, attempt, model_name, "chat"):
+                    raise
+                await asyncio.sleep(backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay))
+            finally:
+                # Release the model's concurrency slot now, even if the client
+                # stopped reading mid-stream
+                await stream.aclose()
+        
+        dm_response = "".join(parts).strip()
+        if not dm_response:
+            raise Exception("Empty response from Gemini API")
+        
+        suggestions = await self._generate_suggestions_async(message, character, dm_response, game_session)
+        
+        yield {
+            "type": "done",
+            "message": dm_response,
+            "suggestions": suggestions,
+            "usage": self._usage_report(prompt_report)
+        }
 
-Make it engaging and appropriate for the party's level. Respond only with valid JSON."""
+    @metrics.timed("party_turn")
+    async def generate_party_turn_async(
+        self,
+        actions: List[Dict[str, Any]],
+        game_session: Optional[Dict[str, Any]] = None,
+        chat_history: List[Dict[str, Any]] = None,
+        summary: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Resolve several players' simultaneous actions with one generation.
+        
+        Each action is {"player_id", "message", "character"}. Mechanical
+        actions the action resolver can settle are rolled locally first and
+        handed to the model as results to narrate. Returns the shared scene
+        narration and, per player id, that player's narration, suggestions
+        and resolution (if any).
+        """
+        
+        try:
+            log.debug("Generating party turn for %s actions", len(actions))
             
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=600,
-                    temperature=0.9,
-                )
-            )
+            resolutions: Dict[str, Dict[str, Any]] = {}
+            if self.action_resolver is not None:
+                for action in actions:
+                    local = await self.action_resolver.resolve(action["message"], action.get("character"), action.get("game_session") or game_session, record=False)
+                    if local is not None:
+                        resolutions[action["player_id"]] = local
             
-            if not response or not response.text:
+            prompt, prompt_report = self._build_party_prompt(actions, resolutions, game_session, chat_history or [], summary)
+            response = await self._generate_content_async(prompt, self.party_config, "party")
+            narration, parsed = self._parse_party_response(response)
+            if narration is None and not parsed:
                 raise Exception("Empty response from Gemini API")
             
-            # Try to parse the JSON response
-            try:
-                encounter_data = json.loads(response.text)
-            except json.JSONDecodeError as je:
-                print(f"[WARNING] JSON parsing failed: {je}")
-                print(f"[WARNING] Raw response: {response.text}")
-                # If JSON parsing fails, create a fallback response
-                encounter_data = {
-                    "description": response.text,
-                    "monsters": [{"name": "Unknown", "challenge_rating": "1"}],
-                    "difficulty": "medium",
-                    "setting": "Unknown location",
-                    "tactics": "The monsters fight to the death"
+            players = {}
+            for action in actions:
+                player_id = action["player_id"]
+                entry = parsed.get(player_id, {})
+                local = resolutions.get(player_id)
+                message = entry.get("narration") or ""
+                if local:
+                    message = f"{local['message']}\n\n{message}".strip()
+                players[player_id] = {
+                    "message": message,
+                    "suggestions": entry.get("suggestions") or (local["suggestions"] if local else ["Investigate", "Attack", "Negotiate"]),
+                    "resolution": local["resolution"] if local else None,
                 }
             
             return {
-                "description": encounter_data.get("description", "A mysterious encounter awaits..."),
-                "monsters": encounter_data.get("monsters", []),
-                "difficulty": encounter_data.get("difficulty", "medium"),
-                "setting": encounter_data.get("setting", "Unknown location"),
-                "tactics": encounter_data.get("tactics", "The monsters fight to the death")
+                "narration": narration or "",
+                "players": players,
+                "usage": self._usage_report(prompt_report, response)
             }
             
+        except (GenerationTimeoutError, RateLimitedError, ModelUnavailableError):
+            raise
+        except Exception as e:
+            log.error("Failed to generate party turn: %s", e)
+            raise Exception(f"Failed to generate party turn: {str(e)}")
+
+    @metrics.timed("encounter")
+    async def generate_encounter_async(self, party_level: int, party_size: int) -> Dict[str, Any]:
+        """Generate a random encounter for the party without blocking the event loop."""
+        
+        try:
+            log.debug("Generating async encounter for level %s, party size %s", party_level, party_size)
+            
+            response = await self._generate_content_async(
+                self._build_encounter_prompt(party_level, party_size),
+                self.encounter_config,
+                "encounter"
+            )
+            
+            if not response or not response.text:
+                raise Exception("Empty response from Gemini API")
+            
+            return self._parse_encounter(response.text)
+            
+        except (GenerationTimeoutError, RateLimitedError, ModelUnavailableError):
+            raise
         except Exception as e:
-            print(f"[ERROR] Failed to generate encounter: {str(e)}")
+            log.error("Failed to generate encounter: %s", e)
             raise Exception(f"Failed to generate encounter: {str(e)}")
 
-    def _generate_suggestions(
+    @metrics.timed("encounter_flavor")
+    async def generate_encounter_flavor_async(
+        self, 
+        party_level: int, 
+        party_size: int, 
+        encounter: Dict[str, Any]
+    ) -> Dict[str, str]:
+        """Write the description, setting and tactics for an already-balanced encounter."""
+        
+        try:
+            response = await self._generate_content_async(
+                self._build_flavor_prompt(party_level, party_size, encounter),
+                self.flavor_config,
+                "flavor"
+            )
+            flavor = self._extract_json(response.text) if response and response.text else None
+            if isinstance(flavor, dict) and isinstance(flavor.get("description"), str):
+                return {
+                    "description": flavor["description"],
+                    "setting": flavor.get("setting") or "Unknown location",
+                    "tactics": flavor.get("tactics") or "The monsters fight to the death"
+                }
+            log.warning("Encounter flavor could not be parsed, using plain description")
+        except GenerationTimeoutError:
+            raise
+        except Exception as e:
+            log.warning("Failed to generate encounter flavor: %s", e)
+        
+        return default_flavor(encounter)
+
+    @metrics.timed("summary")
+    async def summarize_history_async(self, summary: str, messages: List[Dict[str, Any]]) -> str:
+        """Fold older chat messages into the running story summary of a session."""
+        
+        transcript = "\n".join(
+            f"{'Player' if msg.get('type') == 'player' else 'DM'}: {msg.get('content', '')}"
+            for msg in messages
+            if msg.get('type') in ('player', 'dm')
+        )
+        prompt = f"""Summary so far:
+{summary or "The adventure has just begun."}
+
+New conversation:
+{transcript}"""
+        
+        response = await self._generate_content_async(prompt, self.summary_config, "summary")
+        if not response or not response.text:
+            raise Exception("Empty response from Gemini API")
+        return response.text.strip()
+
+    @metrics.timed("suggestions")
+    async def _generate_suggestions_async(
         self, 
         player_message: str, 
         character: Optional[Dict[str, Any]], 
-        dm_response: str
+        dm_response: str,
+        game_session: Optional[Dict[str, Any]] = None
     ) -> List[str]:
-        """Generate action suggestions for the player."""
+        """Generate action suggestions for the player without blocking the event loop."""
         
         try:
-            prompt = f"""Based on this D&D scenario:
-Player said: "{player_message}"
-DM responded: "{dm_response}"
-Character class: {character.get('class', 'Unknown') if character else 'Unknown'}
-
-Suggest 3 brief action options the player could take next. Each should be 1-2 words maximum.
-Respond with only a JSON array like: ["action1", "action2", "action3"]"""
-            
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=100,
-                    temperature=0.7,
-                )
+            response = await self._generate_content_async(
+                self._build_suggestions_prompt(player_message, character, dm_response),
+                self.suggestion_config,
+                "suggestions",
+                cache_key=self._suggestions_cache_key(player_message, dm_response, character, game_session)
             )
-            
-            if response and response.text:
-                try:
-                    suggestions = json.loads(response.text)
-                    if isinstance(suggestions, list):
-                        return suggestions[:3]  # Ensure we only return 3 suggestions
-                except json.JSONDecodeError:
-                    pass
-            
-            # Return default suggestions if parsing fails
-            return ["Investigate", "Attack", "Negotiate"]
+            return self._parse_suggestions(response)
             
         except Exception as e:
-            print(f"[WARNING] Failed to generate suggestions: {str(e)}")
-            # Return default suggestions if AI generation fails
+            log.warning("Failed to generate suggestions: %s", e)
             return ["Investigate", "Attack", "Negotiate"]
 
-    def _build_context(
+    async def _generate_content_async(self, prompt: str, generation_config: Any, prompt_type: str, cache_key: Optional[str] = None) -> Any:
+        """Call Gemini asynchronously under admission control.
+        
+        Transient failures are retried with backoff and jitter, moving down the
+        model chain, and slow calls may be hedged (see _hedged_call).
+        Cacheable calls are answered from the response cache when possible,
+        without touching the quota, keyed on `cache_key` (the prompt by
+        default; empty opts out).
+        """
+        
+        cache_key = prompt if cache_key is None else cache_key
+        cacheable = bool(cache_key) and self.response_cache.cacheable(prompt_type, generation_config)
+        if cacheable:
+            cached = self.response_cache.get(cache_key, generation_config, prompt_type)
+            if cached is not None:
+                return cached
+        
+        tokens = self._call_tokens(prompt, prompt_type, generation_config)
+        for attempt in range(self.max_retries + 1):
+            # Every attempt is a real request against the quota
+            model_name = await self._admit(attempt, tokens)
+            try:
+                if self.hedge_enabled:
+                    response = await self._hedged_call(model_name, prompt, generation_config, prompt_type, tokens)
+                else:
+                    response = await self._call_model(model_name, prompt, generation_config, prompt_type)
+                if cacheable:
+                    self._cache_response(prompt, cache_key, generation_config, prompt_type, response)
+                return response
+            except Exception as e:
+                if not self._should_retry(e, attempt, model_name, prompt_type):
+                    raise
+                await asyncio.sleep(backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay))
+
+    async def _call_model(self, model_name: str, prompt: str, generation_config: Any, prompt_type: str) -> Any:
+        """One Gemini call on one model, under the concurrency limit and per-call timeout."""
+        
+        queued = time.perf_counter()
+        async with self._generation_semaphore:
+            started = time.perf_counter()
+            metrics.LLM_QUEUE_SECONDS.observe(started - queued)
+            self._record_prefix(prompt_type)
+            response = None
+            outcome = "error"
+            try:
+                response = await asyncio.wait_for(
+                    self.models_by_name[model_name][prompt_type].generate_content_async(prompt, generation_config=generation_config),
+                    timeout=self.generation_timeout
+                )
+                outcome = "ok"
+                self._record_result(model_name, prompt_type, time.perf_counter() - started)
+                return response
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                error = GenerationTimeoutError(f"Gemini API call to {model_name} timed out after {self.generation_timeout}s")
+                self._record_result(model_name, prompt_type, error=error)
+                raise error
+            except asyncio.CancelledError:
+                # Lost a hedge race (or the client went away): not the model's fault
+                outcome = "cancelled"
+                self.breakers[model_name].release()
+                raise
+            except Exception as e:
+                if _is_quota_error(e):
+                    outcome = "throttled"
+                    self.breakers[model_name].release()
+                    raise await self._throttled(e)
+                self._record_result(model_name, prompt_type, error=e)
+                raise
+            finally:
+                self._record_call(prompt_type, started, outcome, prompt, response, model_name=model_name)
+
+    async def _stream_model(self, model_name: str, prompt: str) -> AsyncIterator[str]:
+        """Stream one chat reply from one model, under the concurrency limit.
+        
+        The timeout applies to opening the stream and to each gap between
+        chunks, so a long reply that keeps streaming is never cut off.
+        """
+        
+        parts = []
+        queued = time.perf_counter()
+        async with self._generation_semaphore:
+            started = time.perf_counter()
+            metrics.LLM_QUEUE_SECONDS.observe(started - queued)
+            self._record_prefix("chat")
+            response = None
+            outcome = "error"
+            try:
+                response = await asyncio.wait_for(
+                    self.models_by_name[model_name]["chat"].generate_content_async(prompt, generation_config=self.chat_config, stream=True),
+                    timeout=self.generation_timeout
+                )
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.generation_timeout)
+                    except StopAsyncIteration:
+                        break
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield chunk.text
+                outcome = "ok"
+                self._record_result(model_name, "chat", time.perf_counter() - started)
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                error = GenerationTimeoutError(f"Gemini API stream from {model_name} stalled for more than {self.generation_timeout}s")
+                self._record_result(model_name, "chat", error=error)
+                raise error
+            except (asyncio.CancelledError, GeneratorExit):
+                outcome = "cancelled"
+                self.breakers[model_name].release()
+                raise
+            except Exception as e:
+                if _is_quota_error(e):
+                    outcome = "throttled"
+                    self.breakers[model_name].release()
+                    raise await self._throttled(e)
+                self._record_result(model_name, "chat", error=e)
+                raise
+            finally:
+                # Usage metadata is only complete once the whole stream was read
+                self._record_call("chat", started, outcome, prompt, response if outcome == "ok" else None, text="".join(parts), model_name=model_name)
+
+    async def _hedged_call(self, model_name: str, prompt: str, generation_config: Any, prompt_type: str, tokens: int) -> Any:
+        """Call `model_name`, and if it is still running at the hedge deadline,
+        race a second call on another model and return whichever succeeds first.
+        
+        The hedge is skipped while there are too few latency samples to set a
+        deadline, when no other model is available, or when it would have to
+        wait for rate-limit quota.
+        """
+        
+        primary = asyncio.ensure_future(self._call_model(model_name, prompt, generation_config, prompt_type))
+        tasks = [primary]
+        try:
+            deadline = self._hedge_deadline(prompt_type)
+            if deadline is None:
+                return await primary
+            done, _ = await asyncio.wait(tasks, timeout=deadline)
+            if done:
+                return primary.result()
+            
+            backup_name = self._pick_hedge_model(model_name)
+            if backup_name is None:
+                metrics.LLM_HEDGES.inc(prompt_type=prompt_type, outcome="skipped")
+                return await primary
+            if not await self.admission.try_acquire(tokens):
+                self.breakers[backup_name].release()
+                metrics.LLM_HEDGES.inc(prompt_type=prompt_type, outcome="skipped")
+                return await primary
+            
+            log.debug("Hedging %s call on %s after %.2fs with %s", prompt_type, model_name, deadline, backup_name)
+            metrics.LLM_HEDGES.inc(prompt_type=prompt_type, outcome="fired")
+            backup = asyncio.ensure_future(self._call_model(backup_name, prompt, generation_config, prompt_type))
+            tasks.append(backup)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            metrics.LLM_HEDGES.inc(prompt_type=prompt_type, outcome="won")
+                        return task.result()
+            # Both failed; surface the primary's error
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _hedge_deadline(self, prompt_type: str) -> Optional[float]:
+        """Seconds to wait before hedging a call, or None if there is no data yet."""
+        
+        latency = self.latencies.percentile(prompt_type, self.hedge_percentile)
+        if latency is None:
+            return None
+        return min(max(latency, self.hedge_min_delay), self.generation_timeout)
+
+    async def _admit(self, attempt: int, tokens: int) -> str:
+        """Pick the model for an attempt, then take its quota.
+        
+        The model comes first so that when every breaker is open the
+        ModelUnavailableError costs the client no quota for a call that is
+        never sent; a half-open trial slot is given back if admission fails.
+        """
+        
+        model_name = self._pick_model(attempt)
+        try:
+            await self.admission.acquire(tokens)
+        except BaseException:
+            self.breakers[model_name].release()
+            raise
+        return model_name
+
+    def _pick_model(self, attempt: int) -> str:
+        """The model for a given attempt: the primary first, then each fallback
+        in turn, skipping any whose circuit breaker is open.
+        
+        Raises ModelUnavailableError when every breaker is open.
+        """
+        
+        count = len(self.model_chain)
+        for offset in range(count):
+            model_name = self.model_chain[(attempt + offset) % count]
+            if self.breakers[model_name].allow():
+                return model_name
+        retry_after = min(breaker.retry_after() for breaker in self.breakers.values())
+        raise ModelUnavailableError("All Gemini models are failing; try again shortly", retry_after)
+
+    def _pick_hedge_model(self, model_name: str) -> Optional[str]:
+        """A different available model to hedge a slow call with, preferring
+        the fallbacks; the same model is used when it is the only one."""
+        
+        for other in self.model_chain:
+            if other != model_name and self.breakers[other].allow():
+                return other
+        if len(self.model_chain) == 1 and self.breakers[model_name].allow():
+            return model_name
+        return None
+
+    def _should_retry(self, error: Exception, attempt: int, model_name: str, prompt_type: str) -> bool:
+        """Whether a failed call gets another attempt; counts the retry if so."""
+        
+        reason = _retry_reason(error)
+        if reason is None or attempt >= self.max_retries:
+            return False
+        metrics.LLM_RETRIES.inc(prompt_type=prompt_type, reason=reason)
+        log.warning("Gemini %s call on %s failed (%s), retrying: %s", prompt_type, model_name, reason, error)
+        return True
+
+    def _record_result(self, model_name: str, prompt_type: str, seconds: Optional[float] = None, error: Optional[Exception] = None) -> None:
+        """Feed one call's outcome to its model's circuit breaker and the latency tracker.
+        
+        Only transient errors count against the breaker; a bad request says
+        nothing about the model's health.
+        """
+        
+        breaker = self.breakers[model_name]
+        if error is None:
+            breaker.record_success()
+            self.latencies.record(prompt_type, seconds)
+        elif _retry_reason(error) is not None:
+            breaker.record_failure()
+            if breaker.state == "open":
+                log.warning("Circuit breaker opened for %s after %s failures", model_name, breaker.failures)
+        else:
+            breaker.release()
+        metrics.LLM_CIRCUIT_OPEN.set(1 if breaker.state == "open" else 0, model=model_name)
+
+    def _cache_response(self, prompt: str, cache_key: str, generation_config: Any, prompt_type: str, response: Any) -> None:
+        metadata = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(metadata, "prompt_token_count", None)
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(prompt) + self._prefix_tokens[prompt_type]
+        self.response_cache.put(cache_key, generation_config, prompt_type, response, prompt_tokens)
+
+    def _call_tokens(self, prompt: str, prompt_type: str, generation_config: Any) -> int:
+        """Estimate the tokens a call will count against the tokens/min quota."""
+        
+        max_output = getattr(generation_config, "max_output_tokens", None) or 0
+        return estimate_tokens(prompt) + self._prefix_tokens[prompt_type] + max_output
+
+    async def _throttled(self, error: Exception) -> RateLimitedError:
+        """Pause admission after a Gemini 429 and build the error to raise."""
+        
+        log.warning("Gemini API quota exceeded, pausing model calls for %ss: %s", self.upstream_retry_after, error)
+        await self.admission.throttled(self.upstream_retry_after)
+        return RateLimitedError(f"Gemini API quota exceeded: {str(error)}", self.upstream_retry_after)
+
+    def _record_call(self, prompt_type: str, started: float, outcome: str, prompt: str, response: Any = None, text: Optional[str] = None, model_name: str = "") -> None:
+        """Record latency, outcome and token metrics for one Gemini call.
+        
+        Token counts come from the response's usage metadata when Gemini
+        reports it, and are estimated from the prompt and reply text otherwise.
+        """
+        
+        metadata = getattr(response, "usage_metadata", None)
+        prompt_tokens = getattr(metadata, "prompt_token_count", None)
+        output_tokens = getattr(metadata, "candidates_token_count", None)
+        self.prefix_stats[prompt_type]["cached_tokens"] += getattr(metadata, "cached_content_token_count", None) or 0
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(prompt) + self._prefix_tokens[prompt_type]
+        if output_tokens is None:
+            if text is None and outcome == "ok":
+                try:
+                    text = response.text
+                except Exception:
+                    text = None
+            output_tokens = estimate_tokens(text or "")
+        metrics.record_llm_call(prompt_type, time.perf_counter() - started, outcome, prompt_tokens, output_tokens, model=model_name)
+
+    def _record_prefix(self, prompt_type: str) -> None:
+        stats = self.prefix_stats[prompt_type]
+        stats["calls"] += 1
+        stats["stable_prefix_tokens"] += self._prefix_tokens[prompt_type]
+
+    def get_prefix_stats(self) -> Dict[str, Any]:
+        """Get per-prompt-type counts of system-instruction tokens sent, and of
+        prompt tokens Gemini reported serving from its implicit cache."""
+        
+        return {
+            "total_stable_prefix_tokens": sum(stats["stable_prefix_tokens"] for stats in self.prefix_stats.values()),
+            "total_cached_tokens": sum(stats["cached_tokens"] for stats in self.prefix_stats.values()),
+            "prompt_types": {
+                prompt_type: {**stats, "prefix_tokens": self._prefix_tokens[prompt_type]}
+                for prompt_type, stats in self.prefix_stats.items()
+            },
+        }
+
+    def get_model_stats(self) -> Dict[str, Any]:
+        """Get the circuit breaker state of each model in the fallback chain."""
+        
+        return {
+            model_name: {
+                "state": breaker.state,
+                "consecutive_failures": breaker.failures,
+                "retry_after": round(breaker.retry_after(), 1),
+            }
+            for model_name, breaker in self.breakers.items()
+        }
+
+    @metrics.timed("prompt_build")
+    def _build_chat_prompt(
         self, 
+        message: str, 
         character: Optional[Dict[str, Any]], 
         game_session: Optional[Dict[str, Any]], 
-        chat_history: List[Dict[str, Any]]
-    ) -> str:
-        """Build context string from character and session data."""
+        chat_history: List[Dict[str, Any]],
+        combined: bool = False,
+        summary: Optional[str] = None
+    ) -> tuple:
+        """Build the full DM prompt for a player message within the token budget.
         
-        context_parts = []
+        Returns (prompt, report), where the report lists the estimated tokens of
+        every section and which ones were truncated or dropped. Context is
+        admitted in priority order: player message, scene, character, rules
+        for what the player mentions, story summary, recent history, then
+        session notes. The system prompt is not part of the text; it is the
+        chat models' system instruction.
         
-        if character:
-            context_parts.append(f"Character: {character.get('name', 'Unknown')} - Level {character.get('level', 1)} {character.get('race', '')} {character.get('class', '')}")
-            if character.get('backstory'):
-                context_parts.append(f"Background: {character['backstory'][:200]}...")
+        With combined=True the prompt is meant for the "combined" model, whose
+        instructions ask for narration and suggestions as one JSON object.
+        """
+        
+        prompt_type = "combined" if combined else "chat"
+        builder = PromptBuilder(self.prompt_token_budget)
         
         if game_session:
-            if game_session.get('name'):
-                context_parts.append(f"Session: {game_session['name']}")
-            if game_session.get('currentScene'):
-                context_parts.append(f"Current Scene: {game_session['currentScene']}")
-            if game_session.get('notes'):
-                context_parts.append(f"Notes: {game_session['notes'][-300:]}...")
-        
-        return " | ".join(context_parts) if context_parts else "New adventure beginning"
\ No newline at end of file
+            builder.add("scene", self._scene_text(game_session), priority=1, keep="start")
+        
+        if character:
+            builder.add(
+                "character",
+                f"Character: {character.get('name', 'Unknown')} - Level {character.get('level', 1)} {character.get('race', '')} {character.get('class', '')}",
+                priority=2
+            )
+            builder.add(
+                "background",
+                f"Background: {character['backstory']}" if character.get('backstory') else None,
+                priority=2,
+                keep="start",
+                max_tokens=self.BACKGROUND_MAX_TOKENS
+            )
+        
+        if game_session and game_session.get('notes'):
+            builder.add("notes", f"Notes: {game_session['notes']}", priority=6, keep="end", max_tokens=self.NOTES_MAX_TOKENS)
+        
+        if not character and not game_session:
+            builder.add("scene", "Context: New adventure beginning", priority=1)
+        
+        self._add_history(builder, summary, chat_history)
+        rules_names = self._add_rules(builder, message)
+        
+        builder.add("message", f"Player message: {message}\n\nRespond as the Dungeon Master:", priority=0, required=True)
+        
+        prompt, report = builder.build()
+        report["prefix_tokens"] = self._prefix_tokens[prompt_type]
+        report["rules"] = rules_names if "rules" not in report["dropped"] else []
+        return prompt, report
+
+    def _build_party_prompt(
+        self,
+        actions: List[Dict[str, Any]],
+        resolutions: Dict[str, Dict[str, Any]],
+        game_session: Optional[Dict[str, Any]],
+        chat_history: List[Dict[str, Any]],
+        summary: Optional[str] = None
+    ) -> tuple:
+        """Build the prompt for one party round within the token budget.
+        
+        Same context as a chat prompt, except that the required section lists
+        every player's action (with its roll results, if already resolved)
+        instead of a single player message. Returns (prompt, report).
+        """
+        
+        builder = PromptBuilder(self.prompt_token_budget)
+        builder.add("scene", self._scene_text(game_session) if game_session else "Context: New adventure beginning", priority=1, keep="start")
+        if game_session and game_session.get('notes'):
+            builder.add("notes", f"Notes: {game_session['notes']}", priority=6, keep="end", max_tokens=self.NOTES_MAX_TOKENS)
+        self._add_history(builder, summary, chat_history)
+        rules_names = self._add_rules(builder, "\n".join(action["message"] for action in actions))
+        
+        lines = []
+        for action in actions:
+            character = action.get("character") or {}
+            who = character.get("name") or action["player_id"]
+            if character:
+                details = [f"Level {character.get('level', 1)}", character.get('race'), character.get('class')]
+                who += f" ({' '.join(str(detail) for detail in details if detail)})"
+            lines.append(f"- [{action['player_id']}] {who}: {action['message']}")
+            local = resolutions.get(action["player_id"])
+            if local:
+                lines.append(f"  Already rolled: {local['message'].replace('**', '')}")
+        builder.add("actions", "Player actions this round:\n" + "\n".join(lines) + "\n\nResolve the round as the Dungeon Master:", priority=0, required=True)
+        
+        prompt, report = builder.build()
+        report["prefix_tokens"] = self._prefix_tokens["party"]
+        report["rules"] = rules_names if "rules" not in report["dropped"] else []
+        return prompt, report
+
+    def _scene_text(self, game_session: Dict[str, Any]) -> str:
+        scene_parts = []
+        if game_session.get('name'):
+            scene_parts.append(f"Session: {game_session['name']}")
+        if game_session.get('currentScene'):
+            scene_parts.append(f"Current Scene: {game_session['currentScene']}")
+        return " | ".join(scene_parts)
+
+    def _add_history(self, builder: PromptBuilder, summary: Optional[str], chat_history: List[Dict[str, Any]]) -> None:
+        """Add the story summary and the recent conversation sections."""
+        
+        builder.add("summary", f"Story so far: {summary}" if summary else None, priority=4, keep="end")
+        
+        history = []
+        for msg in chat_history:
+            if msg.get('type') == 'player':
+                history.append(f"Player: {msg.get('content', '')}")
+            elif msg.get('type') == 'dm':
+                history.append(f"DM: {msg.get('content', '')}")
+        builder.add_items("history", "Recent conversation:", history, priority=5)
+
+    def _add_rules(self, builder: PromptBuilder, text: str) -> List[str]:
+        """Add SRD rules for what `text` mentions; returns the entries' names."""
+        
+        if self.rules_index is None or self.rules_token_budget <= 0:
+            return []
+        rules_text, rules_names = self.rules_index.context_for(text, self.rules_token_budget, self.rules_max_entries)
+        builder.add("rules", rules_text, priority=3, keep="start", max_tokens=self.rules_token_budget)
+        return rules_names
+
+    def _usage_report(self, prompt_report: Dict[str, Any], response: Any = None) -> Dict[str, Any]:
+        """Combine the prompt budget report with Gemini's reported token usage."""
+        
+        usage = {
+            "prompt_tokens_estimated": prompt_report["total_tokens"],
+            "prompt_budget": prompt_report["budget"],
+            "sections": prompt_report["sections"],
+            "truncated": prompt_report["truncated"],
+            "dropped": prompt_report["dropped"],
+            "stable_prefix_tokens": prompt_report["prefix_tokens"],
+            "rules": prompt_report["rules"],
+        }
+        metadata = getattr(response, "usage_metadata", None)
+        if metadata is not None:
+            usage["prompt_tokens"] = getattr(metadata, "prompt_token_count", None)
+            usage["output_tokens"] = getattr(metadata, "candidates_token_count", None)
+            usage["cached_tokens"] = getattr(metadata, "cached_content_token_count", None)
+        return usage
+
+    def _build_encounter_prompt(self, party_level: int, party_size: int) -> str:
+        """Build the encounter generation prompt."""
+        
+        return f"Generate a random D&D 5E encounter for a party of {party_size} characters at level {party_level}."
+
+    def _build_flavor_prompt(self, party_level: int, party_size: int, encounter: Dict[str, Any]) -> str:
+        """Build the prompt that asks for flavor text around a fixed set of monsters."""
+        
+        monsters = ", ".join(
+            f"{m['count']} x {m['name']} (CR {m['challenge_rating']})" for m in encounter["monsters"]
+        )
+        return f"""Write the flavor for a {encounter['difficulty']} encounter for a party of {party_size} characters at level {party_level}.
+Monsters: {monsters}"""
+
+    def _parse_encounter(self, text: str) -> Dict[str, Any]:
+        """Parse the model's encounter JSON, falling back to a generic encounter."""
+        
+        # Try to parse the JSON response
+        try:
+            encounter_data = json.loads(text)
+        except json.JSONDecodeError as je:
+            log.warning("JSON parsing failed: %s", je)
+            log.warning("Raw response: %s", text)
+            # If JSON parsing fails, create a fallback response
+            encounter_data = {
+                "description": text,
+                "monsters": [{"name": "Unknown", "challenge_rating": "1"}],
+                "difficulty": "medium",
+                "setting": "Unknown location",
+                "tactics": "The monsters fight to the death"
+            }
+        
+        return {
+            "description": encounter_data.get("description", "A mysterious encounter awaits..."),
+            "monsters": encounter_data.get("monsters", []),
+            "difficulty": encounter_data.get("difficulty", "medium"),
+            "setting": encounter_data.get("setting", "Unknown location"),
+            "tactics": encounter_data.get("tactics", "The monsters fight to the death")
+        }
+
+    def _build_suggestions_prompt(
+        self, 
+        player_message: str, 
+        character: Optional[Dict[str, Any]], 
+        dm_response: str
+    ) -> str:
+        """Build the action suggestion prompt."""
+        
+        return f"""Player said: "{player_message}"
+DM responded: "{dm_response}"
+Character class: {character.get('class', 'Unknown') if character else 'Unknown'}"""
+
+    def _suggestions_cache_key(
+        self,
+        player_message: str,
+        dm_response: str,
+        character: Optional[Dict[str, Any]],
+        game_session: Optional[Dict[str, Any]]
+    ) -> str:
+        """Cache key for suggestions: the session, character class and current
+        scene, plus a hash of the normalized player message and DM reply.
+        
+        Only the same turn in the same session (e.g. a retried request) gets
+        the same suggestions back; without a scene nothing is cached ("").
+        """
+        
+        scene = normalize_prompt(str((game_session or {}).get('currentScene') or ""))
+        if not scene:
+            return ""
+        class_name = normalize_prompt(str((character or {}).get('class') or "unknown"))
+        turn = hashlib.blake2b(
+            f"{normalize_prompt(player_message)}\n{normalize_prompt(dm_response)}".encode("utf-8"), digest_size=16
+        ).hexdigest()
+        return f"session: {current_session.get()}\nclass: {class_name}\nscene: {scene}\nturn: {turn}"
+
+    def _parse_suggestions(self, response: Any) -> List[str]:
+        """Parse a suggestions response, falling back to default suggestions."""
+        
+        if response and response.text:
+            suggestions = self._clean_suggestions(self._extract_json(response.text))
+            if suggestions:
+                return suggestions
+        
+        # Return default suggestions if parsing fails
+        return ["Investigate", "Attack", "Negotiate"]
+
+    def _parse_combined_response(self, response: Any) -> Optional[tuple]:
+        """Parse a combined narration + suggestions response.
+        
+        Returns (narration, suggestions), with suggestions None when only the
+        narration was usable, or None when the narration itself could not be
+        recovered.
+        """
+        
+        if not response or not response.text:
+            return None
+        
+        data = self._extract_json(response.text)
+        if not isinstance(data, dict):
+            return None
+        
+        narration = data.get("narration")
+        if not isinstance(narration, str) or not narration.strip():
+            return None
+        
+        return narration.strip(), self._clean_suggestions(data.get("suggestions"))
+
+    def _parse_party_response(self, response: Any) -> tuple:
+        """Parse a party-turn response into (narration, {player_id: {"narration", "suggestions"}}).
+        
+        Unparseable text is kept as the shared narration; narration is None
+        only when the response is empty.
+        """
+        
+        if not response or not response.text or not response.text.strip():
+            return None, {}
+        
+        data = self._extract_json(response.text)
+        if not isinstance(data, dict):
+            return response.text.strip(), {}
+        
+        players = {}
+        for entry in data.get("players") or []:
+            if isinstance(entry, dict) and entry.get("player_id") is not None:
+                narration = entry.get("narration")
+                players[str(entry["player_id"])] = {
+                    "narration": narration.strip() if isinstance(narration, str) else "",
+                    "suggestions": self._clean_suggestions(entry.get("suggestions")),
+                }
+        narration = data.get("narration")
+        return (narration.strip() if isinstance(narration, str) else ""), players
+
+    def _clean_suggestions(self, suggestions: Any) -> Optional[List[str]]:
+        """Validate a parsed suggestion list, returning at most 3 non-empty strings."""
+        
+        if not isinstance(suggestions, list):
+            return None
+        cleaned = [s.strip() for s in suggestions if isinstance(s, str) and s.strip()]
+        return cleaned[:3] or None  # Ensure we only return 3 suggestions
+
+    def _extract_json(self, text: str) -> Any:
+        """Parse JSON from model output, tolerating code fences and surrounding prose."""
+        
+        text = text.strip()
+        if text.startswith("```"):
+            text = text.split("\n", 1)[1] if "\n" in text else ""
+            text = text.rsplit("```", 1)[0].strip()
+        
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+        
+        # Fall back to the outermost object or array embedded in the text
+        for opener, closer in (("{", "}"), ("[", "]")):
+            start, end = text.find(opener), text.rfind(closer)
+            if start != -1 and end > start:
+                try:
+                    return json.loads(text[start:end + 1])
+                except json.JSONDecodeError:
+                    continue
+        return None
@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the AI Dungeon Master API.
+
+Runs server.app under uvicorn against a fake Gemini model (configurable
+latency and token rate) and a local stand-in for dnd5eapi.co, drives the
+chat, encounter and lookup endpoints at a given concurrency, and reports
+startup time (import, listening, ready), p50/p95/p99 latency, requests per
+second and upstream call counts.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --concurrency 32 --requests 500 --llm-latency 0.8
+    python benchmark.py --scenarios chat,stream --tokens-per-second 40 --json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+SCENARIOS = ["chat", "stream", "encounter", "lookup", "roll"]
+DEFAULT_SCENARIOS = ["chat", "encounter", "lookup"]
+
+NARRATION_WORDS = (
+    "The torchlight flickers across the damp stone as distant footsteps echo "
+    "through the corridor and something stirs in the shadows ahead"
+).split()
+
+
+# ---------------------------------------------------------------------------
+# Fake Gemini model
+# ---------------------------------------------------------------------------
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage: Optional[FakeUsage] = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeTokenCount:
+    def __init__(self, total_tokens: int):
+        self.total_tokens = total_tokens
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel that answers locally.
+
+    Each call waits `latency` seconds (time to first token), then produces its
+    reply at `tokens_per_second`. Replies are shaped after the system
+    instruction, so every prompt type in ai_dm.py parses as it would with the
+    real API. Call and token counts are kept on the class.
+    """
+
+    latency = 0.3
+    tokens_per_second = 80.0
+    output_tokens = 120
+    stats: Dict[str, int] = {"calls": 0, "prompt_tokens": 0, "output_tokens": 0}
+    _lock = threading.Lock()
+
+    def __init__(self, model_name: str = "gemini-1.5-flash", system_instruction: Optional[str] = None, **kwargs):
+        self.model_name = model_name
+        self.system_instruction = system_instruction or ""
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        with cls._lock:
+            cls.stats = {"calls": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+    def _narration(self) -> str:
+        words = [NARRATION_WORDS[i % len(NARRATION_WORDS)] for i in range(int(self.output_tokens * 0.75))]
+        return " ".join(words).capitalize() + "."
+
+    def _reply(self) -> str:
+        instruction = self.system_instruction
+        if '"narration"' in instruction:
+            return json.dumps({"narration": self._narration(), "suggestions": ["Listen", "Advance", "Hide"]})
+        if "JSON array" in instruction:
+            return json.dumps(["Listen", "Advance", "Hide"])
+        if "running summary" in instruction:
+            return "The party entered the dungeon and is following the footsteps."
+        if "flavor text" in instruction:
+            return json.dumps({
+                "description": self._narration(),
+                "setting": "A flooded crypt",
+                "tactics": "They wait in the water and strike from behind",
+            })
+        if "random D&D 5E encounters" in instruction:
+            return json.dumps({
+                "description": self._narration(),
+                "monsters": [{"name": "Goblin", "challenge_rating": "1/4"}],
+                "difficulty": "easy",
+                "setting": "A forest path",
+                "tactics": "Ambush from the trees",
+            })
+        return self._narration()
+
+    def _record(self, prompt: Any, text: str) -> FakeUsage:
+        usage = FakeUsage(len(str(prompt)) // 4, len(text) // 4)
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["prompt_tokens"] += usage.prompt_token_count
+            self.stats["output_tokens"] += usage.candidates_token_count
+        return usage
+
+    def _duration(self, text: str) -> float:
+        return self.latency + (len(text) // 4) / self.tokens_per_second
+
+    def generate_content(self, prompt: Any, **kwargs) -> FakeResponse:
+        text = self._reply()
+        time.sleep(self._duration(text))
+        return FakeResponse(text, self._record(prompt, text))
+
+    async def generate_content_async(self, prompt: Any, stream: bool = False, **kwargs):
+        text = self._reply()
+        usage = self._record(prompt, text)
+        if not stream:
+            await asyncio.sleep(self._duration(text))
+            return FakeResponse(text, usage)
+
+        await asyncio.sleep(self.latency)
+        return self._stream(text)
+
+    async def _stream(self, text: str):
+        # Chunks of roughly 8 tokens, paced at the configured token rate
+        step = 32
+        for start in range(0, len(text), step):
+            chunk = text[start:start + step]
+            await asyncio.sleep((len(chunk) // 4) / self.tokens_per_second)
+            yield FakeResponse(chunk)
+
+    def count_tokens(self, contents: Any) -> FakeTokenCount:
+        return FakeTokenCount(len(str(contents)) // 4)
+
+
+# ---------------------------------------------------------------------------
+# Local dnd5eapi.co stand-in
+# ---------------------------------------------------------------------------
+
+MONSTER_TYPES = ["humanoid", "beast", "undead", "fiend", "dragon", "monstrosity"]
+SIZES = ["Small", "Medium", "Large", "Huge"]
+CHALLENGE_RATINGS = [0, 0.125, 0.25, 0.5] + list(range(1, 21))
+SCHOOLS = ["evocation", "abjuration", "necromancy", "illusion", "conjuration"]
+CLASSES = ["wizard", "cleric", "druid", "sorcerer", "bard"]
+
+
+def build_srd_fixture(monsters: int = 120, spells: int = 80) -> Dict[str, Any]:
+    """Synthetic SRD data, keyed by API path (without the /api prefix)."""
+    data: Dict[str, Any] = {}
+
+    def add_category(category: str, details: List[Dict[str, Any]]) -> None:
+        data[category] = {
+            "count": len(details),
+            "results": [{"index": d["index"], "name": d["name"], "url": f"/api/{category}/{d['index']}"} for d in details],
+        }
+        for d in details:
+            data[f"{category}/{d['index']}"] = d
+
+    add_category("monsters", [
+        {
+            "index": f"monster-{i}",
+            "name": f"{MONSTER_TYPES[i % len(MONSTER_TYPES)].title()} {i}",
+            "challenge_rating": CHALLENGE_RATINGS[i % len(CHALLENGE_RATINGS)],
+            "type": MONSTER_TYPES[i % len(MONSTER_TYPES)],
+            "size": SIZES[i % len(SIZES)],
+            "hit_points": 10 + i,
+            "armor_class": [{"type": "natural", "value": 10 + i % 10}],
+        }
+        for i in range(monsters)
+    ])
+    add_category("spells", [
+        {
+            "index": f"spell-{i}",
+            "name": f"{SCHOOLS[i % len(SCHOOLS)].title()} Spell {i}",
+            "level": i % 10,
+            "school": {"index": SCHOOLS[i % len(SCHOOLS)], "name": SCHOOLS[i % len(SCHOOLS)].title()},
+            "classes": [{"index": CLASSES[i % len(CLASSES)], "name": CLASSES[i % len(CLASSES)].title()}],
+            "desc": ["A benchmark spell."],
+        }
+        for i in range(spells)
+    ])
+    add_category("equipment", [
+        {"index": f"item-{i}", "name": f"Item {i}", "equipment_category": {"index": "adventuring-gear"}}
+        for i in range(40)
+    ])
+    add_category("classes", [{"index": c, "name": c.title()} for c in CLASSES])
+    add_category("races", [{"index": r, "name": r.title()} for r in ["human", "elf", "dwarf", "halfling"]])
+    return data
+
+
+class SRDStandIn:
+    """Minimal dnd5eapi.co over local HTTP, with ETags and a request counter."""
+
+    def __init__(self, data: Dict[str, Any], latency: float = 0.0):
+        self.data = data
+        self.latency = latency
+        self.requests = 0
+        self.not_modified = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        payload = self.data.get(request.match_info["path"].strip("/"))
+        if payload is None:
+            return web.json_response({"error": "Not found"}, status=404)
+        etag = '"srd-v1"'
+        if request.headers.get("If-None-Match") == etag:
+            self.not_modified += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response(payload, headers={"ETag": etag})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/api/{path:.*}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        port = free_port()
+        await web.TCPSite(self._runner, "127.0.0.1", port).start()
+        self.url = f"http://127.0.0.1:{port}/api"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+
+# ---------------------------------------------------------------------------
+# Server under test
+# ---------------------------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerThread:
+    """Runs server.app under uvicorn in a background thread with its own event loop."""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.url = f"http://127.0.0.1:{port}"
+
+    def start(self, timeout: float = 30.0) -> None:
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise Exception("Benchmark server failed to start")
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def load_server(srd_url: str, cache_dir: str, srd_warmup: str = "", encounter_pool: int = 0):
+    """Import server.py and wire it to the fakes before it starts its services."""
+    os.environ["SRD_API_URL"] = srd_url
+    os.environ["SRD_CACHE_DIR"] = cache_dir
+    os.environ["SRD_WARMUP"] = srd_warmup
+    os.environ["DM_ENCOUNTER_POOL_SIZE"] = str(encounter_pool)
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    import server
+    # Imported after server so its import time is measured as in production
+    import google.generativeai as genai
+    genai.GenerativeModel = FakeGenerativeModel
+    return server
+
+
+async def wait_until_ready(base_url: str, timeout: float = 30.0) -> Dict[str, Any]:
+    """Poll /ready until the server reports ready, returning its startup report."""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            async with session.get(f"{base_url}/ready") as response:
+                report = await response.json()
+                if response.status == 200:
+                    return report
+            if time.monotonic() > deadline:
+                raise Exception(f"Server did not become ready: {report}")
+            await asyncio.sleep(0.01)
+
+
+# ---------------------------------------------------------------------------
+# Scenarios
+# ---------------------------------------------------------------------------
+
+# A request is (method, path, JSON body or None)
+Request = Tuple[str, str, Optional[Dict[str, Any]]]
+
+CHAT_MESSAGES = [
+    "I open the door slowly",
+    "I search the room for traps",
+    "I ask the innkeeper about the missing caravan",
+    "I cast detect magic",
+    "I attack the goblin with my longsword",
+]
+
+
+# Shaped like the frontend's CharacterSheet and GameControls state, so chat
+# prompts carry the same scene, backstory and notes as real ones
+CHAT_CHARACTER = {
+    "name": "Mira", "race": "Elf", "class": "Wizard", "level": 3, "background": "Sage", "alignment": "Neutral Good",
+    "strength": 8, "dexterity": 14, "constitution": 12, "intelligence": 17, "wisdom": 13, "charisma": 10,
+    "hitPoints": 17, "armorClass": 12, "speed": 30, "proficiencyBonus": 2,
+    "skills": ["Arcana", "History", "Investigation"],
+    "equipment": "quarterstaff, component pouch, spellbook, scholar's pack",
+    "backstory": (
+        "Mira spent decades as an archivist in the Candlekeep library before a forbidden map led her south. "
+        "She is searching for her missing mentor, who vanished while studying the drowned temples of the old empire, "
+        "and trusts books more than people."
+    ),
+}
+CHAT_GAME_SESSION = {
+    "name": "The Drowned Temples",
+    "players": ["Mira", "Tobin", "Kara"],
+    "currentScene": "The Sunken Crypt: a flooded burial hall lit by glowing fungus, its far door sealed with old wards",
+    "notes": "The party owes the harbor guild a favor. Tobin is poisoned. The cultists are looking for the same map.",
+    "initiative": [],
+    "isActive": True,
+}
+
+
+def chat_request(i: int, sessions: List[str], stream: bool = False) -> Request:
+    path = "/api/chat/stream" if stream else "/api/chat"
+    return "POST", path, {
+        "message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)],
+        "session_id": sessions[i % len(sessions)],
+        "character": CHAT_CHARACTER,
+        "game_session": CHAT_GAME_SESSION,
+    }
+
+
+def encounter_request(i: int, sessions: List[str]) -> Request:
+    return "POST", "/api/random-encounter", {"party_level": 1 + i % 20, "party_size": 3 + i % 4}
+
+
+def lookup_request(i: int, sessions: List[str]) -> Request:
+    choice = i % 4
+    if choice == 0:
+        return "GET", f"/api/spells/spell-{i % 80}", None
+    if choice == 1:
+        return "GET", f"/api/monsters/monster-{i % 120}", None
+    if choice == 2:
+        return "GET", "/api/monsters", None
+    return "GET", f"/api/search?q={random.choice(['spell', 'undead', 'dragn', 'item 1'])}", None
+
+
+def roll_request(i: int, sessions: List[str]) -> Request:
+    return "POST", "/api/roll", {"notation": random.choice(["1d20+5", "4d6kh3", "2d6!+3", "1d20 adv"]), "target": 12}
+
+
+# make_request(i, session_ids) -> the i-th request of a scenario
+SCENARIO_REQUESTS: Dict[str, Callable[[int, List[str]], Request]] = {
+    "chat": chat_request,
+    "stream": lambda i, sessions: chat_request(i, sessions, stream=True),
+    "encounter": encounter_request,
+    "lookup": lookup_request,
+    "roll": roll_request,
+}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+async def run_scenario(
+    name: str,
+    base_url: str,
+    srd: SRDStandIn,
+    total: int,
+    concurrency: int,
+    sessions: int
+) -> Dict[str, Any]:
+    """Send `total` requests for a scenario, `concurrency` at a time, and summarize them."""
+    make_request = SCENARIO_REQUESTS[name]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(total))
+
+    FakeGenerativeModel.reset_stats()
+    srd_before = srd.requests
+
+    async def worker(session: aiohttp.ClientSession) -> None:
+        for i in counter:
+            method, path, body = make_request(i, session_ids)
+            started = time.perf_counter()
+            try:
+                async with session.request(method, base_url + path, json=body) as response:
+                    await response.read()
+                    status = response.status
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as session:
+        # Chat sessions are created by the server, like the frontend does
+        session_ids = []
+        for _ in range(sessions):
+            async with session.post(base_url + "/api/sessions", json={}) as response:
+                session_ids.append((await response.json())["session_id"])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "scenario": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0,
+        "llm_calls": FakeGenerativeModel.stats["calls"],
+        "llm_output_tokens": FakeGenerativeModel.stats["output_tokens"],
+        "srd_requests": srd.requests - srd_before,
+    }
+
+
+def print_report(startup: Dict[str, Any], results: List[Dict[str, Any]]) -> None:
+    print("startup: " + "  ".join(f"{key}={value}" for key, value in startup.items()))
+    columns = ["scenario", "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms", "max_ms", "llm_calls", "srd_requests"]
+    rows = [[str(sum(r[c].values())) if c == "errors" else str(r[c]) for c in columns] for r in results]
+    widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+    for r in results:
+        if r["errors"]:
+            print(f"[WARNING] {r['scenario']}: errors by status {r['errors']}")
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    FakeGenerativeModel.latency = args.llm_latency
+    FakeGenerativeModel.tokens_per_second = args.tokens_per_second
+    FakeGenerativeModel.output_tokens = args.output_tokens
+
+    srd = SRDStandIn(build_srd_fixture(), latency=args.srd_latency)
+    srd_url = await srd.start()
+
+    with tempfile.TemporaryDirectory(prefix="dm-bench-") as cache_dir:
+        started = time.perf_counter()
+        server = load_server(srd_url, cache_dir, args.srd_warmup, args.encounter_pool)
+        imported = time.perf_counter()
+        server_thread = ServerThread(server.app, free_port())
+        server_thread.start()
+        listening = time.perf_counter()
+        try:
+            report = await wait_until_ready(server_thread.url)
+            startup = {
+                "import_ms": round((imported - started) * 1000, 1),
+                "listening_ms": round((listening - started) * 1000, 1),
+                "ready_ms": round((time.perf_counter() - started) * 1000, 1),
+                "ai_dm_init_ms": round((report.get("ai_dm_init_seconds") or 0) * 1000, 1),
+                "srd_warmup": report.get("warmup"),
+            }
+            print(f"[INFO] startup: listening after {startup['listening_ms']} ms, ready after {startup['ready_ms']} ms", file=sys.stderr)
+
+            results = []
+            for name in args.scenarios:
+                if args.warmup:
+                    await run_scenario(name, server_thread.url, srd, args.warmup, args.concurrency, args.sessions)
+                results.append(await run_scenario(name, server_thread.url, srd, args.requests, args.concurrency, args.sessions))
+                print(f"[INFO] {name}: {results[-1]['rps']} req/s, p95 {results[-1]['p95_ms']} ms", file=sys.stderr)
+        finally:
+            server_thread.stop()
+            await srd.stop()
+    return {"startup": startup, "scenarios": results}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the AI Dungeon Master API offline")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help=f"Comma-separated scenarios to run, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=0, help="Unmeasured requests per scenario before measuring")
+    parser.add_argument("--sessions", type=int, default=8, help="Distinct chat sessions to spread chat requests over")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Fake model time to first token, in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="Fake model output token rate")
+    parser.add_argument("--output-tokens", type=int, default=120, help="Approximate tokens per fake narration")
+    parser.add_argument("--srd-latency", type=float, default=0.02, help="dnd5eapi stand-in latency, in seconds")
+    parser.add_argument("--srd-warmup", default="", choices=["", "lists", "full"],
+                        help="Server SRD cache warmup at startup (SRD_WARMUP)")
+    parser.add_argument("--encounter-pool", type=int, default=0,
+                        help="Pre-generated encounters per party bucket (DM_ENCOUNTER_POOL_SIZE); 0 measures live generation")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON instead of a table")
+    parser.add_argument("--verbose", action="store_true", help="Keep the server's own log output")
+    args = parser.parse_args(argv)
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    # The server logs every request with print(); keep it out of the report
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+    try:
+        report = asyncio.run(run_benchmark(args))
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report["startup"], report["scenarios"])
+    return 1 if any(r["errors"] for r in report["scenarios"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+import math
+import random
+import re
+from functools import lru_cache
+from itertools import combinations_with_replacement
+from typing import Dict, List, Any, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Batch rolls fall back to the random module
+    np = None
+
+MAX_DICE_PER_TERM = 100
+MAX_SIDES = 1000
+MAX_TERMS = 20
+MAX_BATCH = 100000
+
+# An exploding die re-rolls on its maximum at most this many times
+EXPLODE_DEPTH = 5
+
+# Upper bounds on the work spent computing an exact distribution: dice
+# multisets enumerated for keep/drop, and multiply-adds across convolutions
+# (within each term and into the running total of the whole expression)
+MAX_KEEP_OUTCOMES = 250000
+MAX_CONVOLUTION_STEPS = 2000000
+
+_TERM_PATTERN = re.compile(
+    r"([+-])\s*(?:(\d*)d(\d+|%)(!)?(?:(kh|kl|dh|dl|k)(\d+))?|(\d+))",
+    re.IGNORECASE
+)
+_ADVANTAGE_PATTERN = re.compile(r"\b(advantage|adv|disadvantage|dis)\b", re.IGNORECASE)
+
+
+class DiceTerm:
+    """One NdM term of a dice expression, e.g. "-4d6!kh3"."""
+
+    def __init__(self, count: int, sides: int, sign: int = 1, keep: Optional[Tuple[str, int]] = None, explode: bool = False):
+        self.count = count
+        self.sides = sides
+        self.sign = sign
+        self.keep = keep  # ("high" | "low", number of dice kept)
+        self.explode = explode
+
+    def kept_indices(self, values: List[int]) -> List[int]:
+        """Indices of the dice that count toward the total."""
+        if not self.keep:
+            return list(range(len(values)))
+        mode, n = self.keep
+        order = sorted(range(len(values)), key=lambda i: values[i], reverse=(mode == "high"))
+        return sorted(order[:n])
+
+    def roll_die(self, rng: random.Random) -> int:
+        value = rng.randint(1, self.sides)
+        total = value
+        depth = 0
+        while self.explode and value == self.sides and depth < EXPLODE_DEPTH:
+            value = rng.randint(1, self.sides)
+            total += value
+            depth += 1
+        return total
+
+    def die_distribution(self) -> Dict[int, float]:
+        """Outcome probabilities of a single (possibly exploding) die."""
+        p = 1 / self.sides
+        dist = {face: p for face in range(1, self.sides + 1)}
+        if not self.explode:
+            return dist
+        # Unroll the explosion from the deepest re-roll upward
+        for _ in range(EXPLODE_DEPTH):
+            exploded = {face: p for face in range(1, self.sides)}
+            for value, prob in dist.items():
+                exploded[self.sides + value] = exploded.get(self.sides + value, 0.0) + p * prob
+            dist = exploded
+        return dist
+
+    def convolution_steps(self) -> int:
+        """Number of multiply-adds needed to compute this term's distribution."""
+        faces = len(self.die_distribution())
+        if self.keep and self.keep[1] < self.count:
+            return 0  # Bounded separately by MAX_KEEP_OUTCOMES
+        return sum((k * (faces - 1) + 1) * faces for k in range(self.count))
+
+    def width(self) -> int:
+        """Upper bound on the number of distinct totals this term can produce."""
+        die = self.die_distribution()
+        kept = self.keep[1] if self.keep else self.count
+        return kept * (max(die) - min(die)) + 1
+
+    def distribution(self) -> Dict[int, float]:
+        """Outcome probabilities of the whole term, sign included."""
+        die = self.die_distribution()
+        if self.keep and self.keep[1] < self.count:
+            dist = _keep_distribution(die, self.count, self.keep)
+        else:
+            dist = {0: 1.0}
+            for _ in range(self.count):
+                dist = convolve(dist, die)
+        if self.sign < 0:
+            dist = {-value: prob for value, prob in dist.items()}
+        return dist
+
+    def __str__(self) -> str:
+        keep = ""
+        if self.keep:
+            keep = f"{'kh' if self.keep[0] == 'high' else 'kl'}{self.keep[1]}"
+        return f"{'-' if self.sign < 0 else '+'}{self.count}d{self.sides}{'!' if self.explode else ''}{keep}"
+
+
+def convolve(a: Dict[int, float], b: Dict[int, float]) -> Dict[int, float]:
+    """Distribution of the sum of two independent outcomes."""
+    result: Dict[int, float] = {}
+    for va, pa in a.items():
+        for vb, pb in b.items():
+            result[va + vb] = result.get(va + vb, 0.0) + pa * pb
+    return result
+
+
+def _keep_distribution(die: Dict[int, float], count: int, keep: Tuple[str, int]) -> Dict[int, float]:
+    """Exact distribution of the sum of the kept dice, by enumerating dice multisets."""
+    faces = sorted(die)
+    outcomes = math.comb(len(faces) + count - 1, count)
+    if outcomes > MAX_KEEP_OUTCOMES:
+        raise ValueError(f"Too many outcomes ({outcomes}) for an exact keep/drop distribution")
+
+    mode, n = keep
+    dist: Dict[int, float] = {}
+    for multiset in combinations_with_replacement(faces, count):
+        # Probability of this multiset in any order: multinomial coefficient x product of probabilities
+        prob = math.factorial(count)
+        for face in set(multiset):
+            prob /= math.factorial(multiset.count(face))
+        for face in multiset:
+            prob *= die[face]
+        kept = multiset[-n:] if mode == "high" else multiset[:n]
+        total = sum(kept)
+        dist[total] = dist.get(total, 0.0) + prob
+    return dist
+
+
+class DiceExpression:
+    """A parsed dice expression such as "4d6kh3", "2d20kl1+5" or "1d20+3 advantage".
+
+    Supports NdM terms (d% for d100), keep/drop highest/lowest (kh, kl, dh,
+    dl, with k as shorthand for kh), exploding dice (!), constant modifiers,
+    and an "advantage"/"disadvantage" keyword that turns the first d20 into
+    2d20kh1 / 2d20kl1.
+    """
+
+    def __init__(self, notation: str, terms: List[DiceTerm], modifier: int):
+        self.notation = notation
+        self.terms = terms
+        self.modifier = modifier
+        self._distribution: Optional[Dict[int, float]] = None
+
+    @classmethod
+    def parse(cls, notation: str) -> "DiceExpression":
+        """Parse dice notation, raising ValueError if it is malformed."""
+        text = notation.strip()
+        advantage = None
+        match = _ADVANTAGE_PATTERN.search(text)
+        if match:
+            advantage = "high" if match.group(1).lower().startswith("adv") else "low"
+            text = _ADVANTAGE_PATTERN.sub("", text)
+
+        text = re.sub(r"\s+", "", text)
+        if not text:
+            text = "1d20"
+        if text[0] not in "+-":
+            text = "+" + text
+
+        terms: List[DiceTerm] = []
+        modifier = 0
+        position = 0
+        for match in _TERM_PATTERN.finditer(text):
+            if match.start() != position:
+                break
+            position = match.end()
+            sign = -1 if match.group(1) == "-" else 1
+            if match.group(7) is not None:
+                modifier += sign * int(match.group(7))
+                continue
+
+            count = int(match.group(2) or 1)
+            sides = 100 if match.group(3) == "%" else int(match.group(3))
+            if not 1 <= count <= MAX_DICE_PER_TERM:
+                raise ValueError(f"Dice count must be between 1 and {MAX_DICE_PER_TERM}")
+            if not 2 <= sides <= MAX_SIDES:
+                raise ValueError(f"Dice must have between 2 and {MAX_SIDES} sides")
+
+            keep = None
+            if match.group(5):
+                op, n = match.group(5).lower(), int(match.group(6))
+                if op in ("dh", "dl"):
+                    keep = ("low" if op == "dh" else "high", count - n)
+                else:
+                    keep = ("low" if op == "kl" else "high", n)
+                if not 1 <= keep[1] <= count:
+                    raise ValueError(f"Cannot keep {keep[1]} of {count} dice in '{notation}'")
+            terms.append(DiceTerm(count, sides, sign, keep, explode=bool(match.group(4))))
+            if len(terms) > MAX_TERMS:
+                raise ValueError(f"At most {MAX_TERMS} dice terms are allowed")
+
+        if position != len(text):
+            raise ValueError(f"Invalid dice notation: '{notation}'")
+
+        if advantage:
+            for term in terms:
+                if term.sides == 20 and term.count == 1 and not term.keep:
+                    term.count, term.keep = 2, (advantage, 1)
+                    break
+            else:
+                raise ValueError(f"Advantage/disadvantage needs a single d20 in '{notation}'")
+
+        return cls(notation, terms, modifier)
+
+    def roll(self, rng: Optional[random.Random] = None) -> Dict[str, Any]:
+        """Roll once, returning the total and every die (marking dropped ones)."""
+        rng = rng or random
+        total = self.modifier
+        details = []
+        for term in self.terms:
+            values = [term.roll_die(rng) for _ in range(term.count)]
+            kept = term.kept_indices(values)
+            subtotal = sum(values[i] for i in kept)
+            total += term.sign * subtotal
+            details.append({
+                "term": str(term),
+                "rolls": values,
+                "kept": [values[i] for i in kept],
+                "subtotal": term.sign * subtotal,
+            })
+        return {"total": total, "terms": details, "modifier": self.modifier}
+
+    def roll_many(self, count: int, rng: Optional[random.Random] = None) -> List[int]:
+        """Roll `count` times and return only the totals (vectorized when numpy is available)."""
+        if not 1 <= count <= MAX_BATCH:
+            raise ValueError(f"Batch size must be between 1 and {MAX_BATCH}")
+        if np is not None and rng is None:
+            return self._roll_many_numpy(count)
+
+        rng = rng or random
+        totals = []
+        for _ in range(count):
+            total = self.modifier
+            for term in self.terms:
+                values = [term.roll_die(rng) for _ in range(term.count)]
+                total += term.sign * sum(values[i] for i in term.kept_indices(values))
+            totals.append(total)
+        return totals
+
+    def _roll_many_numpy(self, count: int) -> List[int]:
+        generator = np.random.default_rng()
+        totals = np.full(count, self.modifier, dtype=np.int64)
+        for term in self.terms:
+            values = generator.integers(1, term.sides + 1, size=(count, term.count))
+            if term.explode:
+                last = values
+                for _ in range(EXPLODE_DEPTH):
+                    exploding = last == term.sides
+                    if not exploding.any():
+                        break
+                    last = np.where(exploding, generator.integers(1, term.sides + 1, size=values.shape), 0)
+                    values = values + last
+            if term.keep:
+                values = np.sort(values, axis=1)
+                mode, n = term.keep
+                values = values[:, -n:] if mode == "high" else values[:, :n]
+            totals += term.sign * values.sum(axis=1)
+        return totals.tolist()
+
+    def distribution(self) -> Dict[int, float]:
+        """Exact outcome distribution of the whole expression (computed once)."""
+        if self._distribution is None:
+            steps = 0
+            width = 1
+            for term in self.terms:
+                # The term's own convolutions, then folding it into the running total
+                steps += term.convolution_steps() + width * term.width()
+                width += term.width() - 1
+            if steps > MAX_CONVOLUTION_STEPS:
+                raise ValueError(f"'{self.notation}' is too large for an exact distribution")
+            dist = {self.modifier: 1.0}
+            for term in self.terms:
+                dist = convolve(dist, term.distribution())
+            self._distribution = dict(sorted(dist.items()))
+        return self._distribution
+
+    def stats(self) -> Dict[str, Any]:
+        """Minimum, maximum, mean and standard deviation of the total."""
+        dist = self.distribution()
+        mean = sum(value * prob for value, prob in dist.items())
+        variance = sum((value - mean) ** 2 * prob for value, prob in dist.items())
+        return {
+            "min": min(dist),
+            "max": max(dist),
+            "mean": round(mean, 4),
+            "stddev": round(math.sqrt(variance), 4),
+        }
+
+    def probability_at_least(self, target: int) -> float:
+        """Probability that the total meets or beats a target (e.g. a DC or AC)."""
+        return sum(prob for value, prob in self.distribution().items() if value >= target)
+
+
+@lru_cache(maxsize=512)
+def parse(notation: str) -> DiceExpression:
+    """Parse dice notation, reusing previously parsed expressions."""
+    return DiceExpression.parse(notation)
+
+
+def roll(notation: str) -> Dict[str, Any]:
+    """Roll dice notation once."""
+    return parse(notation).roll()
+
+
+def probability_at_least(notation: str, target: int) -> float:
+    """Probability that a roll of `notation` totals at least `target`."""
+    return parse(notation).probability_at_least(target)
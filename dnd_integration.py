@@ -1,36 +1,192 @@
 import asyncio
+import os
+import random
+import time
 import aiohttp
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set
+
+import log
+import metrics
+from srd_cache import SRDCache
 
 class DnDIntegration:
-    def __init__(self):
-        self.base_url = "https://www.dnd5eapi.co/api"
+    def __init__(self, cache: Optional[SRDCache] = None):
+        self.base_url = os.getenv("SRD_API_URL", "https://www.dnd5eapi.co/api").rstrip("/")
         self.session = None
+        self.cache = cache or SRDCache()
+        self.fetch_concurrency = int(os.getenv("SRD_FETCH_CONCURRENCY", "10"))
+        # Connection pool for the shared session: total and per-host connection
+        # caps, how long idle keep-alive connections are kept, and a per-request timeout
+        self.pool_limit = int(os.getenv("SRD_POOL_LIMIT", "20"))
+        self.pool_limit_per_host = int(os.getenv("SRD_POOL_LIMIT_PER_HOST", "10"))
+        self.keepalive_timeout = float(os.getenv("SRD_KEEPALIVE_TIMEOUT", "60"))
+        self.request_timeout = float(os.getenv("SRD_REQUEST_TIMEOUT", "15"))
+        # Endpoint -> in-flight upstream fetch, shared by every concurrent caller
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.request_stats = {"upstream_requests": 0, "coalesced": 0}
+        # Background refreshes of stale entries; referenced here until they
+        # finish so they aren't garbage collected mid-flight
+        self._revalidations: Set[asyncio.Task] = set()
+        # Challenge rating -> full monster details, built once by build_cr_index()
+        self._monsters_by_cr: Optional[Dict[float, List[Dict[str, Any]]]] = None
+        self._cr_index_lock = asyncio.Lock()
 
     async def _get_session(self):
         """Get or create aiohttp session."""
         if self.session is None:
-            self.session = aiohttp.ClientSession()
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_limit,
+                limit_per_host=self.pool_limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                headers={"Accept": "application/json"}
+            )
         return self.session
 
     async def close(self):
-        """Close the aiohttp session."""
+        """Cancel background revalidations and close the aiohttp session."""
+        for task in list(self._revalidations):
+            task.cancel()
         if self.session:
             await self.session.close()
             self.session = None
 
+    @metrics.timed("srd_request")
     async def _make_request(self, endpoint: str) -> Dict[str, Any]:
-        """Make a request to the D&D 5E API."""
+        """Make a request to the D&D 5E API, served from the SRD cache when possible."""
+        entry, state = await self.cache.lookup(endpoint)
+
+        if state == "fresh":
+            metrics.SRD_REQUESTS.inc(result="fresh")
+            return entry["data"]
+
+        if state == "stale":
+            metrics.SRD_REQUESTS.inc(result="stale")
+            # Serve the stale copy now and refresh it in the background
+            self.cache.stats["stale_served"] += 1
+            if endpoint not in self._inflight:
+                task = asyncio.create_task(self._revalidate(endpoint, entry))
+                self._revalidations.add(task)
+                task.add_done_callback(self._revalidations.discard)
+            return entry["data"]
+
+        if self.cache.offline:
+            metrics.SRD_REQUESTS.inc(result="offline")
+            raise Exception(f"{endpoint} is not available in the offline SRD cache")
+
+        metrics.SRD_REQUESTS.inc(result="miss")
+        # shield() keeps one caller's cancellation from failing everyone sharing the fetch
+        return await asyncio.shield(self._shared_fetch(endpoint, entry))
+
+    def _shared_fetch(self, endpoint: str, entry: Optional[Dict[str, Any]]) -> asyncio.Future:
+        """Join the in-flight fetch for an endpoint, or start one (singleflight)."""
+        future = self._inflight.get(endpoint)
+        if future is not None:
+            self.request_stats["coalesced"] += 1
+            metrics.SRD_COALESCED.inc()
+            return future
+
+        future = asyncio.ensure_future(self._fetch(endpoint, entry))
+        self._inflight[endpoint] = future
+        future.add_done_callback(lambda f: self._finish_fetch(endpoint, f))
+        return future
+
+    def _finish_fetch(self, endpoint: str, future: asyncio.Future) -> None:
+        self._inflight.pop(endpoint, None)
+        # Mark the exception as retrieved in case every waiter was cancelled;
+        # callers still awaiting the future receive it as usual
+        if not future.cancelled():
+            future.exception()
+
+    async def _revalidate(self, endpoint: str, entry: Dict[str, Any]) -> None:
+        """Refresh a stale cache entry without failing the caller."""
+        try:
+            await self._shared_fetch(endpoint, entry)
+        except Exception as e:
+            log.warning("Background revalidation of %s failed: %s", endpoint, e)
+
+    async def _fetch(self, endpoint: str, entry: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Fetch an endpoint from upstream, revalidating an existing cache entry if given."""
         session = await self._get_session()
+        self.request_stats["upstream_requests"] += 1
+        started = time.perf_counter()
+        status = "error"
         
         try:
-            async with session.get(f"{self.base_url}/{endpoint}") as response:
+            async with session.get(
+                f"{self.base_url}/{endpoint}",
+                headers=self.cache.conditional_headers(entry)
+            ) as response:
+                status = str(response.status)
+                if response.status == 304 and entry is not None:
+                    self.cache.stats["revalidated"] += 1
+                    await self.cache.touch(endpoint, entry)
+                    return entry["data"]
                 if response.status == 200:
-                    return await response.json()
-                else:
-                    raise Exception(f"D&D API request failed with status {response.status}")
-        except aiohttp.ClientError as e:
-            raise Exception(f"Failed to connect to D&D API: {str(e)}")
+                    data = await response.json()
+                    if entry is not None:
+                        self.cache.stats["refreshed"] += 1
+                    await self.cache.set(
+                        endpoint,
+                        data,
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified")
+                    )
+                    return data
+                if response.status >= 500 and entry is not None:
+                    self.cache.stats["errors"] += 1
+                    log.warning("D&D API returned %s, serving expired cache entry for %s", response.status, endpoint)
+                    return entry["data"]
+                raise Exception(f"D&D API request failed with status {response.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.cache.stats["errors"] += 1
+            if entry is not None:
+                # An expired copy beats no answer while the upstream is unreachable
+                log.warning("D&D API unreachable, serving expired cache entry for %s", endpoint)
+                return entry["data"]
+            raise Exception(f"Failed to connect to D&D API: {str(e) or type(e).__name__}")
+        finally:
+            metrics.SRD_UPSTREAM_REQUESTS.inc(status=status)
+            metrics.SRD_UPSTREAM_SECONDS.observe(time.perf_counter() - started)
+
+    async def fetch_many(self, endpoints: List[str], concurrency: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Fetch several endpoints concurrently, at most `concurrency` at a time.
+
+        Endpoints that fail are logged and left out of the result.
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.fetch_concurrency)
+
+        async def fetch(endpoint: str):
+            async with semaphore:
+                try:
+                    return endpoint, await self._make_request(endpoint)
+                except Exception as e:
+                    log.warning("Failed to fetch %s: %s", endpoint, e)
+                    return endpoint, None
+
+        results = await asyncio.gather(*(fetch(endpoint) for endpoint in endpoints))
+        return {endpoint: data for endpoint, data in results if data is not None}
+
+    async def get_details_many(self, category: str, indexes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get details for several items of one category at once, keyed by index.
+
+        Cached items are served directly and misses are fetched concurrently;
+        items that can't be fetched are left out.
+        """
+        results = await self.fetch_many([f"{category}/{index}" for index in dict.fromkeys(indexes)])
+        return {index: results[f"{category}/{index}"] for index in indexes if f"{category}/{index}" in results}
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get SRD cache hit/miss counters and upstream request counts."""
+        return {**self.cache.get_stats(), **self.request_stats, "inflight": len(self._inflight)}
+
+    def save_snapshot(self, path: str) -> int:
+        """Save the current SRD cache to a snapshot file for offline use."""
+        return self.cache.save_snapshot(path)
 
     async def get_spells(self) -> List[Dict[str, Any]]:
         """Get list of all spells."""
@@ -123,31 +279,56 @@ class DnDIntegration:
         except Exception as e:
             raise Exception(f"Failed to search for {name} in {category}: {str(e)}")
 
+    async def build_cr_index(self) -> Dict[float, List[Dict[str, Any]]]:
+        """Prefetch every monster's details and group them by challenge rating.
+
+        Details are fetched concurrently through fetch_many() and land in the
+        SRD cache, so rebuilding after a restart is served from disk.
+        If some monsters could not be fetched, the partial index is returned
+        but not kept, so the next call retries the missing ones (the rest
+        come from the SRD cache).
+        """
+        if self._monsters_by_cr is not None:
+            return self._monsters_by_cr
+
+        async with self._cr_index_lock:
+            if self._monsters_by_cr is not None:
+                return self._monsters_by_cr
+
+            monsters = await self.get_monsters()
+            details = await self.fetch_many([f"monsters/{monster['index']}" for monster in monsters])
+
+            by_cr: Dict[float, List[Dict[str, Any]]] = {}
+            for monster in details.values():
+                if monster.get("challenge_rating") is not None:
+                    by_cr.setdefault(float(monster["challenge_rating"]), []).append(monster)
+
+            if len(details) < len(monsters):
+                log.warning("Challenge rating index is missing %s of %s monsters; will retry on next use", len(monsters) - len(details), len(monsters))
+                return by_cr
+
+            self._monsters_by_cr = by_cr
+            log.info("Built challenge rating index with %s monsters across %s CRs", len(details), len(by_cr))
+            return by_cr
+
+    async def get_monsters_by_cr(self, challenge_rating: float) -> List[Dict[str, Any]]:
+        """Get the details of every monster with a specific challenge rating."""
+        try:
+            by_cr = await self.build_cr_index()
+            return by_cr.get(float(challenge_rating), [])
+        except Exception as e:
+            raise Exception(f"Failed to get monsters for CR {challenge_rating}: {str(e)}")
+
+    async def get_challenge_ratings(self) -> List[float]:
+        """Get every challenge rating that has at least one monster, ascending."""
+        by_cr = await self.build_cr_index()
+        return sorted(by_cr)
+
     async def get_random_monsters_by_cr(self, challenge_rating: float, count: int = 1) -> List[Dict[str, Any]]:
         """Get random monsters of a specific challenge rating."""
         try:
-            # Get all monsters
-            monsters = await self.get_monsters()
-            
-            # Filter by challenge rating (this would need monster details to be accurate)
-            # For now, return random monsters from the list
-            import random
-            selected = random.sample(monsters, min(count, len(monsters)))
-            
-            # Get details for selected monsters
-            monster_details = []
-            for monster in selected:
-                try:
-                    details = await self.get_monster_details(monster["index"])
-                    if details.get("challenge_rating") == challenge_rating:
-                        monster_details.append(details)
-                except:
-                    continue
-                    
-                if len(monster_details) >= count:
-                    break
-            
-            return monster_details
+            candidates = await self.get_monsters_by_cr(challenge_rating)
+            return random.sample(candidates, min(count, len(candidates)))
         except Exception as e:
             raise Exception(f"Failed to get random monsters: {str(e)}")
 
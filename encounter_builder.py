@@ -0,0 +1,205 @@
+import os
+import random
+from collections import OrderedDict
+from fractions import Fraction
+from typing import Dict, List, Any, Optional, Tuple
+
+DIFFICULTIES = ["easy", "medium", "hard", "deadly"]
+
+# Per-character XP thresholds by character level (DMG p. 82)
+XP_THRESHOLDS: Dict[int, Tuple[int, int, int, int]] = {
+    1: (25, 50, 75, 100),
+    2: (50, 100, 150, 200),
+    3: (75, 150, 225, 400),
+    4: (125, 250, 375, 500),
+    5: (250, 500, 750, 1100),
+    6: (300, 600, 900, 1400),
+    7: (350, 750, 1100, 1700),
+    8: (450, 900, 1400, 2100),
+    9: (550, 1100, 1600, 2400),
+    10: (600, 1200, 1900, 2800),
+    11: (800, 1600, 2400, 3600),
+    12: (1000, 2000, 3000, 4500),
+    13: (1100, 2200, 3400, 5100),
+    14: (1250, 2500, 3800, 5700),
+    15: (1400, 2800, 4300, 6400),
+    16: (1600, 3200, 4800, 7200),
+    17: (2000, 3900, 5900, 8800),
+    18: (2100, 4200, 6300, 9500),
+    19: (2400, 4900, 7300, 10900),
+    20: (2800, 5700, 8500, 12700),
+}
+
+# Experience points by challenge rating (DMG p. 275)
+CR_XP: Dict[float, int] = {
+    0: 10, 0.125: 25, 0.25: 50, 0.5: 100,
+    1: 200, 2: 450, 3: 700, 4: 1100, 5: 1800, 6: 2300, 7: 2900, 8: 3900,
+    9: 5000, 10: 5900, 11: 7200, 12: 8400, 13: 10000, 14: 11500, 15: 13000,
+    16: 15000, 17: 18000, 18: 20000, 19: 22000, 20: 25000, 21: 33000,
+    22: 41000, 23: 50000, 24: 62000, 25: 75000, 26: 90000, 27: 105000,
+    28: 120000, 29: 135000, 30: 155000,
+}
+
+# Encounter multipliers (DMG p. 82), indexed by _multiplier_step()
+MULTIPLIER_STEPS = [0.5, 1, 1.5, 2, 2.5, 3, 4, 5]
+
+# Relative odds of each difficulty when the caller doesn't pick one
+DIFFICULTY_WEIGHTS = [2, 4, 3, 1]
+
+
+def format_cr(challenge_rating: float) -> str:
+    """Format a challenge rating the way the books do, e.g. 0.25 -> "1/4"."""
+    return str(Fraction(challenge_rating).limit_denominator(8))
+
+
+def _multiplier_step(monster_count: int) -> int:
+    if monster_count <= 1:
+        return 1
+    if monster_count == 2:
+        return 2
+    if monster_count <= 6:
+        return 3
+    if monster_count <= 10:
+        return 4
+    if monster_count <= 14:
+        return 5
+    return 6
+
+
+def encounter_multiplier(monster_count: int, party_size: int) -> float:
+    """Get the XP multiplier for a group of monsters, adjusted for party size."""
+    step = _multiplier_step(monster_count)
+    if party_size < 3:
+        step += 1
+    elif party_size >= 6:
+        step -= 1
+    return MULTIPLIER_STEPS[step]
+
+
+def party_thresholds(party_level: int, party_size: int) -> Dict[str, int]:
+    """Get the party's total XP threshold for each difficulty."""
+    per_character = XP_THRESHOLDS[max(1, min(20, party_level))]
+    return {difficulty: xp * party_size for difficulty, xp in zip(DIFFICULTIES, per_character)}
+
+
+def default_flavor(encounter: Dict[str, Any]) -> Dict[str, str]:
+    """Plain description, setting and tactics for an encounter, without the LLM."""
+    groups = [
+        f"{m['count']} {m['name']}{'s' if m['count'] > 1 and not m['name'].endswith('s') else ''}"
+        for m in encounter["monsters"]
+    ]
+    if len(groups) > 1:
+        roster = ", ".join(groups[:-1]) + f" and {groups[-1]}"
+    else:
+        roster = groups[0] if groups else "Unknown creatures"
+    verb = "blocks" if sum(m["count"] for m in encounter["monsters"]) == 1 else "block"
+    return {
+        "description": f"{roster} {verb} the party's path. ({encounter['difficulty'].title()} encounter, {encounter['adjusted_xp']} adjusted XP)",
+        "setting": "Unknown location",
+        "tactics": "The monsters fight to the death",
+    }
+
+
+class EncounterBuilder:
+    """Builds balanced encounters from the DMG XP budget rules.
+
+    Monster groups are chosen from the challenge ratings actually present in
+    the monster index. Candidate compositions for each (level, size,
+    difficulty) are enumerated once and memoized, so building an encounter
+    is a random pick plus a few dictionary lookups. Only the `max_cached`
+    most recently used party shapes are kept.
+    """
+
+    def __init__(self, monsters_by_cr: Dict[float, List[Dict[str, Any]]], max_monsters: int = 8, max_cached: Optional[int] = None):
+        self.monsters_by_cr = {cr: monsters for cr, monsters in monsters_by_cr.items() if monsters and cr in CR_XP}
+        self.challenge_ratings = sorted(self.monsters_by_cr)
+        self.max_monsters = max_monsters
+        self.max_cached = max_cached or int(os.getenv("DM_ENCOUNTER_CACHE_SIZE", "256"))
+        # (level, size, difficulty) -> compositions, least recently used first
+        self._candidates: "OrderedDict[Tuple[int, int, str], List[Tuple[Tuple[float, int], ...]]]" = OrderedDict()
+
+        if not self.challenge_ratings:
+            raise ValueError("EncounterBuilder needs at least one monster with a known challenge rating")
+
+    def build(self, party_level: int, party_size: int, difficulty: Optional[str] = None) -> Dict[str, Any]:
+        """Build one encounter; picks a weighted random difficulty when none is given."""
+        if difficulty is None:
+            difficulty = random.choices(DIFFICULTIES, weights=DIFFICULTY_WEIGHTS)[0]
+        if difficulty not in DIFFICULTIES:
+            raise ValueError(f"Unknown difficulty '{difficulty}', expected one of {DIFFICULTIES}")
+
+        party_level = max(1, min(20, party_level))
+        party_size = max(1, party_size)
+        composition = random.choice(self._compositions(party_level, party_size, difficulty))
+
+        monsters = []
+        total_xp = 0
+        monster_count = 0
+        for challenge_rating, count in composition:
+            monster = random.choice(self.monsters_by_cr[challenge_rating])
+            xp = CR_XP[challenge_rating]
+            monsters.append({
+                "name": monster.get("name", "Unknown"),
+                "index": monster.get("index"),
+                "challenge_rating": format_cr(challenge_rating),
+                "count": count,
+                "xp": xp,
+            })
+            total_xp += xp * count
+            monster_count += count
+
+        return {
+            "difficulty": difficulty,
+            "monsters": monsters,
+            "total_xp": total_xp,
+            "adjusted_xp": int(total_xp * encounter_multiplier(monster_count, party_size)),
+            "xp_thresholds": party_thresholds(party_level, party_size),
+        }
+
+    def _compositions(self, party_level: int, party_size: int, difficulty: str) -> List[Tuple[Tuple[float, int], ...]]:
+        """Enumerate (and memoize) monster groups whose adjusted XP fits the difficulty band."""
+        key = (party_level, party_size, difficulty)
+        cached = self._candidates.get(key)
+        if cached is not None:
+            self._candidates.move_to_end(key)
+            return cached
+
+        thresholds = party_thresholds(party_level, party_size)
+        position = DIFFICULTIES.index(difficulty)
+        low = thresholds[difficulty]
+        high = thresholds[DIFFICULTIES[position + 1]] if position + 1 < len(DIFFICULTIES) else int(low * 1.5)
+
+        in_band = []
+        below = []
+
+        def consider(composition: Tuple[Tuple[float, int], ...]) -> None:
+            count = sum(n for _, n in composition)
+            adjusted = sum(CR_XP[cr] * n for cr, n in composition) * encounter_multiplier(count, party_size)
+            if low <= adjusted < high:
+                in_band.append(composition)
+            elif adjusted < low:
+                below.append((adjusted, composition))
+
+        for count in range(1, self.max_monsters + 1):
+            for cr in self.challenge_ratings:
+                # A single type of monster
+                consider(((cr, count),))
+                # A leader backed by weaker minions
+                if count >= 3:
+                    for minion_cr in self.challenge_ratings:
+                        if minion_cr >= cr:
+                            break
+                        consider(((cr, 1), (minion_cr, count - 1)))
+
+        if not in_band:
+            # Nothing fits exactly (e.g. a sparse monster list): use the
+            # strongest groups that stay under the band
+            if not below:
+                raise ValueError(f"No monster group fits a {difficulty} encounter for {party_size} level-{party_level} characters")
+            best = max(adjusted for adjusted, _ in below)
+            in_band = [composition for adjusted, composition in below if adjusted == best]
+
+        self._candidates[key] = in_band
+        while len(self._candidates) > self.max_cached:
+            self._candidates.popitem(last=False)
+        return in_band
@@ -0,0 +1,45 @@
+import os
+
+# Log levels in increasing order of severity
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+# Messages below this level are skipped before they are formatted
+LOG_LEVEL = LEVELS.get(os.getenv("LOG_LEVEL", "INFO").upper(), LEVELS["INFO"])
+
+
+def set_level(level: str) -> None:
+    """Change the log level at runtime, e.g. set_level("DEBUG")."""
+    global LOG_LEVEL
+    if level.upper() not in LEVELS:
+        raise ValueError(f"Unknown log level '{level}', expected one of {list(LEVELS)}")
+    LOG_LEVEL = LEVELS[level.upper()]
+
+
+def is_enabled(level: str) -> bool:
+    return LEVELS[level] >= LOG_LEVEL
+
+
+def log(level: str, message: str, *args) -> None:
+    """Print a "[LEVEL] message" line if the level is enabled.
+
+    Arguments are %-formatted into the message only when it is printed, so
+    disabled debug logging costs a single comparison.
+    """
+    if LEVELS[level] >= LOG_LEVEL:
+        print(f"[{level}] {message % args if args else message}")
+
+
+def debug(message: str, *args) -> None:
+    log("DEBUG", message, *args)
+
+
+def info(message: str, *args) -> None:
+    log("INFO", message, *args)
+
+
+def warning(message: str, *args) -> None:
+    log("WARNING", message, *args)
+
+
+def error(message: str, *args) -> None:
+    log("ERROR", message, *args)
@@ -0,0 +1,317 @@
+import asyncio
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Default histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Gemini pricing used for the cost counters, in USD per million tokens
+INPUT_COST_PER_MTOK = float(os.getenv("DM_INPUT_COST_PER_MTOK", "0.075"))
+OUTPUT_COST_PER_MTOK = float(os.getenv("DM_OUTPUT_COST_PER_MTOK", "0.30"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    """A value that can go up and down per label set."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Bucketed observations (e.g. latencies) per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Label set -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the wall-clock duration of a block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self, **labels) -> Dict[str, float]:
+        """Count and sum of one label set, mainly for JSON stats endpoints."""
+        series = self._series.get(self._key(labels))
+        return {"count": series[2], "sum": series[1]} if series else {"count": 0, "sum": 0.0}
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric of the process and renders them in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "dm_http_request_duration_seconds", "HTTP request latency by route and status.", ["method", "route", "status"])
+STAGE_SECONDS = REGISTRY.histogram(
+    "dm_stage_duration_seconds", "Latency of each processing stage.", ["stage"])
+STAGE_ERRORS = REGISTRY.counter(
+    "dm_stage_errors_total", "Stages that ended with an exception.", ["stage"])
+
+LLM_REQUESTS = REGISTRY.counter(
+    "dm_llm_requests_total", "Gemini calls by prompt type, model and outcome (ok, timeout, error, throttled, cancelled).", ["prompt_type", "model", "outcome"])
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "dm_llm_request_duration_seconds", "Gemini call latency, excluding time queued for a concurrency slot.", ["prompt_type"])
+LLM_QUEUE_SECONDS = REGISTRY.histogram(
+    "dm_llm_queue_seconds", "Time spent waiting for a Gemini concurrency slot.")
+LLM_PROMPT_TOKENS = REGISTRY.counter(
+    "dm_llm_prompt_tokens_total", "Prompt tokens sent to Gemini (reported, or estimated when not reported).", ["prompt_type"])
+LLM_OUTPUT_TOKENS = REGISTRY.counter(
+    "dm_llm_output_tokens_total", "Output tokens received from Gemini (reported, or estimated when not reported).", ["prompt_type"])
+LLM_COST = REGISTRY.counter(
+    "dm_llm_cost_usd_total", "Estimated Gemini cost in USD.", ["prompt_type"])
+LLM_RETRIES = REGISTRY.counter(
+    "dm_llm_retries_total", "Extra Gemini calls made because an earlier one failed or was unusable.", ["prompt_type", "reason"])
+LLM_HEDGES = REGISTRY.counter(
+    "dm_llm_hedges_total", "Hedged Gemini calls by outcome (fired, won by the hedge, skipped for lack of quota or models).", ["prompt_type", "outcome"])
+LLM_CIRCUIT_OPEN = REGISTRY.gauge(
+    "dm_llm_circuit_open", "1 while a model's circuit breaker is open, 0 otherwise.", ["model"])
+
+PARTY_ROUND_ACTIONS = REGISTRY.histogram(
+    "dm_party_round_actions", "Player actions resolved together in one party-turn generation.", buckets=(1, 2, 3, 4, 5, 6, 8, 10))
+LLM_CACHE_REQUESTS = REGISTRY.counter(
+    "dm_llm_cache_requests_total", "Response cache lookups by result (hit, similar_hit, miss, bypass).", ["prompt_type", "result"])
+LLM_CACHE_SAVED_TOKENS = REGISTRY.counter(
+    "dm_llm_cache_saved_tokens_total", "Prompt and output tokens not spent thanks to response cache hits.", ["prompt_type"])
+
+ADMISSION_REQUESTS = REGISTRY.counter(
+    "dm_admission_requests_total", "Model calls by admission outcome (admitted, queued, dequeued, rejected).", ["outcome"])
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "dm_admission_queue_depth", "Model calls waiting for rate-limit quota.")
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "dm_admission_wait_seconds", "Time queued model calls waited for rate-limit quota.")
+
+PREGEN_REQUESTS = REGISTRY.counter(
+    "dm_pregen_requests_total", "Lookups in a pre-generation pool by result (hit, miss).", ["pool", "result"])
+PREGEN_GENERATED = REGISTRY.counter(
+    "dm_pregen_generated_total", "Items generated in the background for a pre-generation pool, by outcome.", ["pool", "outcome"])
+PREGEN_EVICTED = REGISTRY.counter(
+    "dm_pregen_evicted_total", "Pre-generated items dropped as stale or with an evicted bucket.", ["pool"])
+PREGEN_POOL_SIZE = REGISTRY.gauge(
+    "dm_pregen_pool_items", "Pre-generated items ready to serve.", ["pool"])
+
+CHAT_TURNS = REGISTRY.counter(
+    "dm_chat_turns_total", "Chat turns by path (local: resolved without Gemini, llm) and recognized intent.", ["path", "intent"])
+CHAT_LOCAL_FRACTION = REGISTRY.gauge(
+    "dm_chat_local_turn_fraction", "Fraction of chat turns resolved locally without a Gemini call.")
+
+SRD_REQUESTS = REGISTRY.counter(
+    "dm_srd_requests_total", "SRD lookups by cache result (fresh, stale, miss, offline).", ["result"])
+SRD_UPSTREAM_REQUESTS = REGISTRY.counter(
+    "dm_srd_upstream_requests_total", "Requests sent to dnd5eapi.co by status (200, 304, error, ...).", ["status"])
+SRD_UPSTREAM_SECONDS = REGISTRY.histogram(
+    "dm_srd_upstream_duration_seconds", "dnd5eapi.co request latency.")
+SRD_COALESCED = REGISTRY.counter(
+    "dm_srd_coalesced_total", "SRD lookups that joined an identical in-flight upstream request.")
+SRD_CACHE_ENTRIES = REGISTRY.gauge(
+    "dm_srd_cache_memory_entries", "SRD entries held in the in-memory cache tier.")
+SESSIONS_ACTIVE = REGISTRY.gauge(
+    "dm_sessions_active", "Chat sessions held by the session store.")
+
+
+def record_llm_call(prompt_type: str, seconds: float, outcome: str, prompt_tokens: int = 0, output_tokens: int = 0, model: str = "") -> None:
+    """Record one Gemini call: latency, outcome, tokens and estimated cost."""
+    LLM_REQUESTS.inc(prompt_type=prompt_type, model=model, outcome=outcome)
+    LLM_REQUEST_SECONDS.observe(seconds, prompt_type=prompt_type)
+    if prompt_tokens:
+        LLM_PROMPT_TOKENS.inc(prompt_tokens, prompt_type=prompt_type)
+    if output_tokens:
+        LLM_OUTPUT_TOKENS.inc(output_tokens, prompt_type=prompt_type)
+    cost = (prompt_tokens * INPUT_COST_PER_MTOK + output_tokens * OUTPUT_COST_PER_MTOK) / 1_000_000
+    if cost:
+        LLM_COST.inc(cost, prompt_type=prompt_type)
+
+
+def timed(stage: str) -> Callable:
+    """Decorator recording a function's latency (and exceptions) under a stage name.
+
+    Works on both plain and async functions.
+    """
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    STAGE_ERRORS.inc(stage=stage)
+                    raise
+                finally:
+                    STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                STAGE_ERRORS.inc(stage=stage)
+                raise
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+        return wrapper
+
+    return decorator
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency of every HTTP request by route template.
+
+    Timing covers the whole response, including streamed bodies.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = ["500"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope; use its template
+            # ("/api/spells/{spell_index}") so label cardinality stays bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, method=scope["method"], route=route, status=status[0])
+
+
+def render() -> str:
+    """Render every registered metric in Prometheus text format."""
+    return REGISTRY.render()
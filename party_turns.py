@@ -0,0 +1,101 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import metrics
+
+# resolve(session_id, actions) -> the round's result, shared by every player in it
+Resolver = Callable[[str, List[Dict[str, Any]]], Awaitable[Dict[str, Any]]]
+
+
+class _Round:
+    __slots__ = ("actions", "future", "timer", "party_size")
+
+    def __init__(self, future: asyncio.Future):
+        self.actions: Dict[str, Dict[str, Any]] = {}
+        self.future = future
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.party_size: Optional[int] = None
+
+
+class PartyTurnBatcher:
+    """Collects the actions a party submits close together into one round.
+
+    The first action for a session opens a round; every action submitted
+    for that session in the next `window` seconds joins it, and the round is
+    resolved with a single call once the window closes, or as soon as the
+    whole party (`party_size` players, at most `max_actions`) has acted.
+    Every submitter waits for and receives the same round result. A player
+    who acts twice in one round replaces their earlier action.
+    """
+
+    def __init__(self, resolve: Resolver, window: Optional[float] = None, max_actions: Optional[int] = None):
+        self.resolve = resolve
+        self.window = window if window is not None else float(os.getenv("DM_PARTY_TURN_WINDOW", "3"))
+        self.max_actions = max_actions or int(os.getenv("DM_PARTY_TURN_MAX_ACTIONS", "8"))
+        self._open: Dict[str, _Round] = {}
+        self._running: Set[asyncio.Task] = set()
+        self.stats = {"rounds": 0, "actions": 0, "failed": 0}
+
+    async def submit(self, session_id: str, player_id: str, action: Dict[str, Any], party_size: Optional[int] = None) -> Dict[str, Any]:
+        """Add a player's action to the session's open round and wait for the round's result."""
+        round_ = self._open.get(session_id)
+        if round_ is None:
+            loop = asyncio.get_running_loop()
+            round_ = self._open[session_id] = _Round(loop.create_future())
+            # Mark a failure as retrieved even if every submitter has gone away
+            round_.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+            round_.timer = loop.call_later(self.window, self._close, session_id, round_)
+
+        round_.actions[player_id] = {**action, "player_id": player_id}
+        if party_size:
+            round_.party_size = party_size
+        if len(round_.actions) >= min(round_.party_size or self.max_actions, self.max_actions):
+            self._close(session_id, round_)
+
+        # One player disconnecting must not cancel the round for the others
+        return await asyncio.shield(round_.future)
+
+    def _close(self, session_id: str, round_: _Round) -> None:
+        if self._open.get(session_id) is not round_:
+            return  # Already closed
+        del self._open[session_id]
+        round_.timer.cancel()
+        task = asyncio.create_task(self._run(session_id, round_))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, session_id: str, round_: _Round) -> None:
+        actions = list(round_.actions.values())
+        self.stats["rounds"] += 1
+        self.stats["actions"] += len(actions)
+        metrics.PARTY_ROUND_ACTIONS.observe(len(actions))
+        try:
+            result = await self.resolve(session_id, actions)
+        except asyncio.CancelledError:
+            round_.future.cancel()
+            raise
+        except Exception as e:
+            self.stats["failed"] += 1
+            round_.future.set_exception(e)
+            return
+        round_.future.set_result(result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "actions_per_round": round(self.stats["actions"] / self.stats["rounds"], 2) if self.stats["rounds"] else None,
+            "open_rounds": len(self._open),
+            "window": self.window,
+        }
+
+    async def close(self) -> None:
+        """Cancel open and running rounds (at shutdown)."""
+        for round_ in self._open.values():
+            round_.timer.cancel()
+            round_.future.cancel()
+        self._open.clear()
+        tasks = list(self._running)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+import metrics
+from admission import current_session
+
+# generate(key) -> one freshly generated item for that bucket
+Generator = Callable[[Hashable], Awaitable[Any]]
+
+
+class PregenPool:
+    """Pools of pre-generated items (encounters, narration, ...) per bucket key.
+
+    A hit pops the oldest fresh item for its key and tops the bucket up in
+    the background. On a miss the caller generates the item live and then
+    calls warm(), so buckets are only filled for keys that are known to be
+    valid and in use. Items older than `max_age` seconds are evicted, and
+    only the `max_buckets` most recently requested buckets are kept filled.
+    """
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, name: str, generate: Generator, size: int = 2, max_age: float = 3600, max_buckets: int = 32):
+        self.name = name
+        self.generate = generate
+        self.size = size
+        self.max_age = max_age
+        self.max_buckets = max_buckets
+        # Bucket key -> (created_at, item) queue, in least recently requested order
+        self._buckets: "OrderedDict[Hashable, Deque[Tuple[float, Any]]]" = OrderedDict()
+        self._refills: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"hits": 0, "misses": 0, "generated": 0, "failed": 0, "evicted": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def take(self, key: Hashable) -> Optional[Any]:
+        """Pop a pre-generated item for `key` and refill its bucket, or return None on a miss."""
+        if not self.enabled:
+            return None
+        self._evict_stale()
+        bucket = self._buckets.get(key)
+        if not bucket:
+            self.stats["misses"] += 1
+            metrics.PREGEN_REQUESTS.inc(pool=self.name, result="miss")
+            return None
+
+        self._buckets.move_to_end(key)
+        item = bucket.popleft()[1]
+        self.stats["hits"] += 1
+        metrics.PREGEN_REQUESTS.inc(pool=self.name, result="hit")
+        self._update_size()
+        self.schedule_refill(key)
+        return item
+
+    def warm(self, key: Hashable) -> None:
+        """Start keeping a bucket filled (after a miss, or before its first request)."""
+        if not self.enabled:
+            return
+        if key in self._buckets:
+            self._buckets.move_to_end(key)
+        else:
+            self._buckets[key] = deque()
+            self._evict_buckets()
+        self.schedule_refill(key)
+
+    def schedule_refill(self, key: Hashable) -> None:
+        """Top up a bucket in the background, unless a refill is already running."""
+        task = self._refills.get(key)
+        if task is None or task.done():
+            self._refills[key] = asyncio.create_task(self._refill(key))
+
+    async def _refill(self, key: Hashable) -> None:
+        # Background generations get their own fair-share admission queue, so
+        # they never crowd out live requests from a single session
+        current_session.set(f"pregen:{self.name}")
+        try:
+            while key in self._buckets and len(self._buckets[key]) < self.size:
+                try:
+                    item = await self.generate(key)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Try again on the next request for this bucket
+                    self.stats["failed"] += 1
+                    metrics.PREGEN_GENERATED.inc(pool=self.name, outcome="error")
+                    print(f"[WARNING] Pre-generation for {self.name} {key} failed: {str(e)}")
+                    return
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    return  # The bucket was evicted while generating
+                bucket.append((self.clock(), item))
+                self.stats["generated"] += 1
+                metrics.PREGEN_GENERATED.inc(pool=self.name, outcome="ok")
+                self._update_size()
+        finally:
+            if self._refills.get(key) is asyncio.current_task():
+                del self._refills[key]
+
+    def _evict_stale(self) -> None:
+        cutoff = self.clock() - self.max_age
+        for bucket in self._buckets.values():
+            while bucket and bucket[0][0] < cutoff:
+                bucket.popleft()
+                self.stats["evicted"] += 1
+                metrics.PREGEN_EVICTED.inc(pool=self.name)
+
+    def _evict_buckets(self) -> None:
+        while len(self._buckets) > self.max_buckets:
+            key, bucket = self._buckets.popitem(last=False)
+            self.stats["evicted"] += len(bucket)
+            metrics.PREGEN_EVICTED.inc(len(bucket), pool=self.name)
+            task = self._refills.pop(key, None)
+            if task:
+                task.cancel()
+        self._update_size()
+
+    def _update_size(self) -> None:
+        metrics.PREGEN_POOL_SIZE.set(sum(len(bucket) for bucket in self._buckets.values()), pool=self.name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit rate, pool contents and generation counters."""
+        self._evict_stale()
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else None,
+            "size": self.size,
+            "buckets": {str(key): len(bucket) for key, bucket in self._buckets.items()},
+            "refilling": len(self._refills),
+        }
+
+    async def close(self) -> None:
+        """Cancel running refills (at shutdown)."""
+        tasks = list(self._refills.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
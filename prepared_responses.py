@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # Falls back to the standard json module
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Only gzip is offered
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed; compression would barely help
+MIN_COMPRESS_BYTES = 512
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps(); the app's default response class."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class PreparedResponse:
+    """One JSON body, serialized and compressed once, with a strong ETag."""
+
+    __slots__ = ("source", "body", "gzip", "br", "etag")
+
+    def __init__(self, source: Any, content: Any):
+        self.source = source
+        self.body = dumps(content)
+        self.etag = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+        compress = len(self.body) >= MIN_COMPRESS_BYTES
+        self.gzip = gzip.compress(self.body, compresslevel=9, mtime=0) if compress else None
+        self.br = brotli.compress(self.body) if compress and brotli is not None else None
+
+    def encoded(self, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+        """The smallest body the client accepts, and its Content-Encoding."""
+        accepted = _accepted_encodings(accept_encoding)
+        if self.br is not None and ("br" in accepted or "*" in accepted):
+            return self.br, "br"
+        if self.gzip is not None and ("gzip" in accepted or "*" in accepted):
+            return self.gzip, "gzip"
+        return self.body, None
+
+
+class PreparedResponseCache:
+    """Pre-serialized responses for data that rarely changes (SRD lists and details).
+
+    Entries are keyed by endpoint and rebuilt only when the source object
+    changes, i.e. when the SRD cache stores a refreshed copy. At most
+    `max_entries` responses are kept, least recently used first out.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_age: Optional[int] = None):
+        self.max_entries = max_entries or int(os.getenv("SRD_RESPONSE_CACHE_SIZE", "2048"))
+        # Browsers may reuse a response this long before revalidating it
+        self.max_age = max_age if max_age is not None else int(os.getenv("SRD_RESPONSE_MAX_AGE", "300"))
+        self._entries: "OrderedDict[str, PreparedResponse]" = OrderedDict()
+        self.stats = {"hits": 0, "builds": 0, "not_modified": 0}
+
+    def get(self, key: str, source: Any, content: Any = None) -> PreparedResponse:
+        """The prepared response for `source`, building it if the data changed.
+
+        `content` is the JSON body to serve when it wraps `source` (e.g.
+        {"results": source}); by default `source` itself is served.
+        """
+        prepared = self._entries.get(key)
+        if prepared is not None and prepared.source is source:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return prepared
+
+        prepared = PreparedResponse(source, source if content is None else content)
+        self._entries[key] = prepared
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self.stats["builds"] += 1
+        return prepared
+
+    def respond(self, request: Request, key: str, source: Any, content: Any = None) -> Response:
+        """A 200 with the best encoding the client accepts, or a 304 when its
+        If-None-Match already names this version."""
+        prepared = self.get(key, source, content)
+        body, encoding = prepared.encoded(request.headers.get("accept-encoding", ""))
+        headers = {
+            # Each encoding is a different byte sequence, so gets its own strong ETag
+            "ETag": f'"{prepared.etag}-{encoding}"' if encoding else f'"{prepared.etag}"',
+            "Cache-Control": f"public, max-age={self.max_age}",
+            "Vary": "Accept-Encoding",
+        }
+        if _etag_matches(request.headers.get("if-none-match"), prepared.etag):
+            self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": sum(len(p.body) + len(p.gzip or b"") + len(p.br or b"") for p in self._entries.values()),
+            "encoder": "orjson" if orjson is not None else "json",
+            "brotli": brotli is not None,
+        }
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "").lower() in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """Whether If-None-Match names any encoding of the version `etag`."""
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        candidate = candidate.strip('"')
+        if candidate == etag or candidate.rsplit("-", 1)[0] == etag:
+            return True
+    return False
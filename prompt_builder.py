@@ -0,0 +1,131 @@
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+# Rough characters-per-token ratio for English text with Gemini's tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of a string without calling the API."""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class PromptBuilder:
+    """Assembles a prompt from named sections under a token budget.
+
+    Sections are rendered in the order they were added but admitted in
+    priority order (lower number first). Required sections are always kept.
+    A section that doesn't fit is either truncated (keeping its start or its
+    end) or dropped. Item sections, such as chat history, keep as many of
+    their newest items as fit.
+    """
+
+    def __init__(self, budget: int, count_tokens: Callable[[str], int] = estimate_tokens):
+        self.budget = budget
+        self.count_tokens = count_tokens
+        self._sections: List[Dict[str, Any]] = []
+
+    def add(
+        self,
+        name: str,
+        text: Optional[str],
+        priority: int,
+        required: bool = False,
+        keep: Optional[str] = None,
+        max_tokens: Optional[int] = None
+    ) -> "PromptBuilder":
+        """Add a text section.
+
+        keep="start" or "end" allows truncating the section to fit; max_tokens
+        caps its size even when the budget has room to spare.
+        """
+        if text:
+            self._sections.append({
+                "name": name,
+                "text": text,
+                "priority": priority,
+                "required": required,
+                "keep": keep,
+                "max_tokens": max_tokens,
+            })
+        return self
+
+    def add_items(self, name: str, header: str, items: List[str], priority: int) -> "PromptBuilder":
+        """Add a list section that keeps its newest (last) items first."""
+        if items:
+            self._sections.append({
+                "name": name,
+                "header": header,
+                "items": items,
+                "priority": priority,
+                "required": False,
+            })
+        return self
+
+    def build(self) -> Tuple[str, Dict[str, Any]]:
+        """Render the prompt and a report of the tokens each section used."""
+        remaining = self.budget
+        rendered: Dict[int, str] = {}
+        report_sections: Dict[str, int] = {}
+        truncated: List[str] = []
+        dropped: List[str] = []
+
+        # Required sections claim their share before anything else
+        order = sorted(range(len(self._sections)), key=lambda i: (not self._sections[i]["required"], self._sections[i]["priority"], i))
+
+        for i in order:
+            section = self._sections[i]
+            # One token is reserved for the blank line between sections
+            available = remaining - 1
+            if "items" in section:
+                text, kept = self._fit_items(section, available)
+                if not kept:
+                    dropped.append(section["name"])
+                    continue
+                if kept < len(section["items"]):
+                    truncated.append(section["name"])
+            else:
+                text = section["text"]
+                tokens = self.count_tokens(text)
+                limit = available if section["max_tokens"] is None else min(available, section["max_tokens"])
+                if tokens > limit and not section["required"]:
+                    text = self._truncate(text, limit, section["keep"]) if section["keep"] else None
+                    if text is None:
+                        dropped.append(section["name"])
+                        continue
+                    truncated.append(section["name"])
+
+            tokens = self.count_tokens(text)
+            remaining -= tokens + 1
+            rendered[i] = text
+            report_sections[section["name"]] = tokens
+
+        prompt = "\n\n".join(rendered[i] for i in sorted(rendered))
+        return prompt, {
+            "budget": self.budget,
+            "total_tokens": self.count_tokens(prompt),
+            "sections": report_sections,
+            "truncated": truncated,
+            "dropped": dropped,
+        }
+
+    def _fit_items(self, section: Dict[str, Any], remaining: int) -> Tuple[str, int]:
+        kept: List[str] = []
+        used = self.count_tokens(section["header"])
+        for item in reversed(section["items"]):
+            cost = self.count_tokens(item) + 1
+            if used + cost > remaining:
+                break
+            kept.append(item)
+            used += cost
+        return section["header"] + "\n" + "\n".join(reversed(kept)), len(kept)
+
+    def _truncate(self, text: str, tokens: int, keep: str) -> Optional[str]:
+        # Leave room for the ellipsis marker
+        chars = (tokens - 1) * CHARS_PER_TOKEN
+        if chars <= 0:
+            return None
+        if keep == "start":
+            return text[:chars].rstrip() + "..."
+        return "..." + text[-chars:].lstrip()
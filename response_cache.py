@@ -0,0 +1,175 @@
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import metrics
+from prompt_builder import estimate_tokens
+
+# Generation settings that change what a model returns for the same prompt
+CONFIG_FIELDS = ("temperature", "top_p", "top_k", "max_output_tokens", "candidate_count", "stop_sequences", "response_mime_type")
+
+_WORD = re.compile(r"\w+")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+class CachedResponse:
+    """A Gemini response replayed from the cache; only its text is kept."""
+
+    __slots__ = ("text", "usage_metadata", "cached")
+
+    def __init__(self, text: str, cached: str = "exact"):
+        self.text = text
+        self.usage_metadata = None
+        self.cached = cached  # "exact" or "similar"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case and whitespace differences don't change the answer worth caching."""
+    return " ".join(prompt.lower().split())
+
+
+def config_key(generation_config: Any) -> Tuple:
+    return tuple((field, repr(getattr(generation_config, field, None))) for field in CONFIG_FIELDS)
+
+
+class ResponseCache:
+    """Memoized Gemini responses for prompt types whose answers are reusable.
+
+    A retried turn doesn't need a fresh set of suggestions. Entries are
+    keyed on a normalized key text (the prompt, or a shorter key the caller
+    builds from what the answer depends on) plus the generation config and
+    prompt type (which fixes the system instruction), kept for `ttl`
+    seconds, and evicted least recently used first beyond `max_entries`.
+
+    With a `similarity` threshold (0-1) a miss falls back to the most similar
+    cached prompt of the same type and config, by word-set Jaccard overlap.
+    Numbers (party level, size, ...) must still match exactly.
+    Calls whose temperature is above `max_temperature` (narration and
+    encounters run at 0.8-0.9) are creative on purpose and always bypass
+    the cache. Encounters are not cached by default either: the random
+    encounter fallback and the pre-generation pool want variety.
+    """
+
+    clock = staticmethod(time.monotonic)
+
+    def __init__(
+        self,
+        prompt_types: Optional[Tuple[str, ...]] = None,
+        max_entries: Optional[int] = None,
+        ttl: Optional[float] = None,
+        similarity: Optional[float] = None,
+        max_temperature: Optional[float] = None
+    ):
+        if prompt_types is None:
+            prompt_types = tuple(t.strip() for t in os.getenv("DM_RESPONSE_CACHE_TYPES", "suggestions").split(",") if t.strip())
+        self.prompt_types = frozenset(prompt_types)
+        self.max_entries = max_entries or int(os.getenv("DM_RESPONSE_CACHE_SIZE", "1024"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("DM_RESPONSE_CACHE_TTL", "3600"))
+        # 0 disables similarity matching
+        self.similarity = similarity if similarity is not None else float(os.getenv("DM_RESPONSE_CACHE_SIMILARITY", "0"))
+        self.max_temperature = max_temperature if max_temperature is not None else float(os.getenv("DM_RESPONSE_CACHE_MAX_TEMPERATURE", "0.7"))
+
+        # Key -> entry, least recently used first
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {"hits": 0, "similar_hits": 0, "misses": 0, "bypassed": 0, "stored": 0, "expired": 0, "tokens_saved": 0}
+
+    def cacheable(self, prompt_type: str, generation_config: Any) -> bool:
+        """Whether calls of this type and config may be served from the cache."""
+        if prompt_type not in self.prompt_types or self.max_entries <= 0:
+            return False
+        temperature = getattr(generation_config, "temperature", None)
+        if temperature is not None and temperature > self.max_temperature:
+            self.stats["bypassed"] += 1
+            metrics.LLM_CACHE_REQUESTS.inc(prompt_type=prompt_type, result="bypass")
+            return False
+        return True
+
+    def get(self, prompt: str, generation_config: Any, prompt_type: str) -> Optional[CachedResponse]:
+        """A cached response for this call, or None on a miss."""
+        group = (prompt_type, config_key(generation_config))
+        normalized = normalize_prompt(prompt)
+        key = self._key(group, normalized)
+
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(key, entry):
+            entry = None
+        result = "hit"
+        if entry is None and self.similarity > 0:
+            entry = self._most_similar(group, normalized)
+            result = "similar_hit"
+        if entry is None:
+            self.stats["misses"] += 1
+            metrics.LLM_CACHE_REQUESTS.inc(prompt_type=prompt_type, result="miss")
+            return None
+
+        self._entries.move_to_end(entry["key"])
+        self.stats["hits" if result == "hit" else "similar_hits"] += 1
+        self.stats["tokens_saved"] += entry["tokens"]
+        metrics.LLM_CACHE_REQUESTS.inc(prompt_type=prompt_type, result=result)
+        metrics.LLM_CACHE_SAVED_TOKENS.inc(entry["tokens"], prompt_type=prompt_type)
+        return CachedResponse(entry["text"], "exact" if result == "hit" else "similar")
+
+    def put(self, prompt: str, generation_config: Any, prompt_type: str, response: Any, prompt_tokens: int) -> None:
+        """Remember a successful response; empty or unreadable ones are skipped."""
+        try:
+            text = response.text
+        except Exception:
+            return
+        if not text:
+            return
+
+        group = (prompt_type, config_key(generation_config))
+        normalized = normalize_prompt(prompt)
+        key = self._key(group, normalized)
+        self._entries[key] = {
+            "key": key,
+            "group": group,
+            "words": frozenset(_WORD.findall(normalized)) if self.similarity > 0 else frozenset(),
+            "numbers": _NUMBER.findall(normalized),
+            "text": text,
+            # What a repeat of this call would have cost
+            "tokens": prompt_tokens + estimate_tokens(text),
+            "created_at": self.clock(),
+        }
+        self._entries.move_to_end(key)
+        self.stats["stored"] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["similar_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round((self.stats["hits"] + self.stats["similar_hits"]) / lookups, 4) if lookups else None,
+            "entries": len(self._entries),
+            "prompt_types": sorted(self.prompt_types),
+            "similarity": self.similarity,
+        }
+
+    def _key(self, group: Tuple, normalized: str) -> str:
+        return hashlib.blake2b(repr((group, normalized)).encode("utf-8"), digest_size=16).hexdigest()
+
+    def _expired(self, key: str, entry: Dict[str, Any]) -> bool:
+        if self.clock() - entry["created_at"] < self.ttl:
+            return False
+        del self._entries[key]
+        self.stats["expired"] += 1
+        return True
+
+    def _most_similar(self, group: Tuple, normalized: str) -> Optional[Dict[str, Any]]:
+        words = frozenset(_WORD.findall(normalized))
+        if not words:
+            return None
+        numbers = _NUMBER.findall(normalized)
+        best, best_score = None, self.similarity
+        for key, entry in list(self._entries.items()):
+            if entry["group"] != group or entry["numbers"] != numbers or self._expired(key, entry):
+                continue
+            union = len(words | entry["words"])
+            score = len(words & entry["words"]) / union if union else 0.0
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
@@ -0,0 +1,272 @@
+import math
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from prompt_builder import CHARS_PER_TOKEN, estimate_tokens
+
+# BM25 parameters: term-frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Name terms count this many times in a document, so "fireball" the spell
+# outranks a monster whose description mentions fireballs
+NAME_WEIGHT = 3
+
+# A spell whose name is one word (Light, Shield, Fly, Sleep) is only
+# matched when the message also talks about casting, since the word alone
+# is usually just a word
+CASTING_WORDS = frozenset(("cast", "casts", "casting", "spell", "spells", "cantrip"))
+
+# Longest snippet kept per document, and shortest worth injecting after
+# clipping it to the remaining budget, in (estimated) tokens
+SNIPPET_MAX_TOKENS = 160
+SNIPPET_MIN_TOKENS = 30
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do for from has have he her his i if in into is it its me my of off on or our
+she so than that the their them then there they this to up us we what when where which who will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def _join(values: Any) -> str:
+    if isinstance(values, list):
+        return " ".join(str(value) for value in values)
+    return str(values or "")
+
+
+def _sentences(*parts: str) -> str:
+    text = ". ".join(part.rstrip(". ") for part in parts if part and part.strip())
+    return text + "." if text else ""
+
+
+def _spell_snippet(d: Dict[str, Any]) -> str:
+    level = d.get("level")
+    school = (d.get("school") or {}).get("name", "")
+    kind = f"{school} cantrip" if level == 0 else f"level {level} {school} spell".replace("  ", " ")
+    facts = [kind.strip()]
+    for field in ("casting_time", "range", "duration"):
+        if d.get(field):
+            facts.append(str(d[field]))
+    if d.get("components"):
+        facts.append("/".join(d["components"]))
+    if d.get("concentration"):
+        facts.append("concentration")
+    text = f"{d.get('name', '')} ({', '.join(facts)}): {_join(d.get('desc'))}"
+    if d.get("higher_level"):
+        text += f" At higher levels: {_join(d['higher_level'])}"
+    return text
+
+
+def _monster_snippet(d: Dict[str, Any]) -> str:
+    armor = d.get("armor_class")
+    if isinstance(armor, list):
+        armor = armor[0].get("value") if armor else None
+    facts = [f"{d.get('size', '')} {d.get('type', '')}".strip(), f"CR {d.get('challenge_rating')}"]
+    stats = []
+    if armor is not None:
+        stats.append(f"AC {armor}")
+    if d.get("hit_points") is not None:
+        stats.append(f"HP {d['hit_points']}" + (f" ({d['hit_dice']})" if d.get("hit_dice") else ""))
+    if isinstance(d.get("speed"), dict) and d["speed"]:
+        stats.append("speed " + ", ".join(f"{kind} {value}" for kind, value in d["speed"].items()))
+    abilities = [
+        f"{ability[:3].upper()} {d[ability]}"
+        for ability in ("strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma")
+        if d.get(ability) is not None
+    ]
+    parts = ["; ".join(stats), " ".join(abilities)]
+    for label, field in (("Traits", "special_abilities"), ("Actions", "actions")):
+        entries = [_sentences(f"{entry.get('name')}: {entry.get('desc', '')}") for entry in d.get(field) or []]
+        if entries:
+            parts.append(f"{label}: " + " ".join(entries))
+    return f"{d.get('name', '')} ({', '.join(facts)}): {_sentences(*parts)}"
+
+
+def _condition_snippet(d: Dict[str, Any]) -> str:
+    return f"{d.get('name', '')} (condition): {_join(d.get('desc'))}"
+
+
+def _equipment_snippet(d: Dict[str, Any]) -> str:
+    facts = [(d.get("equipment_category") or {}).get("name", "")]
+    if d.get("category_range"):
+        facts.append(d["category_range"])
+    details = []
+    damage = d.get("damage") or {}
+    if damage.get("damage_dice"):
+        details.append(f"{damage['damage_dice']} {(damage.get('damage_type') or {}).get('name', '').lower()} damage".replace("  ", " "))
+    armor = d.get("armor_class") or {}
+    if armor.get("base") is not None:
+        details.append(f"AC {armor['base']}" + (" + Dex" if armor.get("dex_bonus") else "") + (f" (max {armor['max_bonus']})" if armor.get("max_bonus") else ""))
+    properties = [prop.get("name") for prop in d.get("properties") or [] if prop.get("name")]
+    if properties:
+        details.append(", ".join(properties))
+    cost = d.get("cost") or {}
+    if cost.get("quantity") is not None:
+        details.append(f"{cost['quantity']} {cost.get('unit', '')}".strip())
+    if d.get("weight"):
+        details.append(f"{d['weight']} lb")
+    return f"{d.get('name', '')} ({', '.join(fact for fact in facts if fact) or 'equipment'}): {_sentences('; '.join(details), _join(d.get('desc')))}"
+
+
+# Categories covered by rules retrieval and how each detail becomes a snippet
+RULES_CATEGORIES: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "spells": _spell_snippet,
+    "monsters": _monster_snippet,
+    "conditions": _condition_snippet,
+    "equipment": _equipment_snippet,
+}
+
+
+def _mentions(words: List[str], name_words: List[str]) -> bool:
+    """Whether the name appears in the message's words as a phrase, allowing a plural last word."""
+    size = len(name_words)
+    if not size:
+        return False
+    for start in range(len(words) - size + 1):
+        if words[start:start + size - 1] == name_words[:-1] and words[start + size - 1] in (
+            name_words[-1], name_words[-1] + "s", name_words[-1] + "es"
+        ):
+            return True
+    return False
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:(max_tokens - 1) * CHARS_PER_TOKEN].rsplit(" ", 1)[0] + "..."
+
+
+class RulesIndex:
+    """BM25 index over SRD rules text (spells, monsters, conditions, equipment).
+
+    Each SRD entry becomes one short snippet. A player message is matched
+    against entry names first: only entries whose whole name appears in the
+    message (a plural counts) are candidates, so rules are injected only for
+    things the player actually mentioned; "the wall" alone doesn't bring in
+    Wall of Fire. Candidates are then ranked by BM25 over name and rules text.
+    """
+
+    def __init__(self):
+        self._docs: List[Dict[str, Any]] = []
+        self._lengths: List[int] = []
+        self._term_freqs: List[Counter] = []
+        self._doc_freq: Counter = Counter()
+        self._by_name_term: Dict[str, List[int]] = {}
+        self._avg_length = 0.0
+
+    @classmethod
+    async def build(cls, dnd_api, categories: Optional[List[str]] = None) -> "RulesIndex":
+        """Build the index from DnDIntegration data (served from the SRD cache when warm)."""
+        index = cls()
+        for category in categories or list(RULES_CATEGORIES):
+            try:
+                listing = await dnd_api._make_request(category)
+            except Exception as e:
+                print(f"[WARNING] Skipping {category} in rules index: {str(e)}")
+                continue
+            items = listing.get("results", [])
+            details = await dnd_api.fetch_many([f"{category}/{item['index']}" for item in items])
+            for item in items:
+                detail = details.get(f"{category}/{item['index']}")
+                if detail is not None:
+                    index.add(category, detail)
+
+        index.finalize()
+        print(f"[INFO] Built rules index with {len(index)} entries")
+        return index
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def add(self, category: str, detail: Dict[str, Any]) -> None:
+        """Add one SRD detail record."""
+        name = detail.get("name", "")
+        snippet = _clip(RULES_CATEGORIES[category](detail), SNIPPET_MAX_TOKENS)
+        name_terms = tokenize(name)
+        terms = Counter(tokenize(snippet))
+        for term in name_terms:
+            terms[term] += NAME_WEIGHT
+
+        doc_id = len(self._docs)
+        self._docs.append({
+            "name": name,
+            "name_words": _WORD.findall(name.lower()),
+            "category": category,
+            "index": detail.get("index"),
+            "snippet": snippet,
+        })
+        self._term_freqs.append(terms)
+        self._lengths.append(sum(terms.values()))
+        self._doc_freq.update(terms.keys())
+        # Numbers alone ("Item 15") should not pull in rules for a dice roll
+        for term in set(name_terms):
+            if not term.isdigit():
+                self._by_name_term.setdefault(term, []).append(doc_id)
+
+    def finalize(self) -> None:
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+
+    def _idf(self, term: str) -> float:
+        df = self._doc_freq.get(term, 0)
+        return math.log(1 + (len(self._docs) - df + 0.5) / (df + 0.5))
+
+    def _bm25(self, doc_id: int, query_terms: List[str]) -> float:
+        freqs = self._term_freqs[doc_id]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[doc_id] / self._avg_length)
+        score = 0.0
+        for term in query_terms:
+            tf = freqs.get(term, 0)
+            if tf:
+                score += self._idf(term) * tf * (BM25_K1 + 1) / (tf + norm)
+        return score
+
+    @metrics.timed("rules_retrieval")
+    def search(self, text: str, limit: int = 3) -> List[Tuple[float, Dict[str, Any]]]:
+        """The best matching entries for a message, as (score, entry) pairs."""
+        words = _WORD.findall(text.lower())
+        terms = tokenize(text)
+        # Singulars of plural words too, so "goblins" finds the Goblin
+        terms += [term[:-2] for term in terms if term.endswith("es")] + [term[:-1] for term in terms if term.endswith("s")]
+        query_terms = list(dict.fromkeys(terms))
+        # Every entry naming something in the message has one of its name terms there
+        candidates = {doc_id for term in query_terms for doc_id in self._by_name_term.get(term, ())}
+        casting = not CASTING_WORDS.isdisjoint(words)
+        scored = []
+        for doc_id in candidates:
+            doc = self._docs[doc_id]
+            if not _mentions(words, doc["name_words"]):
+                continue
+            if doc["category"] == "spells" and len(doc["name_words"]) == 1 and not casting:
+                continue
+            scored.append((self._bm25(doc_id, query_terms), doc))
+        scored.sort(key=lambda pair: (-pair[0], pair[1]["name"]))
+        return scored[:limit]
+
+    def context_for(self, text: str, max_tokens: int, limit: int = 3) -> Tuple[Optional[str], List[str]]:
+        """A "Relevant rules" prompt section for a message within `max_tokens`,
+        and the names of the entries it includes."""
+        lines: List[str] = []
+        names: List[str] = []
+        used = estimate_tokens("Relevant rules (SRD):")
+        for _, doc in self.search(text, limit):
+            snippet = doc["snippet"]
+            available = max_tokens - used - 1
+            if estimate_tokens(snippet) > available:
+                # Shorten the entry to what is left, unless that would leave only a stub
+                if available < SNIPPET_MIN_TOKENS:
+                    continue
+                snippet = _clip(snippet, available)
+            lines.append(f"- {snippet}")
+            names.append(doc["name"])
+            used += estimate_tokens(snippet) + 1
+        if not lines:
+            return None, []
+        return "Relevant rules (SRD):\n" + "\n".join(lines), names
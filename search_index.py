@@ -0,0 +1,211 @@
+import bisect
+from typing import Callable, Dict, List, Any, Optional, Set
+
+# Categories covered by the index and the detail fields that can be filtered on.
+# Extractors may return a single value or a list (indexed under every element).
+INDEXED_CATEGORIES: Dict[str, Dict[str, Callable[[Dict[str, Any]], Any]]] = {
+    "spells": {
+        "level": lambda d: d.get("level"),
+        "school": lambda d: (d.get("school") or {}).get("index"),
+        "class": lambda d: [c.get("index") for c in d.get("classes", [])],
+    },
+    "monsters": {
+        "challenge_rating": lambda d: d.get("challenge_rating"),
+        "type": lambda d: d.get("type"),
+        "size": lambda d: d.get("size"),
+    },
+    "equipment": {
+        "equipment_category": lambda d: (d.get("equipment_category") or {}).get("index"),
+    },
+    "classes": {},
+    "races": {},
+}
+
+# Minimum trigram similarity for a fuzzy (typo-tolerant) match
+FUZZY_THRESHOLD = 0.3
+
+
+def _normalize(value: Any) -> Any:
+    return value.lower() if isinstance(value, str) else value
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """In-memory search index over SRD list and detail data.
+
+    Supports exact, prefix (whole name or any word) and trigram-based fuzzy
+    matching on names, combined with attribute filters such as spell level,
+    school, monster challenge rating, type and size. Everything is precomputed
+    at build time, so queries never touch the network.
+    """
+
+    def __init__(self):
+        self._records: List[Dict[str, Any]] = []
+        self._by_category: Dict[str, Set[int]] = {}
+        self._postings: Dict[str, Dict[Any, Set[int]]] = {}
+        self._names: List[tuple] = []   # sorted (name_lower, record_id)
+        self._words: List[tuple] = []   # sorted (word, record_id)
+        self._trigrams: Dict[str, Set[int]] = {}
+        self._trigram_counts: List[int] = []
+
+    @classmethod
+    async def build(cls, dnd_api, categories: Optional[List[str]] = None, with_details: bool = True) -> "SearchIndex":
+        """Build an index from DnDIntegration data (served from the SRD cache when warm)."""
+        index = cls()
+        for category in categories or list(INDEXED_CATEGORIES):
+            try:
+                listing = await dnd_api._make_request(category)
+            except Exception as e:
+                print(f"[WARNING] Skipping {category} in search index: {str(e)}")
+                continue
+            items = listing.get("results", [])
+
+            details = {}
+            if with_details and INDEXED_CATEGORIES.get(category):
+                details = await dnd_api.fetch_many([f"{category}/{item['index']}" for item in items])
+
+            for item in items:
+                index.add(category, item, details.get(f"{category}/{item['index']}"))
+
+        index.finalize()
+        print(f"[INFO] Built search index with {len(index)} entries")
+        return index
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, category: str, item: Dict[str, Any], details: Optional[Dict[str, Any]] = None) -> None:
+        """Add one list item (and optionally its details) to the index."""
+        record_id = len(self._records)
+        name = item.get("name", "")
+        name_lower = name.lower()
+
+        attributes = {}
+        for attribute, extract in INDEXED_CATEGORIES.get(category, {}).items():
+            if details is None:
+                continue
+            value = extract(details)
+            if value is None:
+                continue
+            attributes[attribute] = value
+            values = value if isinstance(value, list) else [value]
+            for v in values:
+                self._postings.setdefault(attribute, {}).setdefault(_normalize(v), set()).add(record_id)
+
+        self._records.append({
+            "index": item.get("index"),
+            "name": name,
+            "category": category,
+            "url": item.get("url"),
+            **attributes,
+        })
+        self._by_category.setdefault(category, set()).add(record_id)
+        self._names.append((name_lower, record_id))
+        for word in name_lower.replace("-", " ").replace("/", " ").split():
+            self._words.append((word, record_id))
+
+        grams = _trigrams(name_lower)
+        self._trigram_counts.append(len(grams))
+        for gram in grams:
+            self._trigrams.setdefault(gram, set()).add(record_id)
+
+    def finalize(self) -> None:
+        """Sort the prefix tables once all items have been added."""
+        self._names.sort()
+        self._words.sort()
+
+    def search(
+        self,
+        query: Optional[str] = None,
+        category: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        min_cr: Optional[float] = None,
+        max_cr: Optional[float] = None,
+        limit: int = 20,
+        offset: int = 0,
+        fuzzy: bool = True
+    ) -> Dict[str, Any]:
+        """Search the index, returning one page of ranked results."""
+        candidates = self._filter(category, filters or {}, min_cr, max_cr)
+
+        if query and query.strip():
+            scores = self._score(query.strip().lower(), candidates, fuzzy)
+            ranked = sorted(scores, key=lambda rid: (-scores[rid], self._records[rid]["name"]))
+        else:
+            ranked = [rid for _, rid in self._names if candidates is None or rid in candidates]
+
+        page = ranked[offset:offset + limit]
+        return {
+            "results": [self._records[rid] for rid in page],
+            "total": len(ranked),
+            "limit": limit,
+            "offset": offset,
+        }
+
+    def _filter(
+        self,
+        category: Optional[str],
+        filters: Dict[str, Any],
+        min_cr: Optional[float],
+        max_cr: Optional[float]
+    ) -> Optional[Set[int]]:
+        """Intersect category and attribute postings; None means no restriction."""
+        candidates = None
+        if category:
+            candidates = set(self._by_category.get(category, set()))
+
+        for attribute, value in filters.items():
+            if value is None:
+                continue
+            posting = self._postings.get(attribute, {}).get(_normalize(value), set())
+            candidates = set(posting) if candidates is None else candidates & posting
+
+        if min_cr is not None or max_cr is not None:
+            in_range = set()
+            for cr, posting in self._postings.get("challenge_rating", {}).items():
+                if (min_cr is None or cr >= min_cr) and (max_cr is None or cr <= max_cr):
+                    in_range |= posting
+            candidates = in_range if candidates is None else candidates & in_range
+
+        return candidates
+
+    def _score(self, query: str, candidates: Optional[Set[int]], fuzzy: bool) -> Dict[int, float]:
+        """Score candidate records against a lowercase query string."""
+        scores: Dict[int, float] = {}
+
+        def allowed(rid: int) -> bool:
+            return candidates is None or rid in candidates
+
+        # Whole-name prefix matches (an exact match ranks highest)
+        for name, rid in self._prefix_range(self._names, query):
+            if allowed(rid):
+                scores[rid] = 3.0 if name == query else 2.0
+
+        # Prefix matches on any word of the name, e.g. "ball" -> "Lightning Ball"
+        for _, rid in self._prefix_range(self._words, query):
+            if allowed(rid):
+                scores[rid] = max(scores.get(rid, 0.0), 1.5)
+
+        if fuzzy:
+            query_grams = _trigrams(query)
+            overlaps: Dict[int, int] = {}
+            for gram in query_grams:
+                for rid in self._trigrams.get(gram, ()):
+                    overlaps[rid] = overlaps.get(rid, 0) + 1
+            for rid, shared in overlaps.items():
+                if rid in scores or not allowed(rid):
+                    continue
+                similarity = shared / (len(query_grams) + self._trigram_counts[rid] - shared)
+                if similarity >= FUZZY_THRESHOLD:
+                    scores[rid] = similarity
+
+        return scores
+
+    def _prefix_range(self, table: List[tuple], prefix: str) -> List[tuple]:
+        start = bisect.bisect_left(table, (prefix,))
+        end = bisect.bisect_left(table, (prefix + "￿",))
+        return table[start:end]
@@ -1,14 +1,80 @@
-from fastapi import FastAPI, HTTPException
+import time
+
+# Measured from here so the startup report covers this module's imports
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional, Any, Tuple
 import uvicorn
+import asyncio
+import json
 import os
 
-from ai_dm import AIDungeonMaster
+from ai_dm import AIDungeonMaster, GenerationTimeoutError
+from admission import RateLimitedError, current_session
+from resilience import ModelUnavailableError
 from dnd_integration import DnDIntegration
+from search_index import SearchIndex, INDEXED_CATEGORIES
+from rules_index import RulesIndex
+from action_resolver import ActionResolver
+from encounter_builder import EncounterBuilder, default_flavor
+from session_store import SessionNotFoundError, SessionStore
+from pregen import PregenPool
+from party_turns import PartyTurnBatcher
+from prepared_responses import FastJSONResponse, PreparedResponseCache
+import dice
+import log
+import metrics
+
+# Startup timings and readiness state, reported by /ready
+startup_state: Dict[str, Any] = {
+    "ai_dm": "pending",        # pending | initializing | ready | failed
+    "ai_dm_error": None,
+    "warmup": "disabled",      # disabled | running | done | failed
+    "import_seconds": None,
+    "lifespan_seconds": None,
+    "ai_dm_init_seconds": None,
+    "warmup_seconds": None,
+}
+
+# Optional SRD cache warmup at startup: "lists" fetches every category list,
+# "full" also builds the search, rules and challenge rating indexes
+SRD_WARMUP = os.getenv("SRD_WARMUP", "").lower()
+
+# Encounter pool buckets to fill at startup, as "level x size" pairs, e.g. "3x4,5x4"
+ENCOUNTER_POOL_WARM = [
+    (int(level), int(size), None)
+    for level, size in (pair.lower().split("x") for pair in os.getenv("DM_ENCOUNTER_POOL_WARM", "").split(",") if pair.strip())
+]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start service initialization in the background so the server accepts requests immediately."""
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(get_ai_dm_or_none())]
+    if SRD_WARMUP in ("lists", "full"):
+        tasks.append(asyncio.create_task(warm_srd_cache(full=SRD_WARMUP == "full")))
+    for bucket in ENCOUNTER_POOL_WARM:
+        encounter_pool.warm(bucket)
+    startup_state["lifespan_seconds"] = round(time.perf_counter() - started, 4)
+    print(f"[INFO] Server started in {startup_state['lifespan_seconds']}s (imports took {startup_state['import_seconds']}s)")
+    
+    yield
+    
+    for task in tasks:
+        task.cancel()
+    if _rules_index_task is not None:
+        _rules_index_task.cancel()
+    await encounter_pool.close()
+    await party_turns.close()
+    if dnd_api is not None:
+        await dnd_api.close()
 
-app = FastAPI(title="AI Dungeon Master API", version="1.0.0")
+app = FastAPI(title="AI Dungeon Master API", version="1.0.0", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Configure CORS - Allow all origins for development
 app.add_middleware(
@@ -18,16 +84,191 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Services are created on first use (or in the background by the lifespan
+# hook), so importing this module stays fast and a Gemini outage at startup
+# only makes the server unready instead of killing it
+ai_dm: Optional[AIDungeonMaster] = None
+_ai_dm_task: Optional[asyncio.Task] = None
+dnd_api: Optional[DnDIntegration] = None
+session_store = SessionStore()
+
+# SRD list and detail responses, serialized and compressed once per version
+srd_responses = PreparedResponseCache()
+
+async def _init_ai_dm() -> AIDungeonMaster:
+    global ai_dm
+    startup_state["ai_dm"] = "initializing"
+    started = time.perf_counter()
+    try:
+        # Construction imports google.generativeai and configures models; keep it off the event loop
+        dm = await asyncio.to_thread(AIDungeonMaster)
+        dm.rules_index = rules_index
+        dm.action_resolver = ActionResolver(get_dnd_api()) if FAST_PATH else None
+    except Exception as e:
+        startup_state["ai_dm"] = "failed"
+        startup_state["ai_dm_error"] = str(e)
+        print(f"❌ Failed to initialize AI Dungeon Master: {e}")
+        raise
+    ai_dm = dm
+    startup_state["ai_dm"] = "ready"
+    startup_state["ai_dm_error"] = None
+    startup_state["ai_dm_init_seconds"] = round(time.perf_counter() - started, 4)
+    print(f"✅ AI Dungeon Master initialized successfully in {startup_state['ai_dm_init_seconds']}s")
+    return dm
+
+async def get_ai_dm() -> AIDungeonMaster:
+    """Return the AI Dungeon Master, initializing it if needed; 503 if that fails."""
+    global _ai_dm_task
+    if ai_dm is not None:
+        return ai_dm
+    # Concurrent callers share one initialization; a failed one is retried by the next request
+    if _ai_dm_task is None or (_ai_dm_task.done() and (_ai_dm_task.cancelled() or _ai_dm_task.exception() is not None)):
+        _ai_dm_task = asyncio.create_task(_init_ai_dm())
+    try:
+        return await asyncio.shield(_ai_dm_task)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"AI Dungeon Master is not ready: {str(e)}")
+
+async def get_ai_dm_or_none() -> Optional[AIDungeonMaster]:
+    try:
+        return await get_ai_dm()
+    except HTTPException:
+        return None
+
+def get_dnd_api() -> DnDIntegration:
+    """Return the D&D 5E API client, creating it on first use."""
+    global dnd_api
+    if dnd_api is None:
+        dnd_api = DnDIntegration()
+    return dnd_api
+
+async def warm_srd_cache(full: bool = False) -> None:
+    """Fill the SRD cache in the background, optionally building the indexes too."""
+    startup_state["warmup"] = "running"
+    started = time.perf_counter()
+    try:
+        api = get_dnd_api()
+        if not await api.fetch_many(list(INDEXED_CATEGORIES)):
+            raise Exception("no SRD category could be fetched")
+        if full:
+            await get_search_index()
+            await get_encounter_builder()
+            schedule_rules_index()
+    except Exception as e:
+        startup_state["warmup"] = "failed"
+        print(f"[WARNING] SRD cache warmup failed: {str(e)}")
+        return
+    startup_state["warmup"] = "done"
+    startup_state["warmup_seconds"] = round(time.perf_counter() - started, 4)
+    print(f"[INFO] SRD cache warmed up in {startup_state['warmup_seconds']}s")
+
+# Built on first use from the SRD cache
+search_index: Optional[SearchIndex] = None
+_search_index_lock = asyncio.Lock()
 
-# Initialize services
-try:
-    ai_dm = AIDungeonMaster()
-    print("✅ AI Dungeon Master initialized successfully")
-except Exception as e:
-    print(f"❌ Failed to initialize AI Dungeon Master: {e}")
-    raise
+# Checks, attacks and spells in short mechanical messages are resolved with
+# the dice engine and SRD data instead of Gemini
+FAST_PATH = os.getenv("DM_FAST_PATH", "true").lower() in ("1", "true", "yes")
 
-dnd_api = DnDIntegration()
+# Rules snippets injected into chat prompts; built in the background on the
+# first chat request (or by a full warmup) and used by the DM once ready
+RULES_RETRIEVAL = os.getenv("DM_RULES_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+RULES_INDEX_RETRY_SECONDS = float(os.getenv("DM_RULES_INDEX_RETRY_SECONDS", "300"))
+rules_index: Optional[RulesIndex] = None
+_rules_index_task: Optional[asyncio.Task] = None
+_rules_index_failed_at: Optional[float] = None
+
+async def build_rules_index() -> None:
+    """Build the rules index from the SRD cache and hand it to the DM."""
+    global rules_index, _rules_index_failed_at
+    try:
+        index = await RulesIndex.build(get_dnd_api())
+        if not len(index):
+            raise Exception("no SRD rules could be fetched")
+    except Exception as e:
+        _rules_index_failed_at = time.monotonic()
+        print(f"[WARNING] Rules index build failed, retrying in {RULES_INDEX_RETRY_SECONDS:.0f}s: {str(e)}")
+        return
+    rules_index = index
+    if ai_dm is not None:
+        ai_dm.rules_index = index
+
+def schedule_rules_index() -> None:
+    """Start building the rules index unless it is built, building, or recently failed."""
+    global _rules_index_task
+    if not RULES_RETRIEVAL or rules_index is not None:
+        return
+    if _rules_index_task is not None and not _rules_index_task.done():
+        return
+    if _rules_index_failed_at is not None and time.monotonic() - _rules_index_failed_at < RULES_INDEX_RETRY_SECONDS:
+        return
+    _rules_index_task = asyncio.create_task(build_rules_index())
+
+# Built on first use from the monster challenge rating index
+encounter_builder: Optional[EncounterBuilder] = None
+
+async def get_encounter_builder() -> EncounterBuilder:
+    """Return the XP-budget encounter builder, creating it once if needed."""
+    global encounter_builder
+    if encounter_builder is None:
+        encounter_builder = EncounterBuilder(await get_dnd_api().build_cr_index())
+    return encounter_builder
+
+async def build_encounter(party_level: int, party_size: int, difficulty: Optional[str] = None, fast: bool = False) -> Dict[str, Any]:
+    """
+    Build a balanced encounter locally and have Gemini write its flavor text.
+
+    In fast mode Gemini is skipped entirely. If the monster data is unavailable,
+    the encounter falls back to being invented by Gemini as a whole.
+    """
+    try:
+        builder = await get_encounter_builder()
+    except Exception as e:
+        print(f"[WARNING] Encounter builder unavailable, falling back to Gemini: {str(e)}")
+        return await (await get_ai_dm()).generate_encounter_async(party_level=party_level, party_size=party_size)
+
+    encounter = builder.build(party_level, party_size, difficulty)
+    if fast:
+        flavor = default_flavor(encounter)
+    else:
+        flavor = await (await get_ai_dm()).generate_encounter_flavor_async(party_level, party_size, encounter)
+    return {**encounter, **flavor}
+
+async def _pregenerate_encounter(key: Tuple[int, int, Optional[str]]) -> Dict[str, Any]:
+    party_level, party_size, difficulty = key
+    return await build_encounter(party_level, party_size, difficulty)
+
+# Pre-generated encounters per (party_level, party_size, difficulty), refilled
+# in the background so /api/random-encounter usually skips the Gemini round trip
+encounter_pool = PregenPool(
+    "encounter",
+    _pregenerate_encounter,
+    size=int(os.getenv("DM_ENCOUNTER_POOL_SIZE", "2")),
+    max_age=float(os.getenv("DM_ENCOUNTER_POOL_MAX_AGE", "3600")),
+    max_buckets=int(os.getenv("DM_ENCOUNTER_POOL_MAX_BUCKETS", "32"))
+)
+
+async def get_encounter(party_level: int, party_size: int, difficulty: Optional[str] = None, fast: bool = False) -> Dict[str, Any]:
+    """Serve an encounter from the pre-generated pool, building it live on a miss."""
+    if fast:
+        return await build_encounter(party_level, party_size, difficulty, fast=True)
+    key = (party_level, party_size, difficulty)
+    encounter = encounter_pool.take(key)
+    if encounter is None:
+        encounter = await build_encounter(party_level, party_size, difficulty)
+        encounter_pool.warm(key)
+    return encounter
+
+async def get_search_index() -> SearchIndex:
+    """Return the SRD search index, building it once if needed."""
+    global search_index
+    if search_index is None:
+        async with _search_index_lock:
+            if search_index is None:
+                search_index = await SearchIndex.build(get_dnd_api())
+    return search_index
 
 # Request/Response Models
 class ChatMessage(BaseModel):
@@ -35,125 +276,693 @@ class ChatMessage(BaseModel):
     character: Optional[Dict[str, Any]] = None
     game_session: Optional[Dict[str, Any]] = None
     chat_history: Optional[List[Dict[str, Any]]] = None
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     message: str
     suggestions: Optional[List[str]] = None
+    session_id: Optional[str] = None
+    usage: Optional[Dict[str, Any]] = None
+    # Rolls and outcome of a mechanical action resolved without Gemini
+    resolution: Optional[Dict[str, Any]] = None
+
+class PartyTurnRequest(BaseModel):
+    session_id: str = Field(..., min_length=1)
+    player_id: str = Field(..., min_length=1, max_length=64)
+    message: str
+    character: Optional[Dict[str, Any]] = None
+    game_session: Optional[Dict[str, Any]] = None
+    # Close the round as soon as this many players have acted
+    party_size: Optional[int] = Field(None, ge=1, le=20)
+
+class PartyTurnResponse(BaseModel):
+    session_id: str
+    player_id: str
+    narration: str
+    message: str
+    suggestions: List[str]
+    resolution: Optional[Dict[str, Any]] = None
+    # Every player's result for the round, keyed by player id
+    players: Dict[str, Dict[str, Any]]
+    usage: Optional[Dict[str, Any]] = None
+
+class SessionRequest(BaseModel):
+    chat_history: Optional[List[Dict[str, Any]]] = None
+
+class SessionResponse(BaseModel):
+    session_id: str
+    summary: str
+    messages: List[Dict[str, Any]]
 
 class EncounterRequest(BaseModel):
-    party_level: int
-    party_size: int
+    party_level: int = Field(..., ge=1, le=20)
+    party_size: int = Field(..., ge=1, le=20)
+    difficulty: Optional[str] = None
+    fast: bool = False
+
+class EncounterBatchRequest(EncounterRequest):
+    count: int = Field(5, ge=1, le=50)
 
 class EncounterResponse(BaseModel):
     description: str
     monsters: List[Dict[str, Any]]
     difficulty: str
+    setting: Optional[str] = None
+    tactics: Optional[str] = None
+    total_xp: Optional[int] = None
+    adjusted_xp: Optional[int] = None
+
+class EncounterBatchResponse(BaseModel):
+    encounters: List[EncounterResponse]
+
+class RollRequest(BaseModel):
+    notation: str = Field(..., max_length=100)
+    count: int = Field(1, ge=1, le=dice.MAX_BATCH)
+    include_stats: bool = False
+    include_distribution: bool = False
+    target: Optional[int] = None
+
+class RollResponse(BaseModel):
+    notation: str
+    total: Optional[int] = None
+    terms: Optional[List[Dict[str, Any]]] = None
+    totals: Optional[List[int]] = None
+    stats: Optional[Dict[str, Any]] = None
+    probability: Optional[float] = None
+    distribution: Optional[Dict[int, float]] = None
 
 @app.get("/")
 async def root():
     return {"message": "AI Dungeon Master API is running!", "status": "healthy"}
 
+async def _seed_session(session_id: str, chat_history: Optional[List[Dict[str, Any]]]) -> None:
+    """Copy client-side chat history into a freshly created session."""
+    for msg in chat_history or []:
+        if msg.get("type") in ("player", "dm") and msg.get("content"):
+            await session_store.append(session_id, msg["type"], msg["content"])
+
+async def _chat_context(request: ChatMessage) -> Dict[str, Any]:
+    """
+    Resolve the history to send to the model for a chat request.
+
+    With a session_id the server-side log and summary are used and the
+    client's chat_history is ignored. An unknown or expired session is a 404,
+    so the client knows to create a new session from its own history
+    (POST /api/sessions) instead of silently continuing without it.
+    """
+    if not request.session_id:
+        return {"chat_history": request.chat_history or []}
+
+    try:
+        summary, recent = await session_store.context(request.session_id)
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"chat_history": list(recent), "summary": summary}
+
+async def _record_turn(dm: AIDungeonMaster, request: ChatMessage, dm_message: str) -> None:
+    """Append a finished turn to the request's session and compact it if needed."""
+    if request.session_id:
+        await session_store.append(request.session_id, "player", request.message)
+        await session_store.append(request.session_id, "dm", dm_message)
+        session_store.schedule_compaction(request.session_id, dm.summarize_history_async)
+
+@app.post("/api/sessions", response_model=SessionResponse)
+async def create_session(request: SessionRequest):
+    """
+    Create a server-side chat session, optionally seeded with existing history.
+    """
+    session = await session_store.create()
+    await _seed_session(session["id"], request.chat_history)
+    return SessionResponse(session_id=session["id"], summary=session["summary"], messages=session["messages"])
+
+@app.get("/api/sessions/{session_id}", response_model=SessionResponse)
+async def get_session(session_id: str):
+    """
+    Get a session's summary and full message log.
+    """
+    session = await session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return SessionResponse(session_id=session["id"], summary=session["summary"], messages=session["messages"])
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """
+    Delete a session.
+    """
+    if not await session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return {"deleted": session_id}
+
+def _set_admission_key(session_id: Optional[str], http_request: Request) -> None:
+    """Queue this request's model calls under its session, or its client address without one."""
+    client = http_request.client.host if http_request.client else "anonymous"
+    current_session.set(session_id or client)
+
+def _rate_limited(e: RateLimitedError) -> HTTPException:
+    """Turn an admission rejection into a fast 429 with a Retry-After hint."""
+    print(f"[WARNING] Rejected model call: {str(e)}")
+    return HTTPException(
+        status_code=429,
+        detail=f"The Dungeon Master is busy, try again in {e.retry_after}s: {str(e)}",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def _model_unavailable(e: ModelUnavailableError) -> HTTPException:
+    """Turn an all-circuits-open error into a 503 with a Retry-After hint."""
+    print(f"[ERROR] No Gemini model available: {str(e)}")
+    return HTTPException(
+        status_code=503,
+        detail=f"The Dungeon Master is unavailable, try again in {e.retry_after}s: {str(e)}",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat_with_dm(request: ChatMessage):
+async def chat_with_dm(request: ChatMessage, http_request: Request):
     """
     Send a message to the AI Dungeon Master and get a response.
     """
     try:
-        print(f"[INFO] Received chat request: {request.message[:50]}...")
+        log.debug("Received chat request: %s...", request.message[:50])
+        
+        dm = await get_ai_dm()
+        _set_admission_key(request.session_id, http_request)
+        schedule_rules_index()
         
         # Get response from AI DM
-        response = ai_dm.generate_response(
+        response = await dm.generate_response_async(
             message=request.message,
             character=request.character,
             game_session=request.game_session,
-            chat_history=request.chat_history or []
+            **(await _chat_context(request))
         )
-        
-        print(f"[INFO] Generated response successfully")
+        await _record_turn(dm, request, response["message"])
         
         return ChatResponse(
             message=response["message"],
-            suggestions=response.get("suggestions", [])
+            suggestions=response.get("suggestions", []),
+            session_id=request.session_id,
+            usage=response.get("usage"),
+            resolution=response.get("resolution")
         )
+    except HTTPException:
+        raise
+    except SessionNotFoundError as e:
+        # Deleted or expired while the turn was being generated
+        raise HTTPException(status_code=404, detail=str(e))
+    except RateLimitedError as e:
+        raise _rate_limited(e)
+    except ModelUnavailableError as e:
+        raise _model_unavailable(e)
+    except GenerationTimeoutError as e:
+        print(f"[ERROR] Chat generation timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=f"AI response timed out: {str(e)}")
     except Exception as e:
         print(f"[ERROR] Error in chat endpoint: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error generating AI response: {str(e)}")
 
-@app.post("/api/random-encounter", response_model=EncounterResponse)
-async def generate_random_encounter(request: EncounterRequest):
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a single Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/chat/stream")
+async def stream_chat_with_dm(request: ChatMessage, http_request: Request):
     """
-    Generate a random encounter for the party.
+    Stream the AI Dungeon Master's response as Server-Sent Events.
+
+    Emits "chunk" events with narration text as it is generated, then a
+    "suggestions" event and a final "done" event with the full message.
+    Failures before the first chunk get a regular HTTP error status (429,
+    503, 504, 500); failures after the stream has started are reported as an
+    "error" event.
     """
+    log.debug("Received streaming chat request: %s...", request.message[:50])
+    dm = await get_ai_dm()
+    _set_admission_key(request.session_id, http_request)
+    schedule_rules_index()
+    
+    events = dm.stream_response_async(
+        message=request.message,
+        character=request.character,
+        game_session=request.game_session,
+        **(await _chat_context(request))
+    )
+    # Wait for the first event before sending headers, so admission and
+    # timeout failures are reported with a proper status code
     try:
-        print(f"[INFO] Generating encounter for level {request.party_level}, size {request.party_size}")
+        first = await events.__anext__()
+    except RateLimitedError as e:
+        raise _rate_limited(e)
+    except ModelUnavailableError as e:
+        raise _model_unavailable(e)
+    except GenerationTimeoutError as e:
+        print(f"[ERROR] Chat generation timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=f"AI response timed out: {str(e)}")
+    except Exception as e:
+        print(f"[ERROR] Error in streaming chat endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating AI response: {str(e)}")
+
+    async def all_events():
+        yield first
+        async for event in events:
+            yield event
+
+    async def event_stream():
+        try:
+            async for event in all_events():
+                if event["type"] == "chunk":
+                    yield _sse_event("chunk", {"text": event["text"]})
+                else:
+                    await _record_turn(dm, request, event["message"])
+                    yield _sse_event("suggestions", {"suggestions": event["suggestions"]})
+                    done = {"message": event["message"], "session_id": request.session_id, "usage": event["usage"]}
+                    if event.get("resolution"):
+                        done["resolution"] = event["resolution"]
+                    yield _sse_event("done", done)
+        except Exception as e:
+            print(f"[ERROR] Error in streaming chat endpoint: {str(e)}")
+            yield _sse_event("error", {"detail": f"Error generating AI response: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def _resolve_party_round(session_id: str, actions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Resolve one party round with a single generation and log it to the session."""
+    dm = await get_ai_dm()
+    summary, recent = await session_store.context(session_id)
+    game_session = next((action["game_session"] for action in reversed(actions) if action.get("game_session")), None)
+
+    result = await dm.generate_party_turn_async(actions, game_session=game_session, chat_history=list(recent), summary=summary)
+
+    for action in actions:
+        name = (action.get("character") or {}).get("name") or action["player_id"]
+        await session_store.append(session_id, "player", f"{name}: {action['message']}")
+    narration = [result["narration"]] + [result["players"][action["player_id"]]["message"] for action in actions]
+    await session_store.append(session_id, "dm", "\n\n".join(part for part in narration if part))
+    session_store.schedule_compaction(session_id, dm.summarize_history_async)
+    return result
+
+# Actions each session's players submit within DM_PARTY_TURN_WINDOW seconds
+# of each other are resolved together in one generation
+party_turns = PartyTurnBatcher(_resolve_party_round)
+
+@app.post("/api/party-turn", response_model=PartyTurnResponse)
+async def party_turn(request: PartyTurnRequest, http_request: Request):
+    """
+    Submit one player's action for the party's current round.
+
+    Actions that arrive for the same session within a short window are
+    resolved together in a single generation, so players see each other's
+    simultaneous actions in the narration. Each player gets the shared
+    narration, their own narration and suggestions, and every other
+    player's result. The session must exist (see POST /api/sessions).
+    """
+    try:
+        log.debug("Received party action from %s: %s...", request.player_id, request.message[:50])
+        if await session_store.get(request.session_id) is None:
+            raise HTTPException(status_code=404, detail=f"Session {request.session_id} not found")
+        _set_admission_key(request.session_id, http_request)
+        schedule_rules_index()
         
-        encounter = ai_dm.generate_encounter(
-            party_level=request.party_level,
+        result = await party_turns.submit(
+            request.session_id,
+            request.player_id,
+            {"message": request.message, "character": request.character, "game_session": request.game_session},
             party_size=request.party_size
         )
+        player = result["players"][request.player_id]
         
-        return EncounterResponse(
-            description=encounter["description"],
-            monsters=encounter.get("monsters", []),
-            difficulty=encounter.get("difficulty", "medium")
+        return PartyTurnResponse(
+            session_id=request.session_id,
+            player_id=request.player_id,
+            narration=result["narration"],
+            message=player["message"],
+            suggestions=player["suggestions"],
+            resolution=player["resolution"],
+            players=result["players"],
+            usage=result.get("usage")
         )
+    except HTTPException:
+        raise
+    except SessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RateLimitedError as e:
+        raise _rate_limited(e)
+    except ModelUnavailableError as e:
+        raise _model_unavailable(e)
+    except GenerationTimeoutError as e:
+        print(f"[ERROR] Party turn generation timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=f"AI response timed out: {str(e)}")
+    except Exception as e:
+        print(f"[ERROR] Error in party turn endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating AI response: {str(e)}")
+
+@app.post("/api/random-encounter", response_model=EncounterResponse)
+async def generate_random_encounter(request: EncounterRequest, http_request: Request):
+    """
+    Generate a random encounter for the party. Served from the pre-generated
+    pool when one is ready for this party level, size and difficulty.
+    """
+    try:
+        _set_admission_key(None, http_request)
+        log.debug("Generating encounter for level %s, size %s", request.party_level, request.party_size)
+        
+        encounter = await get_encounter(
+            party_level=request.party_level,
+            party_size=request.party_size,
+            difficulty=request.difficulty,
+            fast=request.fast
+        )
+        
+        return EncounterResponse(**encounter)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RateLimitedError as e:
+        raise _rate_limited(e)
+    except ModelUnavailableError as e:
+        raise _model_unavailable(e)
+    except GenerationTimeoutError as e:
+        print(f"[ERROR] Encounter generation timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=f"Encounter generation timed out: {str(e)}")
     except Exception as e:
         print(f"[ERROR] Error generating encounter: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating encounter: {str(e)}")
 
+@app.post("/api/random-encounter/batch", response_model=EncounterBatchResponse)
+async def generate_random_encounters(request: EncounterBatchRequest, http_request: Request):
+    """
+    Generate several random encounters for the party in one request.
+    """
+    try:
+        _set_admission_key(None, http_request)
+        log.debug("Generating %s encounters for level %s, size %s", request.count, request.party_level, request.party_size)
+        
+        encounters = await asyncio.gather(*(
+            get_encounter(
+                party_level=request.party_level,
+                party_size=request.party_size,
+                difficulty=request.difficulty,
+                fast=request.fast
+            )
+            for _ in range(request.count)
+        ))
+        
+        return EncounterBatchResponse(encounters=[EncounterResponse(**encounter) for encounter in encounters])
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RateLimitedError as e:
+        raise _rate_limited(e)
+    except ModelUnavailableError as e:
+        raise _model_unavailable(e)
+    except GenerationTimeoutError as e:
+        print(f"[ERROR] Encounter generation timed out: {str(e)}")
+        raise HTTPException(status_code=504, detail=f"Encounter generation timed out: {str(e)}")
+    except Exception as e:
+        print(f"[ERROR] Error generating encounters: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error generating encounters: {str(e)}")
+
+@app.post("/api/roll", response_model=RollResponse)
+async def roll_dice(request: RollRequest):
+    """
+    Roll dice notation such as "4d6kh3", "1d20+5 advantage" or "2d6!+3".
+    With count > 1 only the totals are returned. Stats, the probability of
+    meeting `target` and the full distribution are computed exactly, and
+    only when asked for.
+    """
+    try:
+        expression = dice.parse(request.notation)
+        response = RollResponse(notation=request.notation)
+
+        if request.count == 1:
+            result = expression.roll()
+            response.total = result["total"]
+            response.terms = result["terms"]
+        else:
+            # Large batches can take a while without numpy; keep the event loop free
+            response.totals = await asyncio.to_thread(expression.roll_many, request.count)
+
+        if request.include_stats or request.target is not None or request.include_distribution:
+            # Exact distributions can take a moment too; computed once per parsed expression
+            distribution = await asyncio.to_thread(expression.distribution)
+            if request.include_stats:
+                response.stats = expression.stats()
+            if request.target is not None:
+                response.probability = round(expression.probability_at_least(request.target), 6)
+            if request.include_distribution:
+                response.distribution = {value: round(prob, 8) for value, prob in distribution.items()}
+
+        return response
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Most indexes a bulk lookup may ask for at once
+MAX_BULK_IDS = 100
+
+async def _bulk_details(category: str, ids: str) -> Dict[str, Any]:
+    """
+    Look up several items of one category by a comma-separated list of
+    indexes. Results keep the requested order; unknown indexes are listed
+    under "missing".
+    """
+    indexes = list(dict.fromkeys(index.strip().lower() for index in ids.split(",") if index.strip()))
+    if not indexes:
+        raise HTTPException(status_code=400, detail="ids must list at least one index")
+    if len(indexes) > MAX_BULK_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_IDS} ids can be looked up at once")
+    invalid = [index for index in indexes if not index.replace("-", "").isalnum()]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid ids: {', '.join(invalid)}")
+    
+    details = await get_dnd_api().get_details_many(category, indexes)
+    return {
+        "results": [details[index] for index in indexes if index in details],
+        "missing": [index for index in indexes if index not in details]
+    }
+
 @app.get("/api/spells")
-async def get_spells():
+async def get_spells(http_request: Request, ids: Optional[str] = None):
     """
-    Get list of all D&D 5E spells.
+    Get list of all D&D 5E spells, or the details of the spells listed in
+    ids (e.g. ?ids=fireball,shield).
     """
     try:
-        spells = await dnd_api.get_spells()
-        return {"results": spells}
+        if ids is not None:
+            return await _bulk_details("spells", ids)
+        spells = await get_dnd_api().get_spells()
+        return srd_responses.respond(http_request, "spells", spells, {"results": spells})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching spells: {str(e)}")
 
 @app.get("/api/spells/{spell_index}")
-async def get_spell_details(spell_index: str):
+async def get_spell_details(spell_index: str, http_request: Request):
     """
     Get detailed information about a specific spell.
     """
     try:
-        spell = await dnd_api.get_spell_details(spell_index)
-        return spell
+        spell = await get_dnd_api().get_spell_details(spell_index)
+        return srd_responses.respond(http_request, f"spells/{spell_index}", spell)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching spell details: {str(e)}")
 
 @app.get("/api/monsters")
-async def get_monsters():
+async def get_monsters(http_request: Request, ids: Optional[str] = None):
     """
-    Get list of all D&D 5E monsters.
+    Get list of all D&D 5E monsters, or the details of the monsters listed
+    in ids (e.g. ?ids=goblin,owlbear).
     """
     try:
-        monsters = await dnd_api.get_monsters()
-        return {"results": monsters}
+        if ids is not None:
+            return await _bulk_details("monsters", ids)
+        monsters = await get_dnd_api().get_monsters()
+        return srd_responses.respond(http_request, "monsters", monsters, {"results": monsters})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching monsters: {str(e)}")
 
 @app.get("/api/monsters/{monster_index}")
-async def get_monster_details(monster_index: str):
+async def get_monster_details(monster_index: str, http_request: Request):
     """
     Get detailed information about a specific monster.
     """
     try:
-        monster = await dnd_api.get_monster_details(monster_index)
-        return monster
+        monster = await get_dnd_api().get_monster_details(monster_index)
+        return srd_responses.respond(http_request, f"monsters/{monster_index}", monster)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching monster details: {str(e)}")
 
+@app.get("/api/equipment")
+async def get_equipment(http_request: Request, ids: Optional[str] = None):
+    """
+    Get list of all D&D 5E equipment, or the details of the items listed in
+    ids (e.g. ?ids=longsword,chain-mail).
+    """
+    try:
+        if ids is not None:
+            return await _bulk_details("equipment", ids)
+        equipment = await get_dnd_api().get_equipment()
+        return srd_responses.respond(http_request, "equipment", equipment, {"results": equipment})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching equipment: {str(e)}")
+
+@app.get("/api/equipment/{equipment_index}")
+async def get_equipment_details(equipment_index: str, http_request: Request):
+    """
+    Get detailed information about a specific piece of equipment.
+    """
+    try:
+        equipment = await get_dnd_api().get_equipment_details(equipment_index)
+        return srd_responses.respond(http_request, f"equipment/{equipment_index}", equipment)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching equipment details: {str(e)}")
+
+@app.get("/api/classes")
+async def get_classes(http_request: Request):
+    """
+    Get list of all D&D 5E character classes.
+    """
+    try:
+        classes = await get_dnd_api().get_classes()
+        return srd_responses.respond(http_request, "classes", classes, {"results": classes})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching classes: {str(e)}")
+
+@app.get("/api/races")
+async def get_races(http_request: Request):
+    """
+    Get list of all D&D 5E character races.
+    """
+    try:
+        races = await get_dnd_api().get_races()
+        return srd_responses.respond(http_request, "races", races, {"results": races})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching races: {str(e)}")
+
+@app.get("/api/search")
+async def search_srd(
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    level: Optional[int] = None,
+    school: Optional[str] = None,
+    spell_class: Optional[str] = Query(None, alias="class"),
+    cr: Optional[float] = None,
+    min_cr: Optional[float] = None,
+    max_cr: Optional[float] = None,
+    type: Optional[str] = None,
+    size: Optional[str] = None,
+    equipment_category: Optional[str] = None,
+    fuzzy: bool = True,
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Search spells, monsters, equipment, classes and races by name and attributes.
+    """
+    try:
+        index = await get_search_index()
+        return index.search(
+            query=q,
+            category=category,
+            filters={
+                "level": level,
+                "school": school,
+                "class": spell_class,
+                "challenge_rating": cr,
+                "type": type,
+                "size": size,
+                "equipment_category": equipment_category,
+            },
+            min_cr=min_cr,
+            max_cr=max_cr,
+            limit=limit,
+            offset=offset,
+            fuzzy=fuzzy
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching SRD data: {str(e)}")
+
+@app.get("/api/llm/stats")
+async def get_llm_stats():
+    """
+    Get system-instruction tokens sent and prompt tokens served from Gemini's
+    implicit cache, admission control counters, the circuit breaker state of
+    each model, how many turns skipped Gemini, response cache hit rates and
+    party-turn batching.
+    """
+    dm = await get_ai_dm()
+    return {
+        **dm.get_prefix_stats(),
+        "admission": dm.admission.get_stats(),
+        "models": dm.get_model_stats(),
+        "fast_path": dm.action_resolver.get_stats() if dm.action_resolver is not None else None,
+        "response_cache": dm.response_cache.get_stats(),
+        "party_turns": party_turns.get_stats(),
+    }
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """
+    Get SRD cache hit/miss counters, prepared response counters and the rules index size.
+    """
+    return {
+        **get_dnd_api().get_cache_stats(),
+        "responses": srd_responses.get_stats(),
+        "rules_index_entries": len(rules_index) if rules_index is not None else None,
+    }
+
+@app.get("/api/pregen/stats")
+async def get_pregen_stats():
+    """
+    Get pre-generated encounter pool hit rate and contents.
+    """
+    return {"encounter": encounter_pool.get_stats()}
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus metrics: per-stage latency histograms, Gemini calls, tokens
+    and estimated cost, SRD cache results and upstream requests.
+    """
+    if dnd_api is not None:
+        metrics.SRD_CACHE_ENTRIES.set(dnd_api.cache.get_stats()["memory_entries"])
+    metrics.SESSIONS_ACTIVE.set(await session_store.count())
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     """
-    Health check endpoint.
+    Liveness probe: the process is up and serving requests.
     """
     return {"status": "healthy", "message": "AI Dungeon Master API is operational"}
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe: 200 once the AI Dungeon Master is initialized, 503 before
+    that or if initialization failed. Also reports startup timings.
+    """
+    if ai_dm is None:
+        # Without the lifespan hook (e.g. an embedded app) the first probe starts initialization
+        if startup_state["ai_dm"] == "pending":
+            asyncio.create_task(get_ai_dm_or_none())
+        return JSONResponse(status_code=503, content={"status": "not ready", **startup_state})
+    return {"status": "ready", **startup_state}
+
+startup_state["import_seconds"] = round(time.perf_counter() - _import_started, 4)
+
 if __name__ == "__main__":
     uvicorn.run(
         "server:app",
@@ -0,0 +1,260 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Tuple
+
+from shared_store import SharedStore, get_shared_store
+
+# summarize(previous_summary, messages) -> new summary
+Summarizer = Callable[[str, List[Dict[str, Any]]], Awaitable[str]]
+
+
+class SessionNotFoundError(Exception):
+    """The session doesn't exist (never created, deleted or expired)."""
+
+
+class SessionStore:
+    """Server-side chat sessions with rolling history summarization.
+
+    Each session keeps an append-only message log plus a running summary of
+    every message before `summarized_upto`. Once the unsummarized tail grows
+    past `compact_threshold`, all but the last `keep_recent` messages are
+    folded into the summary by a background task, so the prompt only ever
+    carries the summary and a short tail of recent turns.
+
+    With a shared store (DM_SHARED_STATE) sessions live there instead of in
+    process memory, so any worker can serve any session and sessions survive
+    restarts. Messages are stored one row each next to a small session
+    record, so appending one costs the same however long the session is,
+    and each worker only reads the messages it hasn't seen yet. Every change
+    is atomic and runs on the store's threads, so the event loop never
+    waits on the database.
+
+    Session IDs are always generated here. A session with no new messages
+    for `idle_ttl` seconds expires, and beyond `max_sessions` the least
+    recently active sessions are evicted.
+    """
+
+    def __init__(
+        self,
+        keep_recent: Optional[int] = None,
+        compact_threshold: Optional[int] = None,
+        store: Optional[SharedStore] = None,
+        max_sessions: Optional[int] = None,
+        idle_ttl: Optional[float] = None
+    ):
+        self.keep_recent = keep_recent or int(os.getenv("SESSION_KEEP_RECENT", "4"))
+        self.compact_threshold = compact_threshold or int(os.getenv("SESSION_COMPACT_THRESHOLD", "12"))
+        self.max_sessions = max_sessions or int(os.getenv("SESSION_MAX", "1000"))
+        self.idle_ttl = idle_ttl or float(os.getenv("SESSION_IDLE_TTL", "86400"))
+        self.store = store if store is not None else get_shared_store()
+        # All sessions, or with a shared store the local copies of the ones
+        # this worker has seen (updated in place, so callers see new messages);
+        # least recently active first
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._compactions: Dict[str, asyncio.Task] = {}
+
+    async def count(self) -> int:
+        """Number of live sessions."""
+        if self.store is not None:
+            return await self.store.run(self.store.count, "sessions")
+        return len(self._sessions)
+
+    async def create(self) -> Dict[str, Any]:
+        """Create a new, empty session under a fresh ID."""
+        now = time.time()
+        session = {
+            "id": uuid.uuid4().hex,
+            "messages": [],
+            "summary": "",
+            "summarized_upto": 0,
+            "created_at": now,
+            "last_active": now,
+        }
+        if self.store is not None:
+            for session_id in await self.store.run(self._store_new, session):
+                self._forget(session_id)
+        else:
+            self._evict()
+        self._sessions[session["id"]] = session
+        self._trim_local()
+        return session
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get a session by ID, or None if it doesn't exist or has expired."""
+        if self.store is not None:
+            local = self._sessions.get(session_id)
+            start = len(local["messages"]) if local else 0
+            header, messages = await self.store.run(self._load, session_id, start)
+            session = self._refresh(session_id, local, start, header, messages)
+        else:
+            session = self._sessions.get(session_id)
+        if session is not None and self._expired(session):
+            await self.delete(session_id)
+            return None
+        return session
+
+    async def delete(self, session_id: str) -> bool:
+        """Delete a session and cancel any pending compaction."""
+        task = self._compactions.pop(session_id, None)
+        if task:
+            task.cancel()
+        deleted = self._sessions.pop(session_id, None) is not None
+        if self.store is not None:
+            deleted = await self.store.run(self.store.delete, "sessions", session_id)
+        return deleted
+
+    async def append(self, session_id: str, message_type: str, content: str) -> Dict[str, Any]:
+        """Append a message to a session's log.
+
+        Raises SessionNotFoundError if the session is gone (e.g. deleted
+        while the turn was being generated).
+        """
+        now = time.time()
+        message = {
+            "type": message_type,
+            "content": content,
+            "timestamp": now,
+        }
+        if self.store is not None:
+            def add(header: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+                if header is None:
+                    raise SessionNotFoundError(f"Session {session_id} not found")
+                header["last_active"] = now
+                return header
+            local = self._sessions.get(session_id)
+            start = len(local["messages"]) if local else 0
+            header, messages = await self.store.run(self._store_message, session_id, message, add, start)
+            self._refresh(session_id, local, start, header, messages)
+        else:
+            session = await self.get(session_id)
+            if session is None:
+                raise SessionNotFoundError(f"Session {session_id} not found")
+            session["messages"].append(message)
+            session["last_active"] = now
+            self._sessions.move_to_end(session_id)
+        return message
+
+    async def context(self, session_id: str) -> Tuple[str, List[Dict[str, Any]]]:
+        """Get the running summary and the messages it doesn't cover yet."""
+        session = await self.get(session_id)
+        if session is None:
+            raise SessionNotFoundError(f"Session {session_id} not found")
+        return session["summary"], session["messages"][session["summarized_upto"]:]
+
+    def schedule_compaction(self, session_id: str, summarize: Summarizer) -> None:
+        """Start a background compaction if the unsummarized tail is too long."""
+        session = self._sessions.get(session_id)
+        if session is None or session_id in self._compactions:
+            return
+        if len(session["messages"]) - session["summarized_upto"] <= self.compact_threshold:
+            return
+
+        task = asyncio.create_task(self.compact(session_id, summarize))
+        self._compactions[session_id] = task
+        task.add_done_callback(lambda _: self._compactions.pop(session_id, None))
+
+    async def compact(self, session_id: str, summarize: Summarizer) -> None:
+        """Fold all but the most recent messages into the session summary."""
+        session = await self.get(session_id)
+        if session is None:
+            return
+
+        start = session["summarized_upto"]
+        upto = len(session["messages"]) - self.keep_recent
+        if upto <= start:
+            return
+
+        try:
+            summary = await summarize(session["summary"], session["messages"][start:upto])
+        except Exception as e:
+            print(f"[WARNING] Failed to compact session {session_id}: {str(e)}")
+            return
+
+        if self.store is not None:
+            def apply(current: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+                # Skip if the session was deleted or another worker compacted it meanwhile
+                if current is None or current["summarized_upto"] != start:
+                    return None
+                current["summary"] = summary
+                current["summarized_upto"] = upto
+                return current
+            updated = await self.store.run(self.store.update, "sessions", session_id, apply)
+            if updated is None:
+                return
+            self._refresh(session_id, session, len(session["messages"]), updated, [])
+        else:
+            session["summary"] = summary
+            session["summarized_upto"] = upto
+        print(f"[INFO] Compacted session {session_id} up to message {upto}")
+
+    def _expired(self, session: Dict[str, Any]) -> bool:
+        return time.time() - session.get("last_active", session["created_at"]) > self.idle_ttl
+
+    def _store_new(self, session: Dict[str, Any]) -> List[str]:
+        """Save a new session in the shared store, making room for it first.
+        Returns the IDs of the sessions evicted. Runs on the store's threads."""
+        evicted = self.store.prune("sessions", time.time() - self.idle_ttl, self.max_sessions - 1)
+        self.store.set("sessions", session["id"], {key: value for key, value in session.items() if key != "messages"})
+        return evicted
+
+    def _load(self, session_id: str, start: int) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Read a session's record and its messages from position `start` on.
+        Runs on the store's threads."""
+        header = self.store.get("sessions", session_id)
+        if header is None:
+            return None, []
+        return header, self.store.log("sessions", session_id, start)
+
+    def _store_message(
+        self, session_id: str, message: Dict[str, Any], add: Callable[[Optional[Dict[str, Any]]], Dict[str, Any]], start: int
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Append a message row and update the session record, then read back
+        the messages from position `start` on. Runs on the store's threads."""
+        header = self.store.append("sessions", session_id, message, add)
+        return header, self.store.log("sessions", session_id, start)
+
+    def _evict(self) -> None:
+        """Drop expired sessions, then the least recently active beyond the cap (making room for one more)."""
+        for session_id in [sid for sid, session in self._sessions.items() if self._expired(session)]:
+            self._forget(session_id)
+        while self._sessions and len(self._sessions) >= self.max_sessions:
+            self._forget(next(iter(self._sessions)))
+
+    def _forget(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+        task = self._compactions.pop(session_id, None)
+        if task:
+            task.cancel()
+
+    def _trim_local(self) -> None:
+        """Bound this worker's copies of shared sessions (the store keeps the originals)."""
+        while len(self._sessions) > self.max_sessions:
+            self._forget(next(iter(self._sessions)))
+
+    def _refresh(
+        self,
+        session_id: str,
+        local: Optional[Dict[str, Any]],
+        start: int,
+        header: Optional[Dict[str, Any]],
+        messages: List[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """Update this worker's copy of a session from the shared store.
+
+        `local` is the copy as it was when the messages from position `start`
+        on were read; other reads may have extended it since.
+        """
+        if header is None:
+            self._sessions.pop(session_id, None)
+            return None
+        if local is None:
+            local = {"messages": []}
+        local.update(header)
+        local["messages"].extend(messages[len(local["messages"]) - start:])
+        self._sessions[session_id] = local
+        self._sessions.move_to_end(session_id)
+        self._trim_local()
+        return local
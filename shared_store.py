@@ -0,0 +1,229 @@
+import asyncio
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class SharedStore:
+    """Key/value state shared by every worker process, in one SQLite file.
+
+    WAL mode lets readers in all workers proceed while one writer commits, so
+    each worker can run on its own core against the same SRD cache, sessions
+    and rate-limit buckets. Values are JSON, grouped by namespace.
+    Read-modify-write goes through update(), which holds the database write
+    lock for the whole change so concurrent workers never lose an update.
+    A value can also have an append-only log of items (e.g. a session's
+    messages), stored one row per item so adding one never rewrites the rest.
+
+    Every method blocks (on disk, or for up to `busy_timeout` seconds on
+    another worker's write lock), so async code calls them through run(),
+    which uses the store's own threads instead of the event loop.
+    """
+
+    def __init__(self, path: str, busy_timeout: Optional[float] = None, threads: Optional[int] = None):
+        self.path = path
+        self.busy_timeout = busy_timeout if busy_timeout is not None else float(os.getenv("DM_SHARED_STATE_BUSY_TIMEOUT", "10"))
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        # One connection per thread, in autocommit mode with explicit
+        # transactions in update(), so a thread waiting on the write lock
+        # never holds up reads in the others
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=threads or int(os.getenv("DM_SHARED_STATE_THREADS", "8")),
+            thread_name_prefix="shared-store"
+        )
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS log ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " value TEXT NOT NULL,"
+            " PRIMARY KEY (namespace, key, seq)"
+            ") WITHOUT ROWID"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run `fn(*args)`, a blocking call into this store, on the store's threads."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args))
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        row = self._connection().execute("SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), time.time())
+        )
+
+    def delete(self, namespace: str, key: str) -> bool:
+        """Delete a value and its log."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+            conn.execute("DELETE FROM log WHERE namespace = ? AND key = ?", (namespace, key))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount > 0
+
+    def update(
+        self,
+        namespace: str,
+        key: str,
+        change: Callable[[Optional[Any]], Optional[Any]],
+        busy_timeout: Optional[float] = None
+    ) -> Optional[Any]:
+        """Atomically replace a value with change(current value or None).
+
+        Returning None from `change` leaves the stored value as it was.
+        Returns the new value (or None). `busy_timeout` overrides how long to
+        wait for another worker's write lock before raising
+        sqlite3.OperationalError.
+        """
+        conn = self._connection()
+        if busy_timeout is not None:
+            conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout * 1000)}")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+                value = change(json.loads(row[0]) if row else None)
+                if value is not None:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                        (namespace, key, json.dumps(value), time.time())
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            if busy_timeout is not None:
+                conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+        return value
+
+    def append(self, namespace: str, key: str, item: Any, change: Callable[[Optional[Any]], Any]) -> Any:
+        """Atomically add `item` to the end of a value's log and replace the
+        value with change(current value or None).
+
+        `change` may raise to abort without adding anything. Returns the new value.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            value = change(json.loads(row[0]) if row else None)
+            conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), time.time())
+            )
+            conn.execute(
+                "INSERT INTO log (namespace, key, seq, value)"
+                " SELECT ?, ?, COALESCE(MAX(seq) + 1, 0), ? FROM log WHERE namespace = ? AND key = ?",
+                (namespace, key, json.dumps(item), namespace, key)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def log(self, namespace: str, key: str, start: int = 0) -> List[Any]:
+        """A value's log items, from position `start` on."""
+        rows = self._connection().execute(
+            "SELECT value FROM log WHERE namespace = ? AND key = ? AND seq >= ? ORDER BY seq", (namespace, key, start)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def prune(self, namespace: str, older_than: float, keep: int) -> List[str]:
+        """Delete values (and their logs) not written since `older_than` (a
+        timestamp), then the least recently written beyond `keep`. Returns
+        the deleted keys."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT key FROM state WHERE namespace = ? AND updated_at < ?", (namespace, older_than)
+            ).fetchall()
+            rows += conn.execute(
+                "SELECT key FROM state WHERE namespace = ? AND updated_at >= ?"
+                " ORDER BY updated_at DESC LIMIT -1 OFFSET ?", (namespace, older_than, max(keep, 0))
+            ).fetchall()
+            keys = [row[0] for row in rows]
+            conn.executemany("DELETE FROM state WHERE namespace = ? AND key = ?", [(namespace, key) for key in keys])
+            conn.executemany("DELETE FROM log WHERE namespace = ? AND key = ?", [(namespace, key) for key in keys])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return keys
+
+    def keys(self, namespace: str) -> List[str]:
+        rows = self._connection().execute("SELECT key FROM state WHERE namespace = ?", (namespace,)).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self, namespace: str) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM state WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+_shared_store: Optional[SharedStore] = None
+
+
+def get_shared_store() -> Optional[SharedStore]:
+    """The process's shared store, or None when DM_SHARED_STATE is not set.
+
+    Set DM_SHARED_STATE to a SQLite file path (e.g. ".dm_state/shared.db")
+    when running several uvicorn workers, so they share the SRD cache,
+    sessions and rate limits instead of each keeping its own.
+    """
+    global _shared_store
+    path = os.getenv("DM_SHARED_STATE")
+    if not path:
+        return None
+    if _shared_store is None or _shared_store.path != path:
+        _shared_store = SharedStore(path)
+        print(f"[INFO] Using shared state store at {path}")
+    return _shared_store
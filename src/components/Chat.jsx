@@ -1,5 +1,5 @@
 import React, { useState, useRef, useEffect } from 'react';
-import { sendMessage } from '../utils/api';
+import { sendMessage, clearSession } from '../utils/api';
 
 const Chat = ({ character, gameSession }) => {
   const [messages, setMessages] = useState([]);
@@ -52,17 +52,35 @@ const Chat = ({ character, gameSession }) => {
     setInputMessage('');
     setIsLoading(true);
 
+    const dmMessageId = Date.now() + 1;
+
     try {
-      const response = await sendMessage(inputMessage, character, gameSession, messages);
+      // Show the DM's reply as it streams in, replacing the typing indicator
+      const onChunk = (chunk, fullText) => {
+        setIsLoading(false);
+        setMessages(prev => {
+          if (prev.some(msg => msg.id === dmMessageId)) {
+            return prev.map(msg => msg.id === dmMessageId ? { ...msg, content: fullText } : msg);
+          }
+          return [...prev, {
+            id: dmMessageId,
+            type: 'dm',
+            content: fullText,
+            timestamp: new Date().toISOString()
+          }];
+        });
+      };
+
+      const response = await sendMessage(inputMessage, character, gameSession, messages, onChunk);
       
       const dmMessage = {
-        id: Date.now() + 1,
+        id: dmMessageId,
         type: 'dm',
         content: response.message,
         timestamp: new Date().toISOString()
       };
 
-      setMessages(prev => [...prev, dmMessage]);
+      setMessages(prev => [...prev.filter(msg => msg.id !== dmMessageId), dmMessage]);
     } catch (error) {
       const errorMessage = {
         id: Date.now() + 1,
@@ -70,7 +88,7 @@ const Chat = ({ character, gameSession }) => {
         content: `Error: ${error.message}. Please check your connection and try again.`,
         timestamp: new Date().toISOString()
       };
-      setMessages(prev => [...prev, errorMessage]);
+      setMessages(prev => [...prev.filter(msg => msg.id !== dmMessageId), errorMessage]);
     } finally {
       setIsLoading(false);
     }
@@ -91,6 +109,7 @@ const Chat = ({ character, gameSession }) => {
       timestamp: new Date().toISOString()
     }]);
     localStorage.removeItem('dnd_chat_messages');
+    clearSession();
   };
 
   return (
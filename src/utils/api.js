@@ -10,26 +10,156 @@ const getApiBaseUrl = () => {
   return 'http://localhost:8000';
 };
 
-const API_BASE_URL = getApiBaseUrl();
+export const API_BASE_URL = getApiBaseUrl();
 
 console.log('[DEBUG] Using API Base URL:', API_BASE_URL);
 
-export const sendMessage = async (message, character, gameSession, chatHistory) => {
+const SESSION_STORAGE_KEY = 'dnd_session_id';
+
+// Create a server-side chat session, seeded with any history we already have
+export const createSession = async (chatHistory = []) => {
+  const response = await fetch(`${API_BASE_URL}/api/sessions`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ chat_history: chatHistory }),
+  });
+
+  if (!response.ok) {
+    throw new Error(`HTTP error! status: ${response.status}`);
+  }
+
+  const data = await response.json();
+  localStorage.setItem(SESSION_STORAGE_KEY, data.session_id);
+  return data;
+};
+
+export const clearSession = () => {
+  localStorage.removeItem(SESSION_STORAGE_KEY);
+};
+
+// The server keeps the history for a session, so only the new message is sent.
+// Without a session (e.g. it couldn't be created) the full history is sent instead.
+// A new session is seeded with the local history, so nothing is lost.
+const buildChatBody = async (message, character, gameSession, chatHistory) => {
+  let sessionId = localStorage.getItem(SESSION_STORAGE_KEY);
+  if (!sessionId) {
+    try {
+      sessionId = (await createSession(chatHistory)).session_id;
+    } catch (error) {
+      console.error('[ERROR] Failed to create chat session:', error);
+    }
+  }
+
+  if (sessionId) {
+    return { message, character, game_session: gameSession, session_id: sessionId };
+  }
+  return { message, character, game_session: gameSession, chat_history: chatHistory };
+};
+
+// POST a chat message. If the server no longer knows our session (restart,
+// expiry, deletion) it answers 404: start a new session from the local
+// history and send the message again.
+const postChat = async (path, headers, message, character, gameSession, chatHistory) => {
+  const send = async () => fetch(`${API_BASE_URL}${path}`, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify(await buildChatBody(message, character, gameSession, chatHistory)),
+  });
+
+  const response = await send();
+  if (response.status === 404 && localStorage.getItem(SESSION_STORAGE_KEY)) {
+    console.log('[DEBUG] Chat session not found on the server, creating a new one');
+    clearSession();
+    return send();
+  }
+  return response;
+};
+
+// Parse a Server-Sent Events stream, calling onEvent(event, data) per message
+const readEventStream = async (response, onEvent) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      let data = '';
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+};
+
+const streamMessage = async (message, character, gameSession, chatHistory, onChunk) => {
+  console.log('[DEBUG] Streaming message from:', `${API_BASE_URL}/api/chat/stream`);
+
+  const response = await postChat('/api/chat/stream', {
+    'Content-Type': 'application/json',
+    'Accept': 'text/event-stream',
+  }, message, character, gameSession, chatHistory);
+
+  if (!response.ok) {
+    const errorText = await response.text();
+    console.error('[ERROR] Response error:', errorText);
+    throw new Error(`HTTP error! status: ${response.status} - ${errorText}`);
+  }
+
+  let fullMessage = '';
+  let suggestions = [];
+  let streamError = null;
+
+  await readEventStream(response, (event, data) => {
+    if (event === 'chunk') {
+      fullMessage += data.text;
+      onChunk(data.text, fullMessage);
+    } else if (event === 'suggestions') {
+      suggestions = data.suggestions || [];
+    } else if (event === 'done') {
+      fullMessage = data.message;
+    } else if (event === 'error') {
+      streamError = data.detail;
+    }
+  });
+
+  if (streamError) {
+    throw new Error(streamError);
+  }
+
+  return { message: fullMessage, suggestions };
+};
+
+// When onChunk is given, the response is streamed and onChunk(text, fullTextSoFar)
+// is called for every narration chunk; the resolved value has the same shape either way.
+export const sendMessage = async (message, character, gameSession, chatHistory, onChunk) => {
+  if (onChunk) {
+    try {
+      return await streamMessage(message, character, gameSession, chatHistory, onChunk);
+    } catch (error) {
+      console.error('[ERROR] Error streaming message:', error);
+      throw new Error('Failed to send message to AI DM. Please check your connection and try again.');
+    }
+  }
+
   try {
     console.log('[DEBUG] Sending message to:', `${API_BASE_URL}/api/chat`);
 
-    const response = await fetch(`${API_BASE_URL}/api/chat`, {
-      method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
-      body: JSON.stringify({
-        message,
-        character,
-        game_session: gameSession,
-        chat_history: chatHistory
-      }),
-    });
+    const response = await postChat('/api/chat', {
+      'Content-Type': 'application/json',
+    }, message, character, gameSession, chatHistory);
 
     console.log('[DEBUG] Response status:', response.status);
 
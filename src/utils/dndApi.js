@@ -1,4 +1,8 @@
-const DND_API_BASE_URL = 'https://www.dnd5eapi.co/api';
+import { API_BASE_URL } from './api';
+
+// SRD data goes through the backend, which caches it and fans out to
+// dnd5eapi.co only on misses
+const DND_API_BASE_URL = `${API_BASE_URL}/api`;
 
 export const searchSpells = async () => {
   try {
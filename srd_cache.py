@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional, Tuple
+
+from shared_store import SharedStore, get_shared_store
+
+
+class SRDCache:
+    """Two-tier cache for D&D 5E API responses.
+
+    Entries live in an in-memory LRU backed by one JSON file per endpoint on
+    disk, or by the shared store when one is configured (DM_SHARED_STATE), so
+    every worker process reads and warms the same cache. Each entry keeps
+    the upstream ETag / Last-Modified headers so stale entries can be
+    revalidated with a conditional request instead of a full download.
+    Memory hits are served inline; disk and shared-store access runs off
+    the event loop.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        ttl: Optional[float] = None,
+        stale_ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        offline: Optional[bool] = None,
+        store: Optional[SharedStore] = None
+    ):
+        self.store = store if store is not None else get_shared_store()
+        self.cache_dir = cache_dir or os.getenv("SRD_CACHE_DIR", ".srd_cache")
+        # Entries younger than ttl are served as-is; entries younger than
+        # stale_ttl are served immediately while being revalidated in the background
+        self.ttl = ttl if ttl is not None else float(os.getenv("SRD_CACHE_TTL", str(7 * 24 * 3600)))
+        self.stale_ttl = stale_ttl if stale_ttl is not None else float(os.getenv("SRD_CACHE_STALE_TTL", str(30 * 24 * 3600)))
+        self.max_entries = max_entries or int(os.getenv("SRD_CACHE_MAX_ENTRIES", "2048"))
+        # Offline mode never touches the network and serves entries of any age
+        self.offline = offline if offline is not None else os.getenv("SRD_OFFLINE", "").lower() in ("1", "true", "yes")
+
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stale_served": 0,
+            "revalidated": 0,
+            "refreshed": 0,
+            "errors": 0,
+        }
+
+        if self.store is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        snapshot_path = os.getenv("SRD_SNAPSHOT_PATH")
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load_snapshot(snapshot_path)
+
+    async def lookup(self, key: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Find an entry and classify it as "fresh", "stale" or "expired"."""
+        entry = self._memory.get(key)
+        in_memory = entry is not None
+        if in_memory:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+        else:
+            entry = await self._off_loop(self._read_disk, key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None, None
+            self.stats["disk_hits"] += 1
+            self._remember(key, entry)
+
+        age = time.time() - entry["fetched_at"]
+        if in_memory and age >= self.ttl and self.store is not None:
+            # Another worker may have refreshed it already
+            shared = await self._off_loop(self._read_disk, key)
+            if shared is not None and shared["fetched_at"] > entry["fetched_at"]:
+                entry = shared
+                self._remember(key, entry)
+                age = time.time() - entry["fetched_at"]
+        if self.offline or age < self.ttl:
+            return entry, "fresh"
+        if age < self.stale_ttl:
+            return entry, "stale"
+        return entry, "expired"
+
+    async def set(self, key: str, data: Any, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Dict[str, Any]:
+        """Store a freshly downloaded response in both tiers."""
+        entry = {
+            "data": data,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": time.time(),
+        }
+        self._remember(key, entry)
+        await self._off_loop(self._write_disk, key, entry)
+        return entry
+
+    async def touch(self, key: str, entry: Dict[str, Any]) -> None:
+        """Mark an entry as fresh again after a 304 Not Modified."""
+        entry["fetched_at"] = time.time()
+        self._remember(key, entry)
+        await self._off_loop(self._write_disk, key, entry)
+
+    def conditional_headers(self, entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """Build revalidation headers for an existing entry."""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters along with the current cache size."""
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "offline": self.offline,
+        }
+
+    def save_snapshot(self, path: str) -> int:
+        """Write every cached entry (memory and disk) to a single snapshot file."""
+        entries = {}
+        if self.store is not None:
+            keys = self.store.keys("srd")
+        else:
+            keys = [self._key_from_filename(filename) for filename in os.listdir(self.cache_dir) if filename.endswith(".json")]
+        for key in keys:
+            entry = self._read_disk(key)
+            if entry is not None:
+                entries[key] = entry
+        entries.update(self._memory)
+
+        self._atomic_write(path, {"version": 1, "entries": entries})
+        print(f"[INFO] Saved SRD snapshot with {len(entries)} entries to {path}")
+        return len(entries)
+
+    def load_snapshot(self, path: str) -> int:
+        """Load a snapshot file into the disk tier."""
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+
+        entries = snapshot.get("entries", {})
+        for key, entry in entries.items():
+            self._write_disk(key, entry)
+        print(f"[INFO] Loaded SRD snapshot with {len(entries)} entries from {path}")
+        return len(entries)
+
+    async def _off_loop(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run blocking disk tier work on the shared store's threads, or a worker thread."""
+        if self.store is not None:
+            return await self.store.run(fn, *args)
+        return await asyncio.to_thread(fn, *args)
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key.replace("/", "__") + ".json")
+
+    def _key_from_filename(self, filename: str) -> str:
+        return filename[:-len(".json")].replace("__", "/")
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.store is not None:
+            return self.store.get("srd", key)
+        try:
+            with open(self._path_for(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[WARNING] Ignoring unreadable SRD cache entry {key}: {e}")
+            return None
+
+    def _write_disk(self, key: str, entry: Dict[str, Any]) -> None:
+        try:
+            if self.store is not None:
+                self.store.set("srd", key, entry)
+            else:
+                self._atomic_write(self._path_for(key), entry)
+        except (OSError, sqlite3.Error) as e:
+            print(f"[WARNING] Failed to persist SRD cache entry {key}: {e}")
+
+    def _atomic_write(self, path: str, payload: Dict[str, Any]) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from action_resolver import ActionResolver, classify
+
+SRD = {
+    "equipment": {"results": [{"index": "longsword", "name": "Longsword"}]},
+    "equipment/longsword": {
+        "index": "longsword",
+        "name": "Longsword",
+        "damage": {"damage_dice": "1d8", "damage_type": {"name": "Slashing"}},
+        "weapon_range": "Melee",
+        "properties": [{"index": "versatile"}],
+    },
+    "monsters": {"results": [{"index": "goblin", "name": "Goblin"}]},
+    "monsters/goblin": {"index": "goblin", "name": "Goblin", "armor_class": [{"value": 15}]},
+    "spells": {"results": [{"index": "cure-wounds", "name": "Cure Wounds"}]},
+    "spells/cure-wounds": {
+        "index": "cure-wounds",
+        "name": "Cure Wounds",
+        "level": 1,
+        "school": {"name": "Evocation"},
+        "desc": ["A creature you touch regains hit points."],
+        "classes": [{"index": "cleric"}],
+        "heal_at_slot_level": {"1": "1d8 + MOD"},
+    },
+}
+
+FIGHTER = {"class": "Fighter", "level": 1, "strength": 16, "equipment": "longsword, chain mail"}
+CLERIC = {"class": "Cleric", "level": 1, "wisdom": 16}
+
+
+class SRDTable:
+    """DnDIntegration stand-in serving a fixed set of SRD responses."""
+
+    async def _make_request(self, endpoint):
+        if endpoint not in SRD:
+            raise Exception("API request failed with status 404")
+        return SRD[endpoint]
+
+
+def resolve(message, character=None, game_session=None):
+    return asyncio.run(ActionResolver(SRDTable()).resolve(message, character, game_session))
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("I roll for perception", "check"),
+    ("make a history check", "check"),
+    ("roll a stealth check with advantage", "check"),
+    ("strength check", "check"),
+    ("Make a DEX save.", "save"),
+    ("I roll initiative", "initiative"),
+    ("roll 2d6+3", "roll"),
+    ("attack the goblin with my longsword", "attack"),
+    ("cast cure wounds", "spell"),
+])
+def test_classify_mechanical_actions(message, intent):
+    assert classify(message)["intent"] == intent
+
+
+@pytest.mark.parametrize("message", [
+    "history",
+    "nature",
+    "medicine",
+    "I make history",
+    "I try stealth",
+    "I sneak past the guards and look for the key",
+])
+def test_classify_leaves_narrative_to_the_model(message):
+    assert classify(message) is None
+
+
+@pytest.mark.parametrize("message", [
+    "I hit on the barmaid",
+    "I strike up a conversation with the bard",
+    "I shoot the breeze with the innkeeper",
+    "I hit the door",
+])
+def test_attack_phrasings_without_a_combatant_are_not_resolved(message):
+    assert resolve(message, FIGHTER) is None
+
+
+def test_attack_against_srd_monster_is_resolved():
+    reply = resolve("attack the goblin", FIGHTER)
+    assert reply["resolution"]["intent"] == "attack"
+    assert reply["resolution"]["weapon"] == "longsword"
+    assert reply["resolution"]["armor_class"] == 15
+    assert reply["usage"]["llm_calls"] == 0
+
+
+def test_attack_against_initiative_combatant_is_resolved():
+    session = {"initiative": [{"name": "Grik", "roll": 12, "isPlayer": False}]}
+    reply = resolve("attack grik", FIGHTER, session)
+    assert reply["resolution"]["intent"] == "attack"
+    assert reply["resolution"]["armor_class"] is None
+
+
+def test_attack_against_a_player_is_not_resolved():
+    session = {"players": ["Bob"], "initiative": [{"name": "Bob", "roll": 12, "isPlayer": True}]}
+    assert resolve("attack bob", FIGHTER, session) is None
+
+
+def test_spell_targets():
+    assert resolve("cast cure wounds on myself", CLERIC)["resolution"]["intent"] == "spell"
+    assert resolve("cast cure wounds on bob", CLERIC, {"players": ["Bob"]})["resolution"]["intent"] == "spell"
+    assert resolve("cast cure wounds on the barmaid", CLERIC) is None
+
+
+def test_unresolved_turns_are_counted_for_the_model():
+    resolver = ActionResolver(SRDTable())
+    asyncio.run(resolver.resolve("I hit on the barmaid", FIGHTER))
+    asyncio.run(resolver.resolve("make a history check", FIGHTER))
+    stats = resolver.get_stats()
+    assert (stats["local"], stats["llm"]) == (1, 1)
+    assert stats["by_intent"]["attack"] == {"local": 0, "llm": 1}
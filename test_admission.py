@@ -0,0 +1,143 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from admission import AdmissionController, RateLimitedError, TokenBucket
+from shared_store import SharedStore
+
+
+@pytest.fixture(autouse=True)
+def in_process_buckets(monkeypatch):
+    # Keep the quota buckets in memory even if DM_SHARED_STATE is set
+    monkeypatch.delenv("DM_SHARED_STATE", raising=False)
+
+
+def controller(rpm, burst_seconds, max_wait=5, max_queue=64, max_queue_per_session=4):
+    return AdmissionController(
+        requests_per_minute=rpm,
+        tokens_per_minute=10 ** 9,
+        max_queue=max_queue,
+        max_queue_per_session=max_queue_per_session,
+        max_wait=max_wait,
+        burst_seconds=burst_seconds,
+    )
+
+
+def test_token_bucket_refills_at_its_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(TokenBucket, "clock", staticmethod(lambda: now[0]))
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    bucket.take(2)
+    assert bucket.time_until(1) == pytest.approx(1.0)
+    now[0] += 1
+    assert bucket.time_until(1) == 0
+    # Several takes in a row are not capped at the capacity
+    assert bucket.time_until(4, clamp=False) == pytest.approx(3.0)
+    # Oversized requests only wait for a full bucket
+    assert bucket.time_until(10) == pytest.approx(1.0)
+
+
+def test_burst_is_admitted_immediately():
+    async def run():
+        admission = controller(rpm=60, burst_seconds=2)
+        started = time.monotonic()
+        await admission.acquire(10, session="a")
+        await admission.acquire(10, session="a")
+        return time.monotonic() - started, admission.get_stats()
+
+    elapsed, stats = asyncio.run(run())
+    assert elapsed < 0.1
+    assert stats["admitted"] == 2 and stats["queued"] == 0
+
+
+def test_rejects_at_once_when_the_wait_would_exceed_max_wait():
+    async def run():
+        # One request per second, nothing in reserve after the first call
+        admission = controller(rpm=60, burst_seconds=1, max_wait=0.5)
+        await admission.acquire(10, session="a")
+        started = time.monotonic()
+        with pytest.raises(RateLimitedError) as error:
+            await admission.acquire(10, session="b")
+        return time.monotonic() - started, error.value, admission.get_stats()
+
+    elapsed, error, stats = asyncio.run(run())
+    assert elapsed < 0.1
+    assert error.retry_after == 1
+    assert stats["rejected"] == 1 and stats["queue_depth"] == 0
+
+
+def test_sessions_are_served_round_robin():
+    async def run():
+        # Ten requests per second, one at a time
+        admission = controller(rpm=600, burst_seconds=0.1)
+        order = []
+
+        async def call(session, i):
+            await admission.acquire(10, session=session)
+            order.append(f"{session}{i}")
+
+        await call("a", 0)
+        await asyncio.gather(call("a", 1), call("a", 2), call("a", 3), call("b", 1))
+        return order
+
+    assert asyncio.run(run()) == ["a0", "a1", "b1", "a2", "a3"]
+
+
+def test_per_session_queue_limit():
+    async def run():
+        admission = controller(rpm=600, burst_seconds=0.1, max_queue_per_session=2)
+        await admission.acquire(10, session="a")
+        results = await asyncio.gather(*(admission.acquire(10, session="a") for _ in range(3)), return_exceptions=True)
+        # Another session still gets in line
+        await admission.acquire(10, session="b")
+        return results
+
+    results = asyncio.run(run())
+    assert results[:2] == [None, None]
+    assert isinstance(results[2], RateLimitedError)
+
+
+def test_upstream_throttle_blocks_admission():
+    async def run():
+        admission = controller(rpm=600, burst_seconds=10, max_wait=1)
+        await admission.throttled(30)
+        with pytest.raises(RateLimitedError) as error:
+            await admission.acquire(10, session="a")
+        assert not await admission.try_acquire(10)
+        return error.value
+
+    assert asyncio.run(run()).retry_after == 30
+
+
+def test_shared_quota_lock_does_not_block_the_event_loop(tmp_path):
+    store = SharedStore(str(tmp_path / "shared.db"))
+    other_worker = sqlite3.connect(store.path, isolation_level=None)
+
+    async def run():
+        admission = AdmissionController(requests_per_minute=600, tokens_per_minute=10 ** 9, store=store, lock_timeout=0.05)
+        await admission.acquire(10, session="a")
+        other_worker.execute("BEGIN IMMEDIATE")
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        started = time.monotonic()
+        asyncio.get_running_loop().call_later(0.3, other_worker.execute, "COMMIT")
+        await admission.acquire(10, session="a")
+        ticker.cancel()
+        return time.monotonic() - started, ticks, admission.get_stats()
+
+    elapsed, ticks, stats = asyncio.run(run())
+    other_worker.close()
+    store.close()
+    # Queued while the other worker held the lock, admitted once it let go
+    assert 0.3 <= elapsed < 1
+    assert ticks >= 20
+    assert stats["admitted"] == 1 and stats["queued"] == 1
@@ -0,0 +1,78 @@
+import math
+import random
+
+import pytest
+
+import dice
+
+
+def test_two_d6_distribution_is_exact():
+    dist = dice.parse("2d6").distribution()
+    assert dist == pytest.approx({total: (6 - abs(total - 7)) / 36 for total in range(2, 13)})
+    assert dice.parse("2d6").stats() == {"min": 2, "max": 12, "mean": 7.0, "stddev": round(math.sqrt(35 / 6), 4)}
+
+
+@pytest.mark.parametrize("notation, target, probability", [
+    ("1d20+5", 15, 11 / 20),
+    ("1d20 adv", 15, 1 - (14 / 20) ** 2),
+    ("1d20 dis", 15, (6 / 20) ** 2),
+    ("2d6", 7, 21 / 36),
+    ("1d6!", 15, (1 / 6) ** 2 * (4 / 6)),
+])
+def test_probability_at_least(notation, target, probability):
+    assert dice.probability_at_least(notation, target) == pytest.approx(probability)
+
+
+def test_keep_highest_matches_known_mean():
+    stats = dice.parse("4d6kh3").stats()
+    assert (stats["min"], stats["max"]) == (3, 18)
+    assert stats["mean"] == round(15869 / 1296, 4)
+    assert dice.parse("4d6dl1").distribution() == pytest.approx(dice.parse("4d6kh3").distribution())
+
+
+def test_exploding_die_is_capped_at_explode_depth():
+    stats = dice.parse("1d6!").stats()
+    assert stats["max"] == 6 * (dice.EXPLODE_DEPTH + 1)
+    assert stats["mean"] == round(3.5 * sum((1 / 6) ** k for k in range(dice.EXPLODE_DEPTH + 1)), 4)
+
+
+def test_mixed_terms_and_modifier():
+    stats = dice.parse("2d6-1d4+3").stats()
+    assert (stats["min"], stats["max"], stats["mean"]) == (1, 14, 7.5)
+
+
+@pytest.mark.parametrize("notation", ["1d20", "4d6kh3", "2d8!+1", "1d20 adv", "3d4-2"])
+def test_distribution_sums_to_one(notation):
+    assert sum(dice.parse(notation).distribution().values()) == pytest.approx(1.0)
+
+
+def test_rolls_stay_within_the_distribution():
+    expression = dice.parse("4d6kh3+2")
+    totals = expression.roll_many(2000, rng=random.Random(7))
+    assert min(totals) >= 5 and max(totals) <= 20
+    result = expression.roll(random.Random(7))
+    assert len(result["terms"][0]["rolls"]) == 4
+    assert len(result["terms"][0]["kept"]) == 3
+    assert result["total"] == sum(result["terms"][0]["kept"]) + 2
+
+
+def test_empty_notation_is_a_d20():
+    assert dice.parse("").stats() == dice.parse("1d20").stats()
+
+
+@pytest.mark.parametrize("notation", ["d20+", "1d1", "0d6", "101d6", "4d6kh5", "2d6 adv", "fireball"])
+def test_invalid_notation_raises(notation):
+    with pytest.raises(ValueError):
+        dice.DiceExpression.parse(notation)
+
+
+def test_too_many_terms_are_rejected():
+    with pytest.raises(ValueError):
+        dice.parse("+".join(["1d6"] * (dice.MAX_TERMS + 1)))
+
+
+def test_budget_counts_folding_terms_into_the_total():
+    # Each 5d100 is cheap on its own; adding twenty of them up is not
+    expression = dice.parse("+".join(["5d100"] * dice.MAX_TERMS))
+    with pytest.raises(ValueError):
+        expression.distribution()
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+import log
+from dnd_integration import DnDIntegration
+from srd_cache import SRDCache
+
+
+@pytest.fixture
+def make_api(tmp_path, monkeypatch):
+    # Keep the SRD cache on local disk even if DM_SHARED_STATE is set
+    monkeypatch.delenv("DM_SHARED_STATE", raising=False)
+    monkeypatch.delenv("SRD_SNAPSHOT_PATH", raising=False)
+
+    def make(fetcher):
+        api = DnDIntegration(cache=SRDCache(cache_dir=str(tmp_path / "srd"), offline=False))
+        api._fetch = fetcher
+        return api
+    return make
+
+
+class StubFetcher:
+    """Stands in for the upstream fetch: holds every call until released,
+    then answers (or fails) and counts how often it was called."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, endpoint, entry=None):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return {"index": endpoint}
+
+
+def test_concurrent_misses_share_one_upstream_call(make_api):
+    async def run():
+        fetcher = StubFetcher()
+        api = make_api(fetcher)
+        waiters = [asyncio.ensure_future(api._make_request("spells/fireball")) for _ in range(10)]
+        await asyncio.sleep(0.05)
+        assert len(api._inflight) == 1
+        fetcher.release.set()
+        return fetcher, api, await asyncio.gather(*waiters)
+
+    fetcher, api, results = asyncio.run(run())
+    assert fetcher.calls == 1
+    assert results == [{"index": "spells/fireball"}] * 10
+    assert api.request_stats["coalesced"] == 9
+    assert api._inflight == {}
+
+
+def test_upstream_error_reaches_every_waiter_without_sticking(make_api):
+    async def run():
+        fetcher = StubFetcher(error=Exception("D&D API request failed with status 500"))
+        api = make_api(fetcher)
+        waiters = [asyncio.ensure_future(api._make_request("spells/fireball")) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        fetcher.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert api._inflight == {}
+
+        # The failure isn't cached: the next caller starts a new fetch
+        fetcher.error = None
+        retried = await api._make_request("spells/fireball")
+        return fetcher, results, retried
+
+    fetcher, results, retried = asyncio.run(run())
+    assert all(str(result) == "D&D API request failed with status 500" for result in results)
+    assert fetcher.calls == 2
+    assert retried == {"index": "spells/fireball"}
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_fetch(make_api):
+    async def run():
+        fetcher = StubFetcher()
+        api = make_api(fetcher)
+        first = asyncio.ensure_future(api._make_request("spells/fireball"))
+        second = asyncio.ensure_future(api._make_request("spells/fireball"))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        await asyncio.sleep(0)
+        fetcher.release.set()
+        return fetcher, first, await second
+
+    fetcher, first, result = asyncio.run(run())
+    assert first.cancelled()
+    assert result == {"index": "spells/fireball"}
+    assert fetcher.calls == 1
+
+
+def test_warnings_follow_the_log_level(make_api, capsys, monkeypatch):
+    monkeypatch.setattr(log, "LOG_LEVEL", log.LEVELS["WARNING"])
+
+    async def run():
+        fetcher = StubFetcher(error=Exception("D&D API request failed with status 404"))
+        fetcher.release.set()
+        api = make_api(fetcher)
+        await api.fetch_many(["spells/wish"])
+        log.set_level("ERROR")
+        await api.fetch_many(["spells/wish"])
+
+    asyncio.run(run())
+    assert capsys.readouterr().out.splitlines() == [
+        "[WARNING] Failed to fetch spells/wish: D&D API request failed with status 404"
+    ]
@@ -0,0 +1,91 @@
+import pytest
+
+from encounter_builder import (
+    CR_XP,
+    DIFFICULTIES,
+    EncounterBuilder,
+    encounter_multiplier,
+    format_cr,
+    party_thresholds,
+)
+
+GOBLINS_AND_BUGBEARS = {
+    0.25: [{"index": "goblin", "name": "Goblin"}],
+    1: [{"index": "bugbear", "name": "Bugbear"}],
+}
+
+
+@pytest.mark.parametrize("monster_count, party_size, multiplier", [
+    (1, 4, 1), (2, 4, 1.5), (3, 4, 2), (6, 4, 2), (7, 4, 2.5), (10, 4, 2.5), (11, 4, 3), (15, 4, 4),
+    # Small parties use the next multiplier up, large parties the next one down
+    (1, 2, 1.5), (3, 2, 2.5), (1, 6, 0.5), (3, 6, 1.5),
+])
+def test_encounter_multiplier(monster_count, party_size, multiplier):
+    assert encounter_multiplier(monster_count, party_size) == multiplier
+
+
+def test_party_thresholds_scale_with_party_size():
+    assert party_thresholds(3, 4) == {"easy": 300, "medium": 600, "hard": 900, "deadly": 1600}
+    # Levels outside 1-20 are clamped
+    assert party_thresholds(0, 1) == party_thresholds(1, 1)
+    assert party_thresholds(25, 1) == party_thresholds(20, 1)
+
+
+@pytest.mark.parametrize("difficulty, compositions", [
+    # Level 1, four characters: easy 100, medium 200, hard 300, deadly 400 XP
+    ("easy", [((0.25, 2),)]),          # 2 x 50 XP x1.5 = 150
+    ("medium", [((1, 1),)]),           # 1 x 200 XP x1 = 200
+    ("hard", [((0.25, 3),)]),          # 3 x 50 XP x2 = 300
+    ("deadly", [((0.25, 4),), ((0.25, 5),)]),  # 400 and 500, under 1.5 x 400
+])
+def test_compositions_fall_in_the_xp_band(difficulty, compositions):
+    builder = EncounterBuilder(GOBLINS_AND_BUGBEARS)
+    assert sorted(builder._compositions(1, 4, difficulty)) == sorted(compositions)
+
+
+@pytest.mark.parametrize("party_level", [1, 3, 5, 10, 20])
+@pytest.mark.parametrize("difficulty", DIFFICULTIES)
+def test_built_encounters_meet_their_difficulty(party_level, difficulty):
+    builder = EncounterBuilder({cr: [{"index": f"cr-{cr}", "name": f"CR {cr} monster"}] for cr in CR_XP})
+    encounter = builder.build(party_level, 4, difficulty)
+    thresholds = encounter["xp_thresholds"]
+    position = DIFFICULTIES.index(difficulty)
+    high = thresholds[DIFFICULTIES[position + 1]] if position + 1 < len(DIFFICULTIES) else thresholds[difficulty] * 1.5
+    assert thresholds[difficulty] <= encounter["adjusted_xp"] < high
+    assert sum(m["xp"] * m["count"] for m in encounter["monsters"]) == encounter["total_xp"]
+
+
+def test_sparse_monster_list_falls_back_to_strongest_group_under_the_band():
+    builder = EncounterBuilder({0.125: [{"index": "kobold", "name": "Kobold"}]}, max_monsters=2)
+    # Level 10, four characters: easy starts at 2400 XP, far above two kobolds (75)
+    encounter = builder.build(10, 4, "easy")
+    assert encounter["monsters"][0]["count"] == 2
+    assert encounter["adjusted_xp"] == 75
+
+
+def test_no_group_at_all_raises():
+    builder = EncounterBuilder({30: [{"index": "tarrasque", "name": "Tarrasque"}]})
+    with pytest.raises(ValueError):
+        builder.build(1, 1, "easy")
+
+
+def test_memoized_compositions_are_bounded():
+    builder = EncounterBuilder(GOBLINS_AND_BUGBEARS, max_cached=2)
+    builder.build(1, 4, "easy")
+    builder.build(1, 5, "easy")
+    builder.build(1, 4, "easy")
+    builder.build(1, 6, "easy")
+    # The least recently used party shape went first
+    assert list(builder._candidates) == [(1, 4, "easy"), (1, 6, "easy")]
+
+
+def test_rejects_unknown_difficulty_and_empty_index():
+    with pytest.raises(ValueError):
+        EncounterBuilder(GOBLINS_AND_BUGBEARS).build(1, 4, "trivial")
+    with pytest.raises(ValueError):
+        EncounterBuilder({})
+
+
+@pytest.mark.parametrize("challenge_rating, text", [(0.125, "1/8"), (0.25, "1/4"), (0.5, "1/2"), (3, "3")])
+def test_format_cr(challenge_rating, text):
+    assert format_cr(challenge_rating) == text
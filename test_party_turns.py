@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+from party_turns import PartyTurnBatcher
+
+
+class RecordingResolver:
+    """Resolves a round by echoing its actions, remembering every call."""
+
+    def __init__(self, fail: bool = False):
+        self.rounds = []
+        self.fail = fail
+
+    async def __call__(self, session_id, actions):
+        self.rounds.append((session_id, [action["player_id"] for action in actions]))
+        if self.fail:
+            raise Exception("Gemini API error")
+        return {"players": {action["player_id"]: action["message"] for action in actions}}
+
+
+def test_actions_within_the_window_share_one_round():
+    async def run():
+        resolver = RecordingResolver()
+        batcher = PartyTurnBatcher(resolver, window=0.1)
+        results = await asyncio.gather(
+            batcher.submit("s1", "ana", {"message": "I attack"}),
+            batcher.submit("s1", "bo", {"message": "I hide"}),
+            batcher.submit("s1", "cy", {"message": "I cast shield"}),
+        )
+        return resolver, results, batcher.get_stats()
+
+    resolver, results, stats = asyncio.run(run())
+    assert resolver.rounds == [("s1", ["ana", "bo", "cy"])]
+    assert all(result is results[0] for result in results)
+    assert results[0]["players"] == {"ana": "I attack", "bo": "I hide", "cy": "I cast shield"}
+    assert stats["rounds"] == 1 and stats["actions_per_round"] == 3
+
+
+def test_sessions_and_later_actions_get_their_own_rounds():
+    async def run():
+        resolver = RecordingResolver()
+        batcher = PartyTurnBatcher(resolver, window=0.05)
+        await asyncio.gather(
+            batcher.submit("s1", "ana", {"message": "I attack"}),
+            batcher.submit("s2", "bo", {"message": "I hide"}),
+        )
+        await batcher.submit("s1", "ana", {"message": "I attack again"})
+        return resolver.rounds
+
+    assert asyncio.run(run()) == [("s1", ["ana"]), ("s2", ["bo"]), ("s1", ["ana"])]
+
+
+def test_round_closes_early_once_the_whole_party_has_acted():
+    async def run():
+        batcher = PartyTurnBatcher(RecordingResolver(), window=5)
+        started = time.monotonic()
+        await asyncio.gather(
+            batcher.submit("s1", "ana", {"message": "I attack"}, party_size=2),
+            batcher.submit("s1", "bo", {"message": "I hide"}),
+        )
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 1
+
+
+def test_max_actions_caps_a_round():
+    async def run():
+        resolver = RecordingResolver()
+        batcher = PartyTurnBatcher(resolver, window=5, max_actions=2)
+        await asyncio.gather(*(batcher.submit("s1", player, {"message": "go"}) for player in ("ana", "bo")))
+        return resolver.rounds
+
+    assert asyncio.run(run()) == [("s1", ["ana", "bo"])]
+
+
+def test_acting_twice_replaces_the_earlier_action():
+    async def run():
+        batcher = PartyTurnBatcher(RecordingResolver(), window=0.05)
+        first, _ = await asyncio.gather(
+            batcher.submit("s1", "ana", {"message": "I attack"}),
+            batcher.submit("s1", "ana", {"message": "Actually, I flee"}),
+        )
+        return first
+
+    assert asyncio.run(run())["players"] == {"ana": "Actually, I flee"}
+
+
+def test_failure_reaches_every_player_in_the_round():
+    async def run():
+        batcher = PartyTurnBatcher(RecordingResolver(fail=True), window=0.05)
+        results = await asyncio.gather(
+            batcher.submit("s1", "ana", {"message": "I attack"}),
+            batcher.submit("s1", "bo", {"message": "I hide"}),
+            return_exceptions=True,
+        )
+        return results, batcher.get_stats()
+
+    results, stats = asyncio.run(run())
+    assert all(isinstance(result, Exception) and str(result) == "Gemini API error" for result in results)
+    assert stats["failed"] == 1
+
+
+def test_one_player_leaving_does_not_cancel_the_round():
+    async def run():
+        resolver = RecordingResolver()
+        batcher = PartyTurnBatcher(resolver, window=0.05)
+        leaving = asyncio.ensure_future(batcher.submit("s1", "ana", {"message": "I attack"}))
+        staying = asyncio.ensure_future(batcher.submit("s1", "bo", {"message": "I hide"}))
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(run())["players"] == {"ana": "I attack", "bo": "I hide"}
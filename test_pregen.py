@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from admission import current_session
+from pregen import PregenPool
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(PregenPool, "clock", staticmethod(lambda: now[0]))
+    return now
+
+
+class StubGenerator:
+    """Generates numbered items per key, remembering the session each ran under."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = []
+        self.sessions = set()
+
+    async def __call__(self, key):
+        self.calls.append(key)
+        self.sessions.add(current_session.get())
+        await asyncio.sleep(0)
+        if self.fail:
+            raise Exception("Gemini API error")
+        return f"{key}-{len(self.calls)}"
+
+
+async def settle(pool):
+    """Wait for every running refill to finish."""
+    while pool._refills:
+        await asyncio.gather(*list(pool._refills.values()), return_exceptions=True)
+
+
+def test_miss_then_warm_fills_the_bucket(clock):
+    async def run():
+        generate = StubGenerator()
+        pool = PregenPool("encounter", generate, size=2)
+        assert pool.take("goblins") is None
+        pool.warm("goblins")
+        await settle(pool)
+        return pool, generate
+
+    pool, generate = asyncio.run(run())
+    assert generate.calls == ["goblins", "goblins"]
+    assert pool.get_stats()["buckets"] == {"goblins": 2}
+    assert pool.stats["misses"] == 1 and pool.stats["generated"] == 2
+    # Pre-generation runs under its own admission session
+    assert generate.sessions == {"pregen:encounter"}
+
+
+def test_take_serves_the_oldest_item_and_refills(clock):
+    async def run():
+        generate = StubGenerator()
+        pool = PregenPool("encounter", generate, size=2)
+        pool.warm("goblins")
+        await settle(pool)
+        first = pool.take("goblins")
+        assert pool.get_stats()["buckets"] == {"goblins": 1}
+        await settle(pool)
+        second = pool.take("goblins")
+        await settle(pool)
+        return pool, generate, first, second
+
+    pool, generate, first, second = asyncio.run(run())
+    assert (first, second) == ("goblins-1", "goblins-2")
+    assert len(generate.calls) == 4
+    assert pool.get_stats()["buckets"] == {"goblins": 2}
+    assert pool.stats["hits"] == 2
+
+
+def test_stale_items_are_evicted_before_serving(clock):
+    async def run():
+        pool = PregenPool("encounter", StubGenerator(), size=2, max_age=60)
+        pool.warm("goblins")
+        await settle(pool)
+        clock[0] += 61
+        missed = pool.take("goblins")
+        return pool, missed
+
+    pool, missed = asyncio.run(run())
+    assert missed is None
+    assert pool.stats["evicted"] == 2 and pool.stats["misses"] == 1
+
+
+def test_failed_generation_stops_the_refill_until_the_next_request(clock):
+    async def run():
+        generate = StubGenerator(fail=True)
+        pool = PregenPool("encounter", generate, size=3)
+        pool.warm("goblins")
+        await settle(pool)
+        assert pool.take("goblins") is None
+        generate.fail = False
+        pool.warm("goblins")
+        await settle(pool)
+        return pool, generate
+
+    pool, generate = asyncio.run(run())
+    assert pool.stats["failed"] == 1
+    assert len(generate.calls) == 4
+    assert pool.get_stats()["buckets"] == {"goblins": 3}
+
+
+def test_least_recently_requested_buckets_are_dropped(clock):
+    async def run():
+        pool = PregenPool("encounter", StubGenerator(), size=1, max_buckets=2)
+        for key in ("goblins", "wolves"):
+            pool.warm(key)
+        await settle(pool)
+        assert pool.take("goblins") is not None
+        pool.warm("bandits")
+        await settle(pool)
+        return pool
+
+    pool = asyncio.run(run())
+    assert set(pool.get_stats()["buckets"]) == {"goblins", "bandits"}
+    assert pool.stats["evicted"] == 1
+
+
+def test_close_cancels_running_refills(clock):
+    async def run():
+        started = asyncio.Event()
+
+        async def slow(key):
+            started.set()
+            await asyncio.sleep(10)
+
+        pool = PregenPool("encounter", slow, size=1)
+        pool.warm("goblins")
+        await started.wait()
+        await pool.close()
+        return pool
+
+    pool = asyncio.run(run())
+    assert pool._refills == {}
+    assert pool.stats["generated"] == 0
+
+
+def test_disabled_pool_never_generates(clock):
+    async def run():
+        generate = StubGenerator()
+        pool = PregenPool("encounter", generate, size=0)
+        pool.warm("goblins")
+        return pool.take("goblins"), generate
+
+    item, generate = asyncio.run(run())
+    assert item is None and generate.calls == []
@@ -0,0 +1,119 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+import pytest
+
+import server
+from prepared_responses import PreparedResponseCache, _etag_matches
+
+ETAG = "0123456789abcdef"
+
+
+@pytest.mark.parametrize("header", [
+    f'"{ETAG}"',
+    f'W/"{ETAG}"',
+    f'"{ETAG}-gzip"',
+    f'W/"{ETAG}-br"',
+    f'"other", "{ETAG}-gzip"',
+    f'"other" ,W/"{ETAG}"',
+    "*",
+])
+def test_etag_matches_any_encoding_of_the_version(header):
+    assert _etag_matches(header, ETAG)
+
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    '"other"',
+    '"other-gzip", W/"another"',
+    f'"{ETAG}0"',
+    f'"x{ETAG}-gzip"',
+])
+def test_etag_does_not_match_other_versions(header):
+    assert not _etag_matches(header, ETAG)
+
+
+class StubSRD:
+    """Serves fixed SRD data; the same objects every time, like the SRD cache."""
+
+    def __init__(self):
+        self.spells = [{"index": f"spell-{i}", "name": f"Spell {i}", "url": f"/api/spells/spell-{i}"} for i in range(50)]
+        self.details = {"fireball": {"index": "fireball", "name": "Fireball", "level": 3}}
+
+    async def get_spells(self):
+        return self.spells
+
+    async def get_spell_details(self, spell_index):
+        return self.details[spell_index]
+
+
+@pytest.fixture
+def srd(monkeypatch):
+    stub = StubSRD()
+    monkeypatch.setattr(server, "dnd_api", stub)
+    monkeypatch.setattr(server, "srd_responses", PreparedResponseCache(max_entries=16, max_age=60))
+    return stub
+
+
+def get(path, headers=None):
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, headers=headers or {})
+    return asyncio.run(run())
+
+
+def test_prepared_endpoint_returns_200_then_304_for_its_etag(srd):
+    first = get("/api/spells/fireball", {"Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    assert first.json() == srd.details["fireball"]
+    assert first.headers["Cache-Control"] == "public, max-age=60"
+
+    second = get("/api/spells/fireball", {"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert server.srd_responses.stats["not_modified"] == 1
+
+
+def test_compressed_body_has_its_own_etag_but_still_revalidates(srd):
+    plain = get("/api/spells", {"Accept-Encoding": "identity"})
+    compressed = get("/api/spells", {"Accept-Encoding": "gzip"})
+    assert compressed.status_code == 200
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+    assert compressed.json() == plain.json() == {"results": srd.spells}
+
+    # The identity ETag is the same version, so a gzip client holding it gets a 304
+    revalidated = get("/api/spells", {"Accept-Encoding": "gzip", "If-None-Match": plain.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == compressed.headers["ETag"]
+
+
+def test_changed_data_gets_a_new_etag(srd):
+    first = get("/api/spells/fireball")
+    srd.details["fireball"] = {**srd.details["fireball"], "level": 4}
+    second = get("/api/spells/fireball", {"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert second.json()["level"] == 4
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+
+def test_stale_or_missing_validators_get_the_full_body(srd):
+    assert get("/api/spells/fireball", {"If-None-Match": '"not-this-one"'}).status_code == 200
+    assert get("/api/spells/fireball").status_code == 200
+    assert get("/api/spells/fireball", {"If-None-Match": "*"}).status_code == 304
+
+
+def test_prepared_bodies_are_compressed_once(srd):
+    cache = PreparedResponseCache(max_entries=1)
+    prepared = cache.get("spells", srd.spells, {"results": srd.spells})
+    assert json.loads(gzip.decompress(prepared.gzip)) == {"results": srd.spells}
+    assert cache.get("spells", srd.spells) is prepared
+    # Least recently used entries are evicted past the bound
+    cache.get("spells/fireball", srd.details["fireball"])
+    assert cache.stats == {"hits": 1, "builds": 2, "not_modified": 0}
+    assert cache.get_stats()["entries"] == 1
@@ -0,0 +1,97 @@
+import pytest
+
+from prompt_builder import PromptBuilder, estimate_tokens
+
+
+def words(text):
+    """One token per word keeps the arithmetic in these tests readable."""
+    return len(text.split())
+
+
+def chat_prompt(budget, history_turns=10):
+    """Sections with the priorities the chat prompt uses."""
+    builder = PromptBuilder(budget, count_tokens=words)
+    builder.add("scene", "Current Scene: the ruined abbey at dusk", priority=1, keep="start")
+    builder.add("character", "Character: Ana - Level 3 Elf Rogue", priority=2)
+    builder.add("rules", "Relevant rules: " + "fireball " * 20, priority=3, keep="start")
+    builder.add("summary", "Story so far: " + "earlier " * 20 + "the bell tower fell", priority=4, keep="end")
+    builder.add_items("history", "Recent conversation:", [f"Player: turn {i} happened here" for i in range(history_turns)], priority=5)
+    builder.add("notes", "Notes: " + "remember " * 20, priority=6, keep="end")
+    builder.add("message", "Player message: I climb the tower", priority=0, required=True)
+    return builder.build()
+
+
+@pytest.mark.parametrize("budget", [20, 40, 60, 80, 100, 150, 200, 400])
+def test_prompt_stays_within_the_budget(budget):
+    prompt, report = chat_prompt(budget)
+    assert words(prompt) <= budget
+    assert report["total_tokens"] <= budget
+    assert "Player message: I climb the tower" in prompt
+
+
+def test_lowest_priority_sections_go_first():
+    # Everything fits at a generous budget
+    _, report = chat_prompt(400)
+    assert report["dropped"] == [] and report["truncated"] == []
+
+    dropped_at = {}
+    for budget in range(400, 0, -5):
+        _, report = chat_prompt(budget)
+        for name in report["dropped"] + report["truncated"]:
+            dropped_at.setdefault(name, budget)
+    # Sections start losing content in reverse priority order
+    assert sorted(dropped_at, key=lambda name: -dropped_at[name]) == ["notes", "history", "summary", "rules", "character", "scene"]
+
+
+def test_sections_render_in_the_order_they_were_added():
+    prompt, _ = chat_prompt(400)
+    positions = [prompt.index(marker) for marker in ("Current Scene", "Character:", "Relevant rules", "Story so far", "Recent conversation", "Notes:", "Player message")]
+    assert positions == sorted(positions)
+
+
+def test_history_keeps_the_newest_turns():
+    builder = PromptBuilder(20, count_tokens=words)
+    builder.add_items("history", "Recent:", [f"turn {i}" for i in range(10)], priority=5)
+    prompt, report = builder.build()
+    # 19 tokens are available after the section break: 1 for the header, 3 per turn (two words and a line)
+    assert prompt == "Recent:\nturn 4\nturn 5\nturn 6\nturn 7\nturn 8\nturn 9"
+    assert report["truncated"] == ["history"]
+
+
+def test_truncation_keeps_the_requested_end():
+    text = "word " * 40
+    builder = PromptBuilder(12, count_tokens=estimate_tokens)
+    builder.add("start", "Summary: the beginning " + text, priority=1, keep="start")
+    prompt, _ = builder.build()
+    assert prompt.startswith("Summary: the beginning") and prompt.endswith("...")
+
+    builder = PromptBuilder(12, count_tokens=estimate_tokens)
+    builder.add("end", text + "and the ending", priority=1, keep="end")
+    prompt, _ = builder.build()
+    assert prompt.startswith("...") and prompt.endswith("and the ending")
+
+
+def test_sections_without_keep_are_dropped_whole():
+    builder = PromptBuilder(10, count_tokens=words)
+    builder.add("character", "one two three four five six seven eight nine ten eleven", priority=2)
+    builder.add("message", "hello", priority=0, required=True)
+    prompt, report = builder.build()
+    assert prompt == "hello"
+    assert report["dropped"] == ["character"]
+
+
+def test_max_tokens_caps_a_section_with_budget_to_spare():
+    builder = PromptBuilder(1000, count_tokens=estimate_tokens)
+    builder.add("notes", "note " * 200, priority=6, keep="end", max_tokens=20)
+    _, report = builder.build()
+    assert report["sections"]["notes"] <= 20
+    assert report["truncated"] == ["notes"]
+
+
+def test_required_sections_are_kept_over_budget():
+    builder = PromptBuilder(5, count_tokens=words)
+    builder.add("scene", "a quiet scene", priority=1)
+    builder.add("message", "a very long player message that alone exceeds the budget", priority=0, required=True)
+    prompt, report = builder.build()
+    assert prompt == "a very long player message that alone exceeds the budget"
+    assert report["dropped"] == ["scene"]
@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+
+from ai_dm import AIDungeonMaster
+from resilience import CircuitBreaker, LatencyTracker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(CircuitBreaker, "clock", staticmethod(lambda: now[0]))
+    return now
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    # A success in between starts the count again
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    clock[0] += 10
+    assert breaker.retry_after() == pytest.approx(20)
+    assert not breaker.allow()
+
+
+def test_half_open_breaker_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.retry_after() == 0
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Only one trial at a time
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_trial_opens_the_breaker_again(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock[0] += 31
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after() == pytest.approx(30)
+    clock[0] += 30
+    assert breaker.allow()
+
+
+def test_latency_percentiles_need_enough_samples():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for seconds in range(1, 10):
+        tracker.record("chat", seconds)
+    assert tracker.percentile("chat", 95) is None
+    tracker.record("chat", 10)
+    assert tracker.percentile("chat", 50) == 5
+    assert tracker.percentile("chat", 95) == 10
+    assert tracker.percentile("chat", 100) == 10
+    assert tracker.percentile("encounter", 95) is None
+
+
+def test_latency_window_keeps_only_recent_samples():
+    tracker = LatencyTracker(window=10, min_samples=10)
+    for _ in range(10):
+        tracker.record("chat", 5.0)
+    for _ in range(10):
+        tracker.record("chat", 1.0)
+    assert tracker.percentile("chat", 95) == 1.0
+
+
+class StubAdmission:
+    def __init__(self, grant: bool = True):
+        self.grant = grant
+
+    async def try_acquire(self, tokens):
+        return self.grant
+
+
+class FakeModels:
+    """Stands in for `_call_model`: each model answers after its own delay,
+    and every call records whether it finished or was cancelled."""
+
+    def __init__(self, delays, failing=()):
+        self.delays = delays
+        self.failing = failing
+        self.calls = []
+        self.cancelled = []
+
+    async def __call__(self, model_name, prompt, generation_config, prompt_type):
+        self.calls.append(model_name)
+        try:
+            await asyncio.sleep(self.delays[model_name])
+        except asyncio.CancelledError:
+            self.cancelled.append(model_name)
+            raise
+        if model_name in self.failing:
+            raise Exception(f"{model_name} failed")
+        return f"reply from {model_name}"
+
+
+def hedging_dm(delays, grant=True, failing=()):
+    dm = AIDungeonMaster.__new__(AIDungeonMaster)
+    dm.model_chain = ["primary", "backup"]
+    dm.breakers = {model_name: CircuitBreaker() for model_name in dm.model_chain}
+    dm.latencies = LatencyTracker(min_samples=1)
+    dm.latencies.record("chat", 0.05)
+    dm.hedge_percentile = 95
+    dm.hedge_min_delay = 0.05
+    dm.generation_timeout = 5
+    dm.admission = StubAdmission(grant)
+    dm._call_model = FakeModels(delays, failing)
+    return dm
+
+
+def test_fast_primary_is_not_hedged():
+    dm = hedging_dm({"primary": 0.0, "backup": 0.0})
+    result = asyncio.run(dm._hedged_call("primary", "prompt", None, "chat", 10))
+    assert result == "reply from primary"
+    assert dm._call_model.calls == ["primary"]
+
+
+def test_hedge_winner_cancels_the_slow_call():
+    dm = hedging_dm({"primary": 10.0, "backup": 0.01})
+    result = asyncio.run(dm._hedged_call("primary", "prompt", None, "chat", 10))
+    assert result == "reply from backup"
+    assert dm._call_model.calls == ["primary", "backup"]
+    assert dm._call_model.cancelled == ["primary"]
+
+
+def test_failed_hedge_waits_for_the_primary():
+    dm = hedging_dm({"primary": 0.2, "backup": 0.0}, failing=("backup",))
+    result = asyncio.run(dm._hedged_call("primary", "prompt", None, "chat", 10))
+    assert result == "reply from primary"
+    assert dm._call_model.cancelled == []
+
+
+def test_hedge_without_spare_quota_gives_back_the_trial_slot():
+    dm = hedging_dm({"primary": 0.2, "backup": 0.0}, grant=False)
+    dm.breakers["backup"].state = "half_open"
+    result = asyncio.run(dm._hedged_call("primary", "prompt", None, "chat", 10))
+    assert result == "reply from primary"
+    assert dm._call_model.calls == ["primary"]
+    # The trial slot claimed while picking the hedge model is free again
+    assert dm.breakers["backup"].allow()
+
+
+def test_cancelling_a_hedged_call_cancels_both_calls():
+    dm = hedging_dm({"primary": 10.0, "backup": 10.0})
+
+    async def run():
+        task = asyncio.ensure_future(dm._hedged_call("primary", "prompt", None, "chat", 10))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert dm._call_model.calls == ["primary", "backup"]
+    assert sorted(dm._call_model.cancelled) == ["backup", "primary"]
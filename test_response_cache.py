@@ -0,0 +1,113 @@
+import pytest
+
+from admission import current_session
+from ai_dm import AIDungeonMaster
+from response_cache import ResponseCache
+
+
+class Config:
+    def __init__(self, temperature=0.3, max_output_tokens=200):
+        self.temperature = temperature
+        self.max_output_tokens = max_output_tokens
+
+
+class Reply:
+    def __init__(self, text):
+        self.text = text
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ResponseCache, "clock", staticmethod(lambda: now[0]))
+    return now
+
+
+def make_cache(**kwargs):
+    options = {"prompt_types": ("suggestions",), "max_entries": 3, "ttl": 60, "similarity": 0}
+    options.update(kwargs)
+    return ResponseCache(**options)
+
+
+def test_hit_after_put_and_miss_for_other_calls(clock):
+    cache = make_cache()
+    config = Config()
+    assert cache.get("scene: tavern", config, "suggestions") is None
+    cache.put("scene: tavern", config, "suggestions", Reply('["Order an ale"]'), prompt_tokens=40)
+
+    hit = cache.get("scene: tavern", config, "suggestions")
+    assert hit.text == '["Order an ale"]' and hit.cached == "exact"
+    # The config and prompt type are part of the key
+    assert cache.get("scene: tavern", Config(max_output_tokens=100), "suggestions") is None
+    assert cache.get("scene: tavern", config, "chat") is None
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 3
+    assert cache.stats["tokens_saved"] > 40
+
+
+def test_keys_ignore_case_and_whitespace(clock):
+    cache = make_cache()
+    cache.put("Scene:  the   Tavern\n", Config(), "suggestions", Reply('["Look around"]'), prompt_tokens=10)
+    assert cache.get("scene: the tavern", Config(), "suggestions") is not None
+    assert cache.get("scene: the tavern.", Config(), "suggestions") is None
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = make_cache()
+    cache.put("scene: tavern", Config(), "suggestions", Reply("cached"), prompt_tokens=10)
+    clock[0] += 59
+    assert cache.get("scene: tavern", Config(), "suggestions") is not None
+    clock[0] += 1
+    assert cache.get("scene: tavern", Config(), "suggestions") is None
+    assert cache.stats["expired"] == 1
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = make_cache()
+    for scene in ("tavern", "forest", "cave"):
+        cache.put(f"scene: {scene}", Config(), "suggestions", Reply(scene), prompt_tokens=10)
+    # Using the oldest entry makes "forest" the least recently used
+    assert cache.get("scene: tavern", Config(), "suggestions") is not None
+    cache.put("scene: castle", Config(), "suggestions", Reply("castle"), prompt_tokens=10)
+    assert cache.get_stats()["entries"] == 3
+    assert cache.get("scene: forest", Config(), "suggestions") is None
+    assert [cache.get(f"scene: {scene}", Config(), "suggestions").text for scene in ("tavern", "cave", "castle")] == [
+        "tavern", "cave", "castle"
+    ]
+
+
+def test_empty_replies_and_creative_calls_are_not_cached(clock):
+    cache = make_cache()
+    cache.put("scene: tavern", Config(), "suggestions", Reply(""), prompt_tokens=10)
+    assert cache.get_stats()["entries"] == 0
+    assert cache.cacheable("suggestions", Config())
+    assert not cache.cacheable("suggestions", Config(temperature=0.9))
+    assert not cache.cacheable("chat", Config())
+    assert cache.stats["bypassed"] == 1
+
+
+def test_similar_prompts_must_keep_their_numbers(clock):
+    cache = make_cache(similarity=0.5)
+    cache.put("party of 4 at level 3 in the dark forest", Config(), "suggestions", Reply("forest"), prompt_tokens=10)
+    similar = cache.get("party of 4 at level 3 in a dark forest", Config(), "suggestions")
+    assert similar.text == "forest" and similar.cached == "similar"
+    assert cache.get("party of 4 at level 5 in a dark forest", Config(), "suggestions") is None
+
+
+def test_suggestion_keys_depend_on_the_session_and_the_turn():
+    dm = AIDungeonMaster.__new__(AIDungeonMaster)
+    character = {"class": "Rogue"}
+    scene = {"currentScene": "The Prancing Pony"}
+
+    def key(message, reply, session="s1"):
+        token = current_session.set(session)
+        try:
+            return dm._suggestions_cache_key(message, reply, character, scene)
+        finally:
+            current_session.reset(token)
+
+    assert key("I look around", "The tavern is busy.") == key("  i LOOK around", "The tavern is   busy.")
+    assert key("I look around", "The tavern is busy.") != key("I look around", "The tavern is busy.", session="s2")
+    assert key("I look around", "The tavern is busy.") != key("I order an ale", "The tavern is busy.")
+    assert key("I look around", "The tavern is busy.") != key("I look around", "The tavern is empty.")
+    assert dm._suggestions_cache_key("I look around", "Quiet.", character, {}) == ""
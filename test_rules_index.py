@@ -0,0 +1,69 @@
+import pytest
+
+from rules_index import RulesIndex
+
+
+def spell(name, desc, level=1):
+    return {"index": name.lower().replace(" ", "-"), "name": name, "level": level, "school": {"name": "Evocation"}, "desc": [desc]}
+
+
+@pytest.fixture(scope="module")
+def index():
+    index = RulesIndex()
+    for detail in [
+        spell("Wall of Fire", "You create a wall of fire on a solid surface.", 4),
+        spell("Wall of Ice", "You create a wall of ice on a solid surface.", 6),
+        spell("Wall of Stone", "A nonmagical wall of solid stone springs into existence.", 5),
+        spell("Hold Person", "Choose a humanoid that you can see. It must succeed on a Wisdom save or be paralyzed.", 2),
+        spell("Light", "You touch one object. It sheds bright light in a 20-foot radius.", 0),
+        spell("Shield", "An invisible barrier of magical force protects you.", 1),
+        spell("Fireball", "A bright streak flashes to a point you choose and blossoms into an explosion of flame.", 3),
+    ]:
+        index.add("spells", detail)
+    index.add("monsters", {"index": "goblin", "name": "Goblin", "size": "Small", "type": "humanoid", "challenge_rating": 0.25, "hit_points": 7})
+    index.add("conditions", {"index": "poisoned", "name": "Poisoned", "desc": ["A poisoned creature has disadvantage on attack rolls."]})
+    index.add("equipment", {"index": "longsword", "name": "Longsword", "equipment_category": {"name": "Weapon"}, "damage": {"damage_dice": "1d8"}})
+    index.finalize()
+    return index
+
+
+def names(index, text):
+    return [doc["name"] for _, doc in index.search(text, limit=5)]
+
+
+@pytest.mark.parametrize("text", [
+    "I walk up to the wall",
+    "hold the light",
+    "I hold the door shut while the others run",
+    "I raise my shield",
+    "I look for a person who can help",
+    "I light a fire in the hearth",
+])
+def test_partial_and_incidental_names_inject_nothing(index, text):
+    assert names(index, text) == []
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("I cast wall of fire across the bridge", ["Wall of Fire"]),
+    ("I cast light on my staff", ["Light"]),
+    ("I cast shield", ["Shield"]),
+    ("I attack the goblin with my longsword", ["Goblin", "Longsword"]),
+    ("I'm poisoned, can I still attack?", ["Poisoned"]),
+])
+def test_named_entries_are_found(index, text, expected):
+    assert sorted(names(index, text)) == sorted(expected)
+
+
+def test_plural_names_match(index):
+    assert sorted(names(index, "I cast hold person on one of the goblins")) == ["Goblin", "Hold Person"]
+
+
+def test_multi_word_spells_need_no_casting_words(index):
+    assert names(index, "What does fireball do to a wall of stone?") == ["Wall of Stone"]
+
+
+def test_context_stays_within_budget(index):
+    text, included = index.context_for("I cast fireball at the goblin", max_tokens=60)
+    assert included and text.startswith("Relevant rules (SRD):")
+    assert len(text) // 4 <= 60
+    assert index.context_for("I walk up to the wall", max_tokens=200) == (None, [])
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from search_index import SearchIndex
+
+SPELLS = [
+    ("fireball", "Fireball", 3, "evocation", ["sorcerer", "wizard"]),
+    ("fire-bolt", "Fire Bolt", 0, "evocation", ["sorcerer", "wizard"]),
+    ("fire-shield", "Fire Shield", 4, "evocation", ["wizard"]),
+    ("delayed-blast-fireball", "Delayed Blast Fireball", 7, "evocation", ["sorcerer", "wizard"]),
+    ("lightning-bolt", "Lightning Bolt", 3, "evocation", ["sorcerer", "wizard"]),
+    ("shield", "Shield", 1, "abjuration", ["sorcerer", "wizard"]),
+    ("cure-wounds", "Cure Wounds", 1, "evocation", ["cleric", "druid"]),
+]
+
+MONSTERS = [
+    ("goblin", "Goblin", 0.25, "humanoid", "Small"),
+    ("hobgoblin", "Hobgoblin", 0.5, "humanoid", "Medium"),
+    ("owlbear", "Owlbear", 3, "monstrosity", "Large"),
+    ("adult-red-dragon", "Adult Red Dragon", 17, "dragon", "Huge"),
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    index = SearchIndex()
+    for slug, name, level, school, classes in SPELLS:
+        index.add("spells", {"index": slug, "name": name, "url": f"/api/spells/{slug}"}, {
+            "level": level,
+            "school": {"index": school},
+            "classes": [{"index": c} for c in classes],
+        })
+    for slug, name, cr, kind, size in MONSTERS:
+        index.add("monsters", {"index": slug, "name": name, "url": f"/api/monsters/{slug}"}, {
+            "challenge_rating": cr,
+            "type": kind,
+            "size": size,
+        })
+    index.add("races", {"index": "elf", "name": "Elf", "url": "/api/races/elf"})
+    index.finalize()
+    return index
+
+
+def names(result):
+    return [record["name"] for record in result["results"]]
+
+
+def test_exact_match_outranks_prefix_and_word_matches(index):
+    assert names(index.search("fireball", fuzzy=False)) == ["Fireball", "Delayed Blast Fireball"]
+    assert names(index.search("fire", fuzzy=False)) == ["Fire Bolt", "Fire Shield", "Fireball", "Delayed Blast Fireball"]
+
+
+def test_word_prefix_matches_any_word_of_the_name(index):
+    assert names(index.search("bolt", fuzzy=False)) == ["Fire Bolt", "Lightning Bolt"]
+    assert names(index.search("drag", fuzzy=False)) == ["Adult Red Dragon"]
+
+
+@pytest.mark.parametrize("typo, expected", [
+    ("firebal", "Fireball"),
+    ("fierball", "Fireball"),
+    ("owlbaer", "Owlbear"),
+    ("goblim", "Goblin"),
+    ("lightening bolt", "Lightning Bolt"),
+])
+def test_typos_still_find_the_entry(index, typo, expected):
+    assert names(index.search(typo))[0] == expected
+
+
+def test_fuzzy_matches_rank_below_prefix_matches(index):
+    results = names(index.search("goblin"))
+    assert results[0] == "Goblin"
+    assert "Hobgoblin" in results[1:]
+
+
+def test_unrelated_queries_and_disabled_fuzzy_find_nothing(index):
+    assert index.search("xylophone")["total"] == 0
+    assert index.search("fierball", fuzzy=False)["total"] == 0
+
+
+def test_filters_narrow_the_results(index):
+    assert names(index.search("fire", category="spells", filters={"level": 3})) == ["Fireball"]
+    assert names(index.search(category="spells", filters={"school": "Abjuration"})) == ["Shield"]
+    assert names(index.search(category="spells", filters={"class": "cleric"})) == ["Cure Wounds"]
+    assert names(index.search(category="monsters", min_cr=0.5, max_cr=3)) == ["Hobgoblin", "Owlbear"]
+    assert names(index.search("shield", category="monsters")) == []
+
+
+def test_results_are_paged(index):
+    first = index.search("fire", fuzzy=False, limit=2)
+    second = index.search("fire", fuzzy=False, limit=2, offset=2)
+    assert first["total"] == second["total"] == 4
+    assert names(first) + names(second) == names(index.search("fire", fuzzy=False))
+
+
+class StubSRD:
+    """Serves the listings, and details for spells only; monsters fail upstream."""
+
+    async def _make_request(self, endpoint):
+        if endpoint == "monsters":
+            raise Exception("D&D API request failed with status 503")
+        return {"results": [{"index": s[0], "name": s[1], "url": f"/api/{endpoint}/{s[0]}"} for s in SPELLS]}
+
+    async def fetch_many(self, endpoints):
+        return {endpoint: {"level": 3} for endpoint in endpoints if endpoint.endswith("fireball")}
+
+
+def test_build_skips_unavailable_categories():
+    index = asyncio.run(SearchIndex.build(StubSRD(), categories=["spells", "monsters"]))
+    assert len(index) == len(SPELLS)
+    assert names(index.search(filters={"level": 3})) == ["Delayed Blast Fireball", "Fireball"]
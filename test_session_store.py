@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import pytest
+
+from session_store import SessionNotFoundError, SessionStore
+from shared_store import SharedStore
+
+
+@pytest.fixture(params=["memory", "shared"])
+def make_store(request, tmp_path, monkeypatch):
+    # Without a store SessionStore falls back to DM_SHARED_STATE
+    monkeypatch.delenv("DM_SHARED_STATE", raising=False)
+
+    def make(**kwargs):
+        store = SharedStore(str(tmp_path / "shared.db")) if request.param == "shared" else None
+        return SessionStore(store=store, **kwargs)
+    return make
+
+
+def test_ids_are_generated_by_the_server(make_store):
+    async def run():
+        sessions = make_store()
+        first, second = await sessions.create(), await sessions.create()
+        assert first["id"] != second["id"]
+        assert await sessions.get("client-chosen-id") is None
+
+    asyncio.run(run())
+
+
+def test_append_to_deleted_session_raises_not_found(make_store):
+    async def run():
+        sessions = make_store()
+        session_id = (await sessions.create())["id"]
+        assert await sessions.delete(session_id)
+        with pytest.raises(SessionNotFoundError):
+            await sessions.append(session_id, "player", "I open the door")
+        with pytest.raises(SessionNotFoundError):
+            await sessions.context(session_id)
+
+    asyncio.run(run())
+
+
+def test_least_recently_active_sessions_are_evicted(make_store):
+    async def run():
+        sessions = make_store(max_sessions=2)
+        oldest = (await sessions.create())["id"]
+        time.sleep(0.01)
+        active = (await sessions.create())["id"]
+        time.sleep(0.01)
+        await sessions.append(oldest, "player", "still here")
+        time.sleep(0.01)
+        await sessions.create()
+        assert await sessions.count() == 2
+        assert await sessions.get(oldest) is not None
+        assert await sessions.get(active) is None
+
+    asyncio.run(run())
+
+
+def test_idle_sessions_expire(make_store):
+    async def run():
+        sessions = make_store(idle_ttl=0.05)
+        session_id = (await sessions.create())["id"]
+        await sessions.append(session_id, "player", "hello")
+        assert await sessions.get(session_id) is not None
+        await asyncio.sleep(0.1)
+        assert await sessions.get(session_id) is None
+        with pytest.raises(SessionNotFoundError):
+            await sessions.append(session_id, "dm", "too late")
+
+    asyncio.run(run())
+
+
+def test_workers_sharing_a_store_see_each_others_messages(tmp_path):
+    async def run():
+        store = SharedStore(str(tmp_path / "shared.db"))
+        first, second = SessionStore(store=store), SessionStore(store=store)
+        session_id = (await first.create())["id"]
+        await first.append(session_id, "player", "I open the door")
+        assert [m["content"] for m in (await second.get(session_id))["messages"]] == ["I open the door"]
+        await second.append(session_id, "dm", "It creaks open.")
+        await first.append(session_id, "player", "I step inside")
+        assert [m["content"] for m in (await second.get(session_id))["messages"]] == [
+            "I open the door", "It creaks open.", "I step inside"
+        ]
+        assert (await first.get(session_id))["messages"] == (await second.get(session_id))["messages"]
+        return store, session_id
+
+    store, session_id = asyncio.run(run())
+    # Messages are rows of their own; the session record doesn't grow with them
+    assert "messages" not in store.get("sessions", session_id)
+    assert len(store.log("sessions", session_id)) == 3
+
+
+def test_compaction_folds_old_messages_into_the_summary(make_store):
+    async def summarize(summary, messages):
+        return summary + "".join(m["content"][0] for m in messages)
+
+    async def run():
+        sessions = make_store(keep_recent=2, compact_threshold=4)
+        session_id = (await sessions.create())["id"]
+        for content in ["a", "b", "c", "d", "e", "f"]:
+            await sessions.append(session_id, "player", content)
+        await sessions.compact(session_id, summarize)
+        return await sessions.context(session_id)
+
+    summary, recent = asyncio.run(run())
+    assert summary == "abcd"
+    assert [m["content"] for m in recent] == ["e", "f"]
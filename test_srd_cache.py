@@ -0,0 +1,180 @@
+import asyncio
+import time
+
+import pytest
+
+from dnd_integration import DnDIntegration
+from srd_cache import SRDCache
+
+
+@pytest.fixture(autouse=True)
+def local_cache(monkeypatch):
+    # Keep the SRD cache on local disk even if DM_SHARED_STATE is set
+    monkeypatch.delenv("DM_SHARED_STATE", raising=False)
+    monkeypatch.delenv("SRD_SNAPSHOT_PATH", raising=False)
+
+
+def make_cache(tmp_path, **kwargs):
+    return SRDCache(cache_dir=str(tmp_path / "srd"), ttl=100, stale_ttl=1000, offline=False, **kwargs)
+
+
+async def aged(cache, key, seconds):
+    """Store an entry that was fetched `seconds` ago."""
+    entry = await cache.set(key, {"index": key}, etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    entry["fetched_at"] = time.time() - seconds
+    cache._write_disk(key, entry)
+    return entry
+
+
+def test_entries_age_from_fresh_to_stale_to_expired(tmp_path):
+    async def run():
+        cache = make_cache(tmp_path)
+        await aged(cache, "spells/light", 10)
+        await aged(cache, "spells/fly", 500)
+        await aged(cache, "spells/sleep", 5000)
+        return [(await cache.lookup(key))[1] for key in ("spells/light", "spells/fly", "spells/sleep", "spells/wish")]
+
+    assert asyncio.run(run()) == ["fresh", "stale", "expired", None]
+
+
+def test_entries_survive_in_the_disk_tier(tmp_path):
+    async def run():
+        await aged(make_cache(tmp_path), "spells/light", 10)
+        cache = make_cache(tmp_path)
+        entry, state = await cache.lookup("spells/light")
+        return cache, entry, state
+
+    cache, entry, state = asyncio.run(run())
+    assert state == "fresh"
+    assert entry["data"] == {"index": "spells/light"}
+    assert cache.stats["disk_hits"] == 1 and cache.stats["memory_hits"] == 0
+
+
+def test_offline_cache_serves_entries_of_any_age(tmp_path):
+    async def run():
+        cache = make_cache(tmp_path)
+        await aged(cache, "spells/sleep", 5000)
+        cache.offline = True
+        return (await cache.lookup("spells/sleep"))[1]
+
+    assert asyncio.run(run()) == "fresh"
+
+
+def test_memory_tier_is_bounded(tmp_path):
+    async def run():
+        cache = make_cache(tmp_path, max_entries=2)
+        for key in ("spells/light", "spells/fly", "spells/sleep"):
+            await cache.set(key, {"index": key})
+        await cache.lookup("spells/light")
+        return cache
+
+    cache = asyncio.run(run())
+    assert list(cache._memory) == ["spells/sleep", "spells/light"]
+    assert cache.stats["disk_hits"] == 1
+
+
+class FakeResponse:
+    def __init__(self, status, data=None, headers=None):
+        self.status = status
+        self.data = data
+        self.headers = headers or {}
+
+    async def json(self):
+        return self.data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """Answers every GET with the next canned response, recording request headers."""
+
+    closed = False
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def close(self):
+        self.closed = True
+
+    def get(self, url, headers=None):
+        self.requests.append((url, headers))
+        return self.responses.pop(0)
+
+
+def make_api(tmp_path, *responses):
+    api = DnDIntegration(cache=make_cache(tmp_path))
+    api.session = FakeSession(*responses)
+    return api
+
+
+def test_not_modified_refreshes_the_expired_entry(tmp_path):
+    async def run():
+        api = make_api(tmp_path, FakeResponse(304))
+        requests = api.session.requests
+        await aged(api.cache, "spells/sleep", 5000)
+        data = await api._make_request("spells/sleep")
+        entry, state = await api.cache.lookup("spells/sleep")
+        await api.close()
+        return api, requests, data, state
+
+    api, requests, data, state = asyncio.run(run())
+    assert data == {"index": "spells/sleep"}
+    assert state == "fresh"
+    assert requests[0][1] == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+    assert api.cache.stats["revalidated"] == 1
+
+
+def test_changed_entry_is_replaced(tmp_path):
+    async def run():
+        api = make_api(tmp_path, FakeResponse(200, {"index": "spells/sleep", "level": 1}, {"ETag": '"v2"'}))
+        await aged(api.cache, "spells/sleep", 5000)
+        data = await api._make_request("spells/sleep")
+        entry, _ = await api.cache.lookup("spells/sleep")
+        await api.close()
+        return api, data, entry
+
+    api, data, entry = asyncio.run(run())
+    assert data == {"index": "spells/sleep", "level": 1}
+    assert entry["etag"] == '"v2"'
+    assert api.cache.stats["refreshed"] == 1
+
+
+def test_stale_entry_is_served_and_revalidated_in_the_background(tmp_path):
+    async def run():
+        api = make_api(tmp_path, FakeResponse(304))
+        await aged(api.cache, "spells/fly", 500)
+        data = await api._make_request("spells/fly")
+        assert len(api._revalidations) == 1
+        await asyncio.gather(*api._revalidations)
+        await asyncio.sleep(0)
+        entry, state = await api.cache.lookup("spells/fly")
+        await api.close()
+        return api, data, state
+
+    api, data, state = asyncio.run(run())
+    assert data == {"index": "spells/fly"}
+    assert state == "fresh"
+    assert api.cache.stats["stale_served"] == 1 and api.cache.stats["revalidated"] == 1
+    # Finished revalidations are dropped
+    assert api._revalidations == set()
+
+
+def test_upstream_errors_fall_back_to_the_expired_entry(tmp_path):
+    async def run():
+        api = make_api(tmp_path, FakeResponse(503))
+        await aged(api.cache, "spells/sleep", 5000)
+        data = await api._make_request("spells/sleep")
+        await api.close()
+        return api, data
+
+    api, data = asyncio.run(run())
+    assert data == {"index": "spells/sleep"}
+    assert api.cache.stats["errors"] == 1